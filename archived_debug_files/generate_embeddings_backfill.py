@@ -3,10 +3,11 @@
 SCRIPT DE BACKFILL - Gerar embeddings para vídeos existentes
 
 Busca todos os bookmarks sem embedding e gera em lote.
-Processa 10 vídeos por vez para evitar rate limits.
+Usa a API em lote do Gemini (até 100 textos por chamada) e grava
+cada lote com uma única RPC (bulk_update_embeddings).
 
 Uso:
-    python generate_embeddings_backfill.py [--limit N] [--dry-run]
+    python generate_embeddings_backfill.py [--limit N] [--batch-size N] [--dry-run]
 
 Exemplos:
     python generate_embeddings_backfill.py                # Processar todos
@@ -22,9 +23,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from supabase import create_client, Client
-from services.embedding_service import embedding_service
+from services.embedding_batcher import EmbeddingBatcher
+import logging
 import time
 
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+
 # Cores para output
 class Colors:
     GREEN = '\033[92m'
@@ -37,6 +41,7 @@ class Colors:
 def main():
     parser = argparse.ArgumentParser(description='Gerar embeddings para vídeos existentes')
     parser.add_argument('--limit', type=int, help='Número máximo de vídeos a processar')
+    parser.add_argument('--batch-size', type=int, default=100, help='Textos por chamada da API (máx 100)')
     parser.add_argument('--dry-run', action='store_true', help='Simular sem salvar no banco')
     args = parser.parse_args()
 
@@ -50,80 +55,33 @@ def main():
 
     supabase: Client = create_client(supabase_url, supabase_key)
 
-    # Buscar vídeos sem embedding
-    print(f"{Colors.BLUE}🔍 Buscando vídeos sem embedding...{Colors.RESET}")
-
-    query = supabase.table('bookmarks').select('id, smart_title, auto_tags, auto_categories').is_('embedding', 'null')
-
-    if args.limit:
-        query = query.limit(args.limit)
-
-    response = query.execute()
-    videos = response.data
-
-    if not videos:
-        print(f"{Colors.GREEN}✅ Todos os vídeos já têm embedding!{Colors.RESET}")
-        return
-
-    total = len(videos)
-    print(f"{Colors.YELLOW}📊 Encontrados {total} vídeos sem embedding{Colors.RESET}\n")
+    print(f"{Colors.BLUE}🔍 Gerando embeddings para vídeos sem embedding (lotes de {args.batch_size})...{Colors.RESET}\n")
 
     if args.dry_run:
         print(f"{Colors.YELLOW}🔸 MODO DRY-RUN - Nenhuma alteração será salva{Colors.RESET}\n")
 
-    # Processar em lote (10 por vez para evitar rate limits)
-    BATCH_SIZE = 10
-    success_count = 0
-    error_count = 0
-
-    for i, video in enumerate(videos):
-        video_id = video['id']
-        smart_title = (video.get('smart_title') or 'Sem título')[:60]
+    started = time.time()
 
-        print(f"[{i+1}/{total}] {smart_title}... ", end='', flush=True)
+    # flush_interval=0: backfill enche os lotes sozinho, sem timer
+    batcher = EmbeddingBatcher(
+        supabase,
+        max_batch_size=args.batch_size,
+        flush_interval=0,
+        dry_run=args.dry_run
+    )
+    stats = batcher.backfill(limit=args.limit)
 
-        try:
-            # Buscar dados completos do vídeo
-            full_video = supabase.table('bookmarks').select(
-                'smart_title, auto_tags, auto_categories, video_transcript, visual_analysis'
-            ).eq('id', video_id).single().execute()
+    elapsed = time.time() - started
 
-            if not full_video.data:
-                print(f"{Colors.RED}❌ Não encontrado{Colors.RESET}")
-                error_count += 1
-                continue
-
-            # Gerar embedding
-            embedding = embedding_service.generate_from_bookmark_dict(full_video.data)
-
-            if not embedding:
-                print(f"{Colors.RED}❌ Falha ao gerar{Colors.RESET}")
-                error_count += 1
-                continue
-
-            # Salvar no banco (se não for dry-run)
-            if not args.dry_run:
-                supabase.table('bookmarks').update({
-                    'embedding': embedding
-                }).eq('id', video_id).execute()
-
-            print(f"{Colors.GREEN}✅ ({len(embedding)}D){Colors.RESET}")
-            success_count += 1
-
-            # Rate limit: aguardar 1s a cada 10 vídeos
-            if (i + 1) % BATCH_SIZE == 0 and (i + 1) < total:
-                print(f"{Colors.YELLOW}⏸️  Aguardando 2s (rate limit)...{Colors.RESET}")
-                time.sleep(2)
-
-        except Exception as e:
-            print(f"{Colors.RED}❌ Erro: {str(e)[:50]}{Colors.RESET}")
-            error_count += 1
+    if stats['submitted'] == 0 and stats['failed'] == 0:
+        print(f"{Colors.GREEN}✅ Todos os vídeos já têm embedding!{Colors.RESET}")
+        return
 
     # Resumo final
     print(f"\n{Colors.BLUE}{'='*60}{Colors.RESET}")
-    print(f"{Colors.GREEN}✅ Sucesso: {success_count}/{total}{Colors.RESET}")
-    if error_count > 0:
-        print(f"{Colors.RED}❌ Erros: {error_count}/{total}{Colors.RESET}")
+    print(f"{Colors.GREEN}✅ Sucesso: {stats['written']} ({stats['batches']} lotes, {elapsed:.1f}s){Colors.RESET}")
+    if stats['failed'] > 0:
+        print(f"{Colors.RED}❌ Erros: {stats['failed']}{Colors.RESET}")
 
     if args.dry_run:
         print(f"{Colors.YELLOW}🔸 Modo dry-run - Nenhuma alteração foi salva{Colors.RESET}")
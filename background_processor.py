@@ -17,9 +17,16 @@ from services.claude_service import claude_service
 from services.gemini_service import GeminiService
 from services.video_storage_service import VideoStorageService
 from services.thumbnail_service import ThumbnailService
+from services.executor_service import execute_async
+from services.pipeline_dag import PipelineDAG
+from services.url_canonicalizer import canonical_key
+from services.blob_storage_service import blob_url_key
 
 logger = logging.getLogger(__name__)
 
+# Qualidade pedida ao Apify para o vídeo salvo na cloud (vai na url_key do blob)
+DOWNLOAD_QUALITY = "480p"
+
 # Supabase client (inicializar primeiro)
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -47,11 +54,13 @@ async def process_bookmark_background(
 
     Fluxo:
     1. Atualiza status: processing
-    2. Extrai metadados (Apify)
-    3. Analisa vídeo (Gemini Flash 2.5) - OPCIONAL
-    4. Processa com IA (Claude)
-    5. Atualiza Supabase com tudo
-    6. Status final: completed ou failed
+    2. Executa o DAG de etapas (independentes rodam em paralelo):
+       - Extrai metadados (Apify)
+       - Upload da thumbnail || download do vídeo
+       - Upload para cloud || análise Gemini Flash 2.5 do arquivo local - OPCIONAL
+       - Processa com IA (Claude) após metadados + Gemini
+    3. Atualiza Supabase com tudo
+    4. Status final: completed ou failed
     """
     try:
         logger.info(f"🚀 INICIANDO processamento - Bookmark: {bookmark_id}")
@@ -59,20 +68,32 @@ async def process_bookmark_background(
         # ============================================================
         # PASSO 1: Atualizar status → processing
         # ============================================================
-        supabase.table('bookmarks').update({
+        await execute_async(supabase.table('bookmarks').update({
             'processing_status': 'processing',
             'processing_started_at': 'now()',
             'error_message': None
-        }).eq('id', bookmark_id).execute()
+        }).eq('id', bookmark_id))
 
         logger.info(f"✅ Status atualizado: processing")
 
         # ============================================================
-        # PASSO 2: Extrair metadados (Apify)
+        # PASSO 2: Pipeline em DAG (etapas independentes em paralelo)
+        #
+        #   metadata ─┬─> thumbnail  (fallback de frame aguarda download)
+        #             ├─> download_url ─> download ─┬─> cloud_upload (streaming
+        #             │                             │   se não há arquivo local)
+        #             │                             └─> gemini ──┐
+        #             └─────────────────────────────────────────> ai
         # ============================================================
-        metadata = None
-        apify_raw_response = None  # Resposta bruta do Apify para debug
-        if extract_metadata:
+        dag = PipelineDAG(f"bookmark {bookmark_id[:8]}")
+
+        async def stage_metadata(results):
+            """Extrair metadados (Apify)"""
+            metadata = None
+            apify_raw_response = None  # Resposta bruta do Apify para debug
+            if not extract_metadata:
+                return {'metadata': None, 'apify_raw_response': None}
+
             logger.info(f"📥 Extraindo metadados via Apify...")
 
             try:
@@ -115,118 +136,200 @@ async def process_bookmark_background(
                 apify_raw_response = {"fallback": True, "reason": "exception", "error": str(e)}
                 # Não bloqueia - continua sem metadados
 
-        # ============================================================
-        # PASSO 3: Upload vídeo + Análise Gemini Flash 2.5
-        # ============================================================
-        gemini_analysis = None
-        cloud_video_url = None
-        temp_video_path = None
-
-        if upload_to_cloud and metadata:
-            try:
-                # 3.1: Extrair URL direta do vídeo (Apify)
-                logger.info(f"📥 Extraindo URL direta do vídeo...")
-
-                # Detectar plataforma e extrair URL de download
-                download_info = None
-                if 'instagram' in url.lower():
-                    download_info = await apify_service.extract_video_download_url_instagram(url)
-                elif 'tiktok' in url.lower():
-                    download_info = await apify_service.extract_video_download_url_tiktok(url)
-                elif 'youtube' in url.lower() or 'youtu.be' in url.lower():
-                    download_info = await apify_service.extract_video_download_url_youtube(url)
-
-                if download_info and download_info.get('download_url'):
-                    video_download_url = download_info['download_url']
-                    logger.info(f"✅ URL direta obtida: {video_download_url[:50]}...")
-
-                    # 3.2: Download + Upload para Supabase Storage
-                    logger.info(f"☁️ Baixando e fazendo upload para Supabase Storage...")
-
-                    upload_result = await video_storage_service.download_and_upload_video(
-                        video_url=video_download_url,
-                        user_id=user_id,
-                        bookmark_id=bookmark_id
-                    )
-
-                    if upload_result:
-                        cloud_video_url, temp_video_path = upload_result
-                        logger.info(f"✅ Vídeo na cloud: {cloud_video_url[:50]}...")
-
-                        # 3.3: Análise Gemini usando vídeo da cloud
-                        if analyze_video:
-                            logger.info(f"🎬 Analisando vídeo com Gemini Flash 2.5...")
-
-                            try:
-                                gemini_analysis = await gemini_service.analyze_video(
-                                    video_url=cloud_video_url,
-                                    user_context=user_context
-                                )
-                                logger.info(f"✅ Análise Gemini completa!")
-                                logger.info(f"   Transcrição: {len(gemini_analysis.get('transcript', ''))} caracteres")
-                                logger.info(f"   Análise Visual: {len(gemini_analysis.get('visual_analysis', ''))} caracteres")
-                            except Exception as e:
-                                logger.error(f"❌ Erro ao analisar com Gemini: {str(e)}")
-                                # Gemini falhou mas vídeo já está na cloud (continua)
-                    else:
-                        logger.warning(f"⚠️ Upload para cloud falhou")
-                else:
-                    logger.warning(f"⚠️ Não foi possível extrair URL de download")
+            return {'metadata': metadata, 'apify_raw_response': apify_raw_response}
+
+        async def stage_download_url(results):
+            """Extrair URL direta do vídeo (Apify)"""
+            if not (upload_to_cloud and results['metadata']['metadata']):
+                return None
+
+            logger.info(f"📥 Extraindo URL direta do vídeo...")
+
+            # Detectar plataforma e extrair URL de download
+            download_info = None
+            if 'instagram' in url.lower():
+                download_info = await apify_service.extract_video_download_url_instagram(url, quality=DOWNLOAD_QUALITY)
+            elif 'tiktok' in url.lower():
+                download_info = await apify_service.extract_video_download_url_tiktok(url, quality=DOWNLOAD_QUALITY)
+            elif 'youtube' in url.lower() or 'youtu.be' in url.lower():
+                download_info = await apify_service.extract_video_download_url_youtube(url, quality=DOWNLOAD_QUALITY)
+
+            if not download_info or not download_info.get('download_url'):
+                logger.warning(f"⚠️ Não foi possível extrair URL de download")
+                return None
+
+            logger.info(f"✅ URL direta obtida: {download_info['download_url'][:50]}...")
+            return download_info['download_url']
+
+        async def stage_download(results):
+            """Baixar vídeo para arquivo local - só se o Gemini precisa do arquivo"""
+            if not (analyze_video and results['download_url']):
+                return None
+            return await video_storage_service.download_video(results['download_url'])
+
+        async def stage_cloud_upload(results):
+            """Upload para Supabase Storage (em paralelo com Gemini)"""
+            if results['download']:
+                logger.info(f"☁️ Fazendo upload para Supabase Storage...")
+                cloud_video_url = await video_storage_service.upload_video_file(
+                    results['download'], user_id, bookmark_id, url_key=blob_url_key(canonical_key(url), DOWNLOAD_QUALITY)
+                )
+            elif results['download_url']:
+                # Sem arquivo local: streaming direto, sem passar por /tmp
+                cloud_video_url = await video_storage_service.stream_upload_video(
+                    results['download_url'], user_id, bookmark_id, url_key=blob_url_key(canonical_key(url), DOWNLOAD_QUALITY)
+                )
+            else:
+                return None
+
+            if cloud_video_url:
+                logger.info(f"✅ Vídeo na cloud: {cloud_video_url[:50]}...")
+            else:
+                logger.warning(f"⚠️ Upload para cloud falhou")
+            return cloud_video_url
+
+        async def stage_gemini(results):
+            """Análise Gemini Flash 2.5 do arquivo local (não espera o upload)"""
+            if not (analyze_video and results['download']):
+                return None
+
+            logger.info(f"🎬 Analisando vídeo com Gemini Flash 2.5...")
+            gemini_analysis = await gemini_service.analyze_video(
+                video_url=results['download'],
+                user_context=user_context,
+                url_key=canonical_key(url)
+            )
+            if gemini_analysis:
+                logger.info(f"✅ Análise Gemini completa!")
+                logger.info(f"   Transcrição: {len(gemini_analysis.get('transcript', ''))} caracteres")
+                logger.info(f"   Análise Visual: {len(gemini_analysis.get('visual_analysis', ''))} caracteres")
+            return gemini_analysis
+
+        async def stage_ai(results):
+            """Processar com IA (Gemini 3 Pro) - tags, categorias, descrição, smart_title"""
+            metadata = results['metadata']['metadata']
+            if not (process_ai and metadata):
+                return None
 
-            except Exception as e:
-                logger.error(f"❌ Erro no fluxo de upload/análise: {str(e)}")
-                # Não bloqueia - continua sem vídeo na cloud
-
-        # ============================================================
-        # PASSO 4: Processar com IA (Claude)
-        # ============================================================
-        auto_description = None
-        auto_tags = []
-        auto_categories = []
-        smart_title = None
-        confidence = None
-        relevance_score = None
-
-        if process_ai and metadata:
             logger.info(f"🤖 Processando com Claude API...")
+            gemini_analysis = results['gemini']
+
+            # Se tem análise Gemini, usa método com Gemini
+            if gemini_analysis:
+                result = await claude_service.process_metadata_with_gemini(
+                    title=metadata.get('title', ''),
+                    description=metadata.get('description', ''),
+                    hashtags=metadata.get('hashtags', []),
+                    top_comments=metadata.get('top_comments', []),
+                    gemini_analysis=gemini_analysis,
+                    user_context=user_context
+                )
+            else:
+                # Método tradicional (sem Gemini)
+                result = await claude_service.process_metadata_auto(
+                    title=metadata.get('title', ''),
+                    description=metadata.get('description', ''),
+                    hashtags=metadata.get('hashtags', []),
+                    top_comments=metadata.get('top_comments', []),
+                    user_context=user_context
+                )
+
+            logger.info(f"✅ Claude processou: {len(result.get('auto_tags', []))} tags, {len(result.get('auto_categories', []))} categorias")
+            if result.get('smart_title'):
+                logger.info(f"✅ Smart title gerado: {result['smart_title'][:60]}")
+            return result
+
+        async def frame_fallback() -> Optional[str]:
+            """Extrai frame do vídeo como thumbnail (arquivo local se houver, senão URL direta)"""
+            temp_video_path = await dag.wait('download')
+            if not (temp_video_path and os.path.exists(temp_video_path)):
+                # ffmpeg lê só o trecho necessário da URL remota
+                temp_video_path = await dag.wait('download_url')
+            if not temp_video_path:
+                logger.error(f"❌ [{bookmark_id[:8]}] Sem vídeo para fallback de frame")
+                return None
+
+            logger.warning(f"🎬 [{bookmark_id[:8]}] Tentando fallback: extrair frame do vídeo...")
+            cloud_thumbnail_url = await thumbnail_service.extract_frame_as_thumbnail(
+                video_path=temp_video_path,
+                user_id=user_id,
+                bookmark_id=bookmark_id,
+                timestamp_seconds=2.0  # Segundo 2 para evitar fades
+            )
+            if cloud_thumbnail_url:
+                logger.info(f"✅ [{bookmark_id[:8]}] Thumbnail via FRAME FALLBACK")
+            return cloud_thumbnail_url
+
+        async def stage_thumbnail(results):
+            """Upload da thumbnail para Supabase Storage (em paralelo com download/análise)"""
+            metadata = results['metadata']['metadata']
+            instagram_thumbnail_url = metadata.get('thumbnail_url') if metadata else None
+            if not instagram_thumbnail_url:
+                return None
 
             try:
-                # Se tem análise Gemini, usa método com Gemini
-                if gemini_analysis:
-                    result = await claude_service.process_metadata_with_gemini(
-                        title=metadata.get('title', ''),
-                        description=metadata.get('description', ''),
-                        hashtags=metadata.get('hashtags', []),
-                        top_comments=metadata.get('top_comments', []),
-                        gemini_analysis=gemini_analysis,
-                        user_context=user_context
-                    )
-                else:
-                    # Método tradicional (sem Gemini)
-                    result = await claude_service.process_metadata_auto(
-                        title=metadata.get('title', ''),
-                        description=metadata.get('description', ''),
-                        hashtags=metadata.get('hashtags', []),
-                        top_comments=metadata.get('top_comments', []),
-                        user_context=user_context
-                    )
-
-                auto_description = result.get('auto_description')
-                auto_tags = result.get('auto_tags', [])
-                auto_categories = result.get('auto_categories', [])
-                smart_title = result.get('smart_title')  # 🆕 Smart title já vem no JSON do Gemini!
-                confidence = result.get('confidence')
-                relevance_score = result.get('relevance_score')
-
-                logger.info(f"✅ Claude processou: {len(auto_tags)} tags, {len(auto_categories)} categorias")
-                if smart_title:
-                    logger.info(f"✅ Smart title gerado: {smart_title[:60]}")
+                logger.info(f"📸 [{bookmark_id[:8]}] Upload thumbnail: {instagram_thumbnail_url[:60]}...")
+
+                cloud_thumbnail_url = await thumbnail_service.upload_thumbnail(
+                    thumbnail_url=instagram_thumbnail_url,
+                    user_id=user_id,
+                    bookmark_id=bookmark_id
+                )
+                if cloud_thumbnail_url:
+                    logger.info(f"✅ [{bookmark_id[:8]}] Thumbnail salva no Supabase Storage")
+                    return cloud_thumbnail_url
+
+                # Retry final com delay maior (worker pode estar inicializando)
+                logger.warning(f"⚠️ [{bookmark_id[:8]}] Primeiro upload falhou, aguardando 5s para retry final...")
+                await asyncio.sleep(5)
+
+                cloud_thumbnail_url = await thumbnail_service.upload_thumbnail(
+                    thumbnail_url=instagram_thumbnail_url,
+                    user_id=user_id,
+                    bookmark_id=bookmark_id
+                )
+                if cloud_thumbnail_url:
+                    logger.info(f"✅ [{bookmark_id[:8]}] Thumbnail salva no RETRY FINAL")
+                    return cloud_thumbnail_url
+
+                # FALLBACK: Extrair frame do vídeo como thumbnail
+                cloud_thumbnail_url = await frame_fallback()
+                if not cloud_thumbnail_url:
+                    logger.error(f"❌ [{bookmark_id[:8]}] Thumbnail falhou em TODAS as tentativas")
+                return cloud_thumbnail_url
+
             except Exception as e:
-                logger.error(f"❌ Erro ao processar com Claude: {str(e)}")
-                # Não bloqueia - continua sem IA
+                # Fallback de frame se tiver vídeo local
+                logger.error(f"❌ [{bookmark_id[:8]}] Erro no upload thumbnail: {str(e)[:80]}")
+                return await frame_fallback()
+
+        dag.add('metadata', stage_metadata)
+        dag.add('thumbnail', stage_thumbnail, deps=['metadata'])
+        dag.add('download_url', stage_download_url, deps=['metadata'])
+        dag.add('download', stage_download, deps=['download_url'])
+        dag.add('cloud_upload', stage_cloud_upload, deps=['download_url', 'download'])
+        dag.add('gemini', stage_gemini, deps=['download'])
+        dag.add('ai', stage_ai, deps=['metadata', 'gemini'])
+
+        results = await dag.run()
+
+        metadata = results['metadata']['metadata'] if results['metadata'] else None
+        apify_raw_response = results['metadata']['apify_raw_response'] if results['metadata'] else None
+        temp_video_path = results['download']
+        cloud_video_url = results['cloud_upload']
+        gemini_analysis = results['gemini']
+        cloud_thumbnail_url = results['thumbnail']
+
+        ai_result = results['ai'] or {}
+        auto_description = ai_result.get('auto_description')
+        auto_tags = ai_result.get('auto_tags', [])
+        auto_categories = ai_result.get('auto_categories', [])
+        smart_title = ai_result.get('smart_title')  # 🆕 Smart title já vem no JSON do Gemini!
+        confidence = ai_result.get('confidence')
+        relevance_score = ai_result.get('relevance_score')
 
         # ============================================================
-        # PASSO 5: Atualizar Supabase com TUDO
+        # PASSO 3: Atualizar Supabase com TUDO
         # ============================================================
         logger.info(f"💾 Salvando tudo no Supabase...")
 
@@ -254,83 +357,11 @@ async def process_bookmark_background(
             if published_at and published_at != '':
                 update_data['published_at'] = published_at
 
-            # 🔍 LOG CRÍTICO: Verificar metadata ANTES de salvar
-            logger.info(f"🔍 [BACKGROUND_PROCESSOR] METADATA ANTES DE UPLOAD:")
-            logger.info(f"   metadata['thumbnail_url']: {metadata.get('thumbnail_url', 'NULL')[:80] if metadata.get('thumbnail_url') else 'NULL'}...")
-            logger.info(f"   metadata dict completo: {str(metadata)[:200]}...")
-
-            # Upload da thumbnail para Supabase Storage (com retry automático)
-            instagram_thumbnail_url = metadata.get('thumbnail_url')
-            if instagram_thumbnail_url:
-                try:
-                    logger.info(f"📸 [{bookmark_id[:8]}] Upload thumbnail: {instagram_thumbnail_url[:60]}...")
-
-                    cloud_thumbnail_url = await thumbnail_service.upload_thumbnail(
-                        thumbnail_url=instagram_thumbnail_url,
-                        user_id=user_id,
-                        bookmark_id=bookmark_id
-                    )
-
-                    if cloud_thumbnail_url:
-                        update_data['cloud_thumbnail_url'] = cloud_thumbnail_url
-                        logger.info(f"✅ [{bookmark_id[:8]}] Thumbnail salva no Supabase Storage")
-                    else:
-                        # Retry final com delay maior (worker pode estar inicializando)
-                        logger.warning(f"⚠️ [{bookmark_id[:8]}] Primeiro upload falhou, aguardando 5s para retry final...")
-                        await asyncio.sleep(5)
-
-                        try:
-                            cloud_thumbnail_url = await thumbnail_service.upload_thumbnail(
-                                thumbnail_url=instagram_thumbnail_url,
-                                user_id=user_id,
-                                bookmark_id=bookmark_id
-                            )
-                            if cloud_thumbnail_url:
-                                update_data['cloud_thumbnail_url'] = cloud_thumbnail_url
-                                logger.info(f"✅ [{bookmark_id[:8]}] Thumbnail salva no RETRY FINAL")
-                            else:
-                                # FALLBACK: Extrair frame do vídeo como thumbnail
-                                if temp_video_path and os.path.exists(temp_video_path):
-                                    logger.warning(f"🎬 [{bookmark_id[:8]}] Tentando fallback: extrair frame do vídeo...")
-                                    cloud_thumbnail_url = await thumbnail_service.extract_frame_as_thumbnail(
-                                        video_path=temp_video_path,
-                                        user_id=user_id,
-                                        bookmark_id=bookmark_id,
-                                        timestamp_seconds=2.0  # Segundo 2 para evitar fades
-                                    )
-                                    if cloud_thumbnail_url:
-                                        update_data['cloud_thumbnail_url'] = cloud_thumbnail_url
-                                        logger.info(f"✅ [{bookmark_id[:8]}] Thumbnail via FRAME FALLBACK")
-                                    else:
-                                        logger.error(f"❌ [{bookmark_id[:8]}] Thumbnail falhou em TODAS as tentativas")
-                                else:
-                                    logger.error(f"❌ [{bookmark_id[:8]}] Sem vídeo local para fallback de frame")
-                        except Exception as retry_error:
-                            logger.error(f"❌ [{bookmark_id[:8]}] Erro no retry final: {str(retry_error)[:80]}")
-                except Exception as e:
-                    # Fallback de frame se tiver vídeo local
-                    logger.error(f"❌ [{bookmark_id[:8]}] Erro no upload thumbnail: {str(e)[:80]}")
-                    if temp_video_path and os.path.exists(temp_video_path):
-                        logger.warning(f"🎬 [{bookmark_id[:8]}] Tentando fallback após exceção...")
-                        try:
-                            cloud_thumbnail_url = await thumbnail_service.extract_frame_as_thumbnail(
-                                video_path=temp_video_path,
-                                user_id=user_id,
-                                bookmark_id=bookmark_id,
-                                timestamp_seconds=2.0
-                            )
-                            if cloud_thumbnail_url:
-                                update_data['cloud_thumbnail_url'] = cloud_thumbnail_url
-                                logger.info(f"✅ [{bookmark_id[:8]}] Thumbnail via FRAME FALLBACK (após exceção)")
-                        except Exception as fallback_error:
-                            logger.error(f"❌ [{bookmark_id[:8]}] Fallback também falhou: {str(fallback_error)[:50]}")
-
-            # 🔍 LOG CRÍTICO: Verificar metadata DEPOIS de upload
-            logger.info(f"🔍 [BACKGROUND_PROCESSOR] METADATA DEPOIS DE UPLOAD:")
-            logger.info(f"   metadata['thumbnail_url']: {metadata.get('thumbnail_url', 'NULL')[:80] if metadata.get('thumbnail_url') else 'NULL'}...")
-
-            # AGORA adiciona metadata ao update_data (DEPOIS de logs)
+            if cloud_thumbnail_url:
+                update_data['cloud_thumbnail_url'] = cloud_thumbnail_url
+
             update_data['metadata'] = metadata  # JSON completo com TODOS os campos
+            update_data['url_key'] = canonical_key(url)  # Reuso de metadados entre usuários
 
             # 🔍 LOG CRÍTICO: Verificar o que vai ser salvo
             logger.info(f"💾 [BACKGROUND_PROCESSOR] DADOS QUE SERÃO SALVOS:")
@@ -369,7 +400,7 @@ async def process_bookmark_background(
             update_data['smart_title'] = smart_title
 
         # UPDATE no Supabase
-        supabase.table('bookmarks').update(update_data).eq('id', bookmark_id).execute()
+        await execute_async(supabase.table('bookmarks').update(update_data).eq('id', bookmark_id))
 
         # Limpar arquivo temporário (libera espaço no Render)
         if temp_video_path:
@@ -387,10 +418,10 @@ async def process_bookmark_background(
 
         # Atualizar status: failed
         try:
-            supabase.table('bookmarks').update({
+            await execute_async(supabase.table('bookmarks').update({
                 'processing_status': 'failed',
                 'processing_completed_at': 'now()',
                 'error_message': str(e)[:500]  # Limita tamanho do erro
-            }).eq('id', bookmark_id).execute()
+            }).eq('id', bookmark_id))
         except Exception as update_error:
             logger.error(f"❌ Erro ao atualizar status failed: {str(update_error)}")
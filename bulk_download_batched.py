@@ -13,7 +13,6 @@ from pathlib import Path
 from typing import List, Dict, Optional
 from supabase import create_client, Client
 from tqdm.asyncio import tqdm
-from apify_client import ApifyClient
 import argparse
 
 # Configurações
@@ -43,9 +42,12 @@ class BatchDownloadManager:
         self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
         self.session: Optional[aiohttp.ClientSession] = None
 
-        # Cria clientes Apify
-        self.apify_clients = [ApifyClient(token) for token in apify_tokens]
-        self.current_client_index = 0
+        # ApifyService lê os tokens do ambiente (pool de tokens + modo batch)
+        os.environ["APIFY_TOKEN"] = ",".join(apify_tokens)
+        os.environ["APIFY_BATCH_SIZE"] = str(batch_size)
+        sys.path.insert(0, str(Path(__file__).parent))
+        from services.apify_service import ApifyService
+        self.apify_service = ApifyService()
 
     async def __aenter__(self):
         self.session = aiohttp.ClientSession()
@@ -55,12 +57,6 @@ class BatchDownloadManager:
         if self.session:
             await self.session.close()
 
-    def _get_next_apify_client(self) -> ApifyClient:
-        """Rotaciona entre clientes Apify"""
-        client = self.apify_clients[self.current_client_index]
-        self.current_client_index = (self.current_client_index + 1) % len(self.apify_clients)
-        return client
-
     async def get_pending_bookmarks(self) -> List[Dict]:
         """Busca bookmarks sem vídeo baixado"""
         print(f"\n🔍 Buscando bookmarks sem vídeo para user: {self.user_id[:8]}...")
@@ -211,6 +207,15 @@ class BatchDownloadManager:
 
             return False
 
+    async def extract_download_urls(self, bookmarks: List[Dict]) -> Dict[str, str]:
+        """Extrai URLs de download em batch (1 actor run por batch_size URLs)"""
+        print(f"\n📦 Extraindo URLs de download em batches de {self.batch_size}...")
+        results = await self.apify_service.extract_download_urls_batch(
+            [b['url'] for b in bookmarks],
+            quality=self.quality
+        )
+        return {url: info['download_url'] for url, info in results.items() if info.get('download_url')}
+
     async def process_downloads(self, bookmarks: List[Dict], url_mapping: Dict[str, str]):
         """Processa downloads em paralelo (após extração em batch)"""
         with tqdm(total=len(bookmarks), desc="📥 Downloads", unit="vídeo") as pbar:
@@ -219,13 +224,8 @@ class BatchDownloadManager:
 
             async def download_with_semaphore(bookmark):
                 async with semaphore:
-                    bookmark_url = bookmark['url']
-
-                    # Normalizar URL: Instagram usa /reel/ e /p/ para o mesmo conteúdo
-                    # Apify sempre retorna /p/, então normalizamos os bookmarks também
-                    normalized_url = bookmark_url.replace('/reel/', '/p/')
-
-                    download_url = url_mapping.get(normalized_url)
+                    # extract_download_urls_batch já casa /reel/ e /p/ pelo shortcode
+                    download_url = url_mapping.get(bookmark['url'])
 
                     if not download_url:
                         stats['failed'] += 1
@@ -251,6 +251,8 @@ async def main():
     parser.add_argument('--batch-size', type=int, default=10, help='URLs por batch Apify (padrão: 10)')
     parser.add_argument('--quality', default='720p', choices=['480p', '720p', '1080p'], help='Qualidade do vídeo')
     parser.add_argument('--limit', type=int, help='Limitar número de downloads (para teste)')
+    parser.add_argument('--mode', default='batch', choices=['batch', 'backend'],
+                        help='batch: Apify em lote + upload direto | backend: /api/process-to-supabase por vídeo (com FFmpeg)')
 
     args = parser.parse_args()
 
@@ -265,6 +267,7 @@ async def main():
     print(f"   Batch Size: {args.batch_size} URLs/batch")
     print(f"   Paralelismo Downloads: {args.parallel} simultâneos")
     print(f"   Qualidade: {args.quality}")
+    print(f"   Modo: {args.mode}")
 
     start_time = datetime.now()
 
@@ -281,14 +284,24 @@ async def main():
             bookmarks = bookmarks[:args.limit]
             print(f"⚠️  Limitado a {args.limit} vídeos (modo teste)\n")
 
-        # Processamento via backend (Apify + Transcode + Upload)
-        print("\n" + "=" * 80)
-        print("BACKEND → SUPABASE (Apify + FFmpeg + Upload)".center(80))
-        print("=" * 80)
+        if args.mode == 'batch':
+            # Apify em lote (1 actor run por batch) → download + upload em paralelo
+            url_mapping = await manager.extract_download_urls(bookmarks)
+
+            print("\n" + "=" * 80)
+            print(f"DOWNLOAD → SUPABASE ({len(url_mapping)}/{len(bookmarks)} URLs extraídas)".center(80))
+            print("=" * 80)
+
+            await manager.process_downloads(bookmarks, url_mapping)
+        else:
+            # Processamento via backend (Apify + Transcode + Upload)
+            print("\n" + "=" * 80)
+            print("BACKEND → SUPABASE (Apify + FFmpeg + Upload)".center(80))
+            print("=" * 80)
 
-        # Progress bar unificada
-        with tqdm(total=len(bookmarks), desc="📥 Processando", unit="vídeo") as pbar:
-            await manager.process_via_backend(bookmarks, pbar)
+            # Progress bar unificada
+            with tqdm(total=len(bookmarks), desc="📥 Processando", unit="vídeo") as pbar:
+                await manager.process_via_backend(bookmarks, pbar)
 
     # Estatísticas finais
     duration = datetime.now() - start_time
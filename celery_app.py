@@ -12,9 +12,17 @@ load_dotenv()
 # Redis URL (local: redis://localhost:6379/0, produção: env var)
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+# Concurrency dos workers (ajustável sem mexer no processo web)
+# Render Free: 512MB RAM = 2 workers
+WORKER_CONCURRENCY = int(os.getenv("CELERY_WORKER_CONCURRENCY", "2"))
+
+# Tempo que uma task entregue pode ficar sem ack antes de ser re-entregue
+# (broker Redis). Precisa ser maior que o task_time_limit mais longo.
+VISIBILITY_TIMEOUT = int(os.getenv("CELERY_VISIBILITY_TIMEOUT", "3600"))
+
 # FORÇAR concurrency via env var (override qualquer outra config)
 # Se houver CELERYD_CONCURRENCY no sistema, este valor sobrescreve
-os.environ['CELERYD_CONCURRENCY'] = '2'
+os.environ['CELERYD_CONCURRENCY'] = str(WORKER_CONCURRENCY)
 
 # Criar app Celery
 celery_app = Celery(
@@ -46,9 +54,12 @@ celery_app.conf.update(
     task_time_limit=600,
     task_soft_time_limit=540,  # Aviso 1 min antes do hard limit
 
+    # Durabilidade: tasks não-ackadas voltam para a fila após restart/OOM
+    broker_transport_options={"visibility_timeout": VISIBILITY_TIMEOUT},
+    result_backend_transport_options={"visibility_timeout": VISIBILITY_TIMEOUT},
+
     # Concorrência (quantos workers paralelos)
-    # Render Free: 512MB RAM = 2 workers (teste de performance)
-    worker_concurrency=2,
+    worker_concurrency=WORKER_CONCURRENCY,
     worker_prefetch_multiplier=1,  # Pega 1 task por vez (evita sobrecarga)
 
     # Logs
@@ -62,10 +73,20 @@ celery_app.conf.update(
             "task": "tasks.auto_sync_incomplete_bookmarks_task",
             "schedule": crontab(hour=3, minute=0),  # 3:00 AM todos os dias
         },
-        # Cleanup de arquivos temporários a cada 6 horas
+        # Rebuild do grafo de vizinhos (find-similar) às 4h da manhã
+        "rebuild-neighbor-graph": {
+            "task": "tasks.rebuild_neighbor_graph_task",
+            "schedule": crontab(hour=4, minute=0),
+        },
+        # GC de blobs de vídeo sem referência às 5h da manhã
+        "gc-video-blobs": {
+            "task": "tasks.gc_video_blobs_task",
+            "schedule": crontab(hour=5, minute=0),
+        },
+        # Janitor de arquivos temporários a cada 30 minutos
         "cleanup-temp-files": {
             "task": "tasks.cleanup_temp_files_task",
-            "schedule": crontab(minute=0, hour="*/6"),  # 0:00, 6:00, 12:00, 18:00
+            "schedule": crontab(minute="*/30"),
         },
     },
 )
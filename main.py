@@ -4,24 +4,40 @@ import os
 # IMPORTANTE: Carregar .env ANTES de importar os serviços
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form, BackgroundTasks
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
-import tempfile
+import re
 import logging
 from models import VideoMetadata, Platform
 from services.apify_service import ApifyService
+from services.metadata_cache import metadata_cache
+from services.url_canonicalizer import canonical_key
+from services.blob_storage_service import blob_storage_service, blob_url_key
+from services.download_service import download_service
+from services.http_client_pool import http_client_pool
+from services.temp_storage import temp_storage
+from services.process_pool import process_pool
+from services.range_response import RangeFileResponse
 from services.whisper_service import whisper_service
 from services.claude_service import claude_service
-from services.chat_service import chat_with_ai, find_similar_bookmarks
+from services.chat_service import chat_with_ai, find_similar_bookmarks, get_chat_stats
 from services.transcoding_service import TranscodingService
 from services.thumbnail_service import ThumbnailService
 from services.video_analysis_service import video_analysis_service
+from services.vector_index_service import vector_index_service
+from services.executor_service import executor_service, run_blocking, execute_async
 from supabase import create_client, Client
 
 # Background processor (FastAPI Background Tasks - substitui Celery)
 from background_processor import process_bookmark_background
+from celery_app import celery_app
+
+# Modo da fila de /api/process-bookmark-complete:
+# - "background": FastAPI BackgroundTasks no próprio processo web (sem persistência)
+# - "celery": fila durável no Redis (sobrevive a deploy/OOM, concorrência dos workers)
+BOOKMARK_QUEUE_MODE = os.getenv("BOOKMARK_QUEUE_MODE", "background").lower()
 
 # Configurar logging
 logging.basicConfig(level=logging.DEBUG)  # DEBUG temporário para diagnosticar fluxo Gemini→Claude
@@ -229,11 +245,12 @@ async def process_context(
                     error="Whisper API não configurada (OPENAI_API_KEY faltando)"
                 )
 
-            # Salvar arquivo temporário
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(audio_file.filename)[1]) as tmp_file:
-                content = await audio_file.read()
+            # Salvar arquivo temporário (diretório de job no temp_storage)
+            content = await audio_file.read()
+            audio_job = await temp_storage.ajob("audio", reserve_bytes=len(content))
+            tmp_path = audio_job.file("audio" + os.path.splitext(audio_file.filename)[1])
+            with open(tmp_path, "wb") as tmp_file:
                 tmp_file.write(content)
-                tmp_path = tmp_file.name
 
             try:
                 # Transcrever
@@ -249,8 +266,7 @@ async def process_context(
 
             finally:
                 # Limpar arquivo temporário
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
+                audio_job.cleanup()
 
         # Se não tem contexto (nem texto nem áudio), retornar erro
         if not context_text:
@@ -359,7 +375,7 @@ async def process_metadata_auto(request: ProcessMetadataAutoRequest):
         transcript_language = ""
         video_transcript_pt = None
         visual_analysis_pt = None
-        temp_video_file = None
+        temp_video_path = None
 
         # Análise multimodal (Whisper + GPT-4 Vision)
         video_path_for_analysis = None
@@ -369,23 +385,20 @@ async def process_metadata_auto(request: ProcessMetadataAutoRequest):
             # Baixa temporariamente da cloud
             logger.info(f"☁️ Baixando vídeo temporariamente da cloud: {request.cloud_video_url[:80]}...")
             try:
-                import httpx
-                import tempfile
-
-                async with httpx.AsyncClient(timeout=180.0) as client:
-                    response = await client.get(request.cloud_video_url)
-                    response.raise_for_status()
-                    video_data = response.content
+                video_job = await temp_storage.ajob("context-video")
+                temp_video_path = video_job.file("video.mp4")
 
-                temp_video_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-                temp_video_file.write(video_data)
-                temp_video_file.close()
+                size_bytes = await run_blocking(
+                    "download", download_service.download_to_file, request.cloud_video_url, temp_video_path
+                )
 
-                video_path_for_analysis = temp_video_file.name
-                size_mb = len(video_data) / (1024 * 1024)
+                video_path_for_analysis = temp_video_path
+                size_mb = size_bytes / (1024 * 1024)
                 logger.info(f"✅ Vídeo baixado temporariamente: {size_mb:.2f} MB")
             except Exception as e:
                 logger.error(f"❌ Erro ao baixar vídeo da cloud: {str(e)}")
+                temp_storage.release_path(temp_video_path)
+                temp_video_path = None
                 video_path_for_analysis = None
 
         if video_path_for_analysis and video_analysis_service.is_available():
@@ -407,9 +420,9 @@ async def process_metadata_auto(request: ProcessMetadataAutoRequest):
                 logger.warning("⚠️ Análise de vídeo falhou, continuando sem transcrição/visual")
 
             # Limpa arquivo temporário
-            if temp_video_file and os.path.exists(temp_video_file.name):
+            if temp_video_path:
                 try:
-                    os.unlink(temp_video_file.name)
+                    temp_storage.release_path(temp_video_path)
                     logger.info(f"🧹 Arquivo temporário removido")
                 except Exception as e:
                     logger.warning(f"⚠️ Não foi possível remover arquivo temporário: {e}")
@@ -470,6 +483,7 @@ class ChatRequest(BaseModel):
     message: str
     conversation_history: Optional[List[ChatMessage]] = None
     max_results: Optional[int] = 10
+    user_id: Optional[str] = None  # Habilita busca no índice vetorial local do usuário
 
 
 class ChatResponse(BaseModel):
@@ -508,7 +522,8 @@ async def chat(request: ChatRequest):
         result = await chat_with_ai(
             user_message=request.message,
             conversation_history=history,
-            max_bookmarks=request.max_results or 10
+            max_bookmarks=request.max_results or 10,
+            user_id=request.user_id
         )
 
         return ChatResponse(
@@ -536,21 +551,17 @@ async def transcribe_audio(audio_file: UploadFile = File(...)):
     try:
         logger.info(f"🎤 Transcrevendo áudio: {audio_file.filename}")
 
-        # Salva arquivo temporário
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".m4a") as temp_file:
-            content = await audio_file.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
+        # Salva arquivo temporário (diretório de job no temp_storage)
+        content = await audio_file.read()
+        with await temp_storage.ajob("audio", reserve_bytes=len(content)) as audio_job:
+            temp_path = audio_job.file("audio.m4a")
+            with open(temp_path, "wb") as temp_file:
+                temp_file.write(content)
 
-        # Transcreve com Whisper
-        from services.whisper_service import WhisperService
-        whisper = WhisperService()
-        transcription = await whisper.transcribe_audio(temp_path, language="pt")
-
-        # Remove arquivo temporário
-        import os
-        os.remove(temp_path)
+            # Transcreve com Whisper
+            from services.whisper_service import WhisperService
+            whisper = WhisperService()
+            transcription = await whisper.transcribe_audio(temp_path, language="pt")
 
         if transcription:
             logger.info(f"✅ Transcrição: {transcription[:100]}...")
@@ -602,29 +613,20 @@ async def analyze_video(request: AnalyzeVideoRequest):
                 detail="Serviço de análise multimodal não disponível (OPENAI_API_KEY não configurada)"
             )
 
-        # 1. Baixar vídeo temporariamente
+        # 1. Baixar vídeo direto para arquivo temporário (downloader compartilhado)
         logger.info(f"⬇️  Baixando vídeo da cloud...")
-        async with httpx.AsyncClient(timeout=180.0) as client:
-            response = await client.get(request.cloud_video_url)
-            response.raise_for_status()
-            video_data = response.content
-
-        # 2. Salvar em arquivo temporário
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_video:
-            temp_video.write(video_data)
-            temp_video_path = temp_video.name
-
-        logger.info(f"✅ Vídeo baixado: {len(video_data) / (1024 * 1024):.2f}MB")
+        with await temp_storage.ajob("analyze-video") as video_job:
+            temp_video_path = video_job.file("video.mp4")
+            size_bytes = await run_blocking(
+                "download", download_service.download_to_file, request.cloud_video_url, temp_video_path
+            )
 
-        # 3. Analisar vídeo (Whisper + GPT-4 Vision)
-        logger.info(f"🎤🖼️  Analisando com Whisper + GPT-4 Vision...")
-        analysis_result = await video_analysis_service.analyze_video(temp_video_path)
+            logger.info(f"✅ Vídeo baixado: {size_bytes / (1024 * 1024):.2f}MB")
 
-        # 4. Limpar arquivo temporário
-        try:
-            os.unlink(temp_video_path)
-        except:
-            pass
+            # 2. Analisar vídeo (Whisper + GPT-4 Vision)
+            logger.info(f"🎤🖼️  Analisando com Whisper + GPT-4 Vision...")
+            analysis_result = await video_analysis_service.analyze_video(temp_video_path)
+            # 3. Arquivo temporário é removido ao sair do job
 
         if not analysis_result:
             raise HTTPException(status_code=500, detail="Análise multimodal falhou")
@@ -749,7 +751,10 @@ async def extract_video_download_url(request: ExtractVideoUrlRequest):
                 # 2. Se transcode=True, transcodifica para H.264 Baseline (lento mas compatível)
                 if request.transcode:
                     logger.info(f"🎬 Transcodificação solicitada - garantindo compatibilidade...")
-                    transcode_result = await transcoding_service.transcode_video(video_data["download_url"])
+                    transcode_result = await transcoding_service.transcode_video(
+                        video_data["download_url"],
+                        url_key=f"{canonical_key(request.url)}@{request.quality}"
+                    )
 
                     if not transcode_result["success"]:
                         raise ValueError(f"Falha na transcodificação: {transcode_result.get('error')}")
@@ -803,7 +808,10 @@ async def extract_video_download_url(request: ExtractVideoUrlRequest):
                 # 2. Se transcode=True, transcodifica para H.264 Baseline (lento mas compatível)
                 if request.transcode:
                     logger.info(f"🎬 Transcodificação solicitada - garantindo compatibilidade...")
-                    transcode_result = await transcoding_service.transcode_video(video_data["download_url"])
+                    transcode_result = await transcoding_service.transcode_video(
+                        video_data["download_url"],
+                        url_key=f"{canonical_key(request.url)}@{request.quality}"
+                    )
 
                     if not transcode_result["success"]:
                         raise ValueError(f"Falha na transcodificação: {transcode_result.get('error')}")
@@ -915,23 +923,33 @@ async def transcode_video_endpoint(request: TranscodeVideoRequest):
         )
 
 
-@app.get("/api/download-transcoded/{video_id}")
-async def download_transcoded_video(video_id: str):
+@app.api_route("/api/download-transcoded/{video_id}", methods=["GET", "HEAD"])
+async def download_transcoded_video(video_id: str, request: Request):
     """
     Retorna vídeo transcodificado para download.
+
+    Suporta Range/If-Range (seek do player, retomada de download) e
+    If-None-Match (304). video_id é derivado do conteúdo, então o ETag é o
+    próprio id e o cliente pode cachear para sempre.
     """
     try:
-        from fastapi.responses import FileResponse
+        # Hash de conteúdo (ou uuid legado) - nada de path arbitrário
+        if not re.fullmatch(r"[0-9a-f-]{32,36}", video_id):
+            raise HTTPException(status_code=404, detail="Vídeo não encontrado")
 
         file_path = transcoding_service.get_video_path(video_id)
 
-        if not transcoding_service.video_exists(video_id):
+        # mark_used: existe + atualiza ordem do LRU
+        if not transcoding_service.mark_used(video_id):
             raise HTTPException(status_code=404, detail="Vídeo não encontrado")
 
-        return FileResponse(
-            path=file_path,
+        return RangeFileResponse(
+            request,
+            file_path,
+            etag=video_id,
             media_type="video/mp4",
             filename=f"{video_id}.mp4",
+            immutable=True,
         )
 
     except HTTPException:
@@ -954,6 +972,70 @@ async def get_transcoding_stats():
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 
+@app.get("/api/executor-stats")
+async def executor_stats():
+    """
+    Retorna métricas dos pools de threads por provedor (fila, espera, execução).
+    """
+    return executor_service.stats()
+
+
+@app.get("/api/apify-token-stats")
+async def apify_token_stats():
+    """
+    Retorna estado de saúde dos tokens Apify (esgotado até, taxa de erro, latência, em voo).
+    """
+    return await apify_service.token_pool.stats()
+
+
+@app.get("/api/metadata-cache-stats")
+async def metadata_cache_stats():
+    """
+    Retorna métricas do cache de metadados (hits L1/L2, misses, stale servidos, refreshes).
+    """
+    return metadata_cache.stats()
+
+
+@app.get("/api/download-stats")
+async def download_stats():
+    """
+    Retorna métricas do downloader compartilhado (downloads, retomadas via Range, segmentos paralelos, throughput).
+    """
+    return download_service.stats()
+
+
+@app.get("/api/http-client-stats")
+async def http_client_stats():
+    """
+    Retorna métricas de reuso de conexão dos clientes HTTP compartilhados (requisições, conexões/handshakes novos, HTTP/2).
+    """
+    return http_client_pool.stats()
+
+
+@app.get("/api/subprocess-stats")
+async def subprocess_stats():
+    """
+    Retorna métricas do pool de subprocessos ffmpeg/ffprobe/yt-dlp (slots de CPU, fila, espera e tempo de execução).
+    """
+    return process_pool.stats()
+
+
+@app.get("/api/temp-storage-stats")
+async def temp_storage_stats():
+    """
+    Retorna uso do armazenamento temporário (jobs ativos, reservado vs cota, disco livre, esperas/recusas, evicções do janitor).
+    """
+    return await run_blocking("default", temp_storage.stats)
+
+
+@app.get("/api/chat-stats")
+async def chat_stats():
+    """
+    Retorna métricas do cache de embeddings de queries (hits/misses) e do índice vetorial.
+    """
+    return get_chat_stats()
+
+
 class ProcessToSupabaseRequest(BaseModel):
     url: str
     user_id: str
@@ -983,7 +1065,6 @@ async def process_video_to_supabase(request: ProcessToSupabaseRequest):
 
     VANTAGEM: Vídeo NÃO trafega para o PC - tudo servidor→servidor
     """
-    import httpx
     from datetime import datetime
 
     try:
@@ -1009,26 +1090,29 @@ async def process_video_to_supabase(request: ProcessToSupabaseRequest):
         if thumbnail_url:
             try:
                 logger.info(f"📸 Baixando thumbnail...")
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    thumb_response = await client.get(thumbnail_url)
-                    thumb_response.raise_for_status()
-                    thumbnail_data = thumb_response.content
+                thumb_response = await http_client_pool.get("media").get(thumbnail_url, timeout=30.0)
+                thumb_response.raise_for_status()
+                thumbnail_data = thumb_response.content
 
                 # Upload thumbnail para Supabase Storage
                 thumbnail_storage_path = f"{request.user_id}/thumbnails/{request.bookmark_id}.jpg"
 
                 import io
-                supabase_client.storage.from_('user-videos').upload(
+                await run_blocking(
+                    "supabase",
+                    supabase_client.storage.from_('user-videos').upload,
                     thumbnail_storage_path,
                     io.BytesIO(thumbnail_data),
                     file_options={"content-type": "image/jpeg"}
                 )
 
                 # Gerar URL assinada para thumbnail
-                cloud_thumbnail_url = supabase_client.storage.from_('user-videos').create_signed_url(
+                cloud_thumbnail_url = (await run_blocking(
+                    "supabase",
+                    supabase_client.storage.from_('user-videos').create_signed_url,
                     thumbnail_storage_path,
                     expires_in=31536000  # 1 ano
-                )['signedURL']
+                ))['signedURL']
 
                 logger.info(f"✅ Thumbnail salva!")
             except Exception as thumb_error:
@@ -1037,7 +1121,9 @@ async def process_video_to_supabase(request: ProcessToSupabaseRequest):
 
         # 3. Transcodificar (baixa + FFmpeg)
         logger.info(f"🎬 Baixando e transcodificando...")
-        transcode_result = await transcoding_service.transcode_video(download_url)
+        transcode_result = await transcoding_service.transcode_video(
+            download_url, url_key=f"{canonical_key(request.url)}@{request.quality}"
+        )
 
         if not transcode_result["success"]:
             raise ValueError(f"Falha na transcodificação: {transcode_result.get('error')}")
@@ -1057,7 +1143,9 @@ async def process_video_to_supabase(request: ProcessToSupabaseRequest):
         if video_analysis_service.is_available():
             try:
                 logger.info(f"🎤🖼️  Analisando vídeo (áudio + visual)...")
-                video_analysis = await video_analysis_service.analyze_video(transcoded_path)
+                video_analysis = await video_analysis_service.analyze_video(
+                    transcoded_path, url_key=canonical_key(request.url)
+                )
 
                 if video_analysis:
                     video_transcript = video_analysis.get("transcript", "")
@@ -1079,25 +1167,20 @@ async def process_video_to_supabase(request: ProcessToSupabaseRequest):
         else:
             logger.info(f"⏭️  Análise multimodal desabilitada (OPENAI_API_KEY não configurada)")
 
-        # 4. Upload direto para Supabase Storage
+        # 4. Upload para Supabase Storage (deduplicado: blobs/{sha256}.mp4)
         logger.info(f"☁️  Fazendo upload para Supabase...")
 
-        storage_path = f"{request.user_id}/{request.bookmark_id}.mp4"
-
-        with open(transcoded_path, 'rb') as f:
-            supabase_client.storage.from_('user-videos').upload(
-                storage_path,
-                f,
-                file_options={"content-type": "video/mp4"}
-            )
-
-        # Gerar URL assinada
-        cloud_url = supabase_client.storage.from_('user-videos').create_signed_url(
-            storage_path,
-            expires_in=31536000  # 1 ano
-        )['signedURL']
+        blob = await run_blocking(
+            "storage",
+            blob_storage_service.store_file,
+            transcoded_path,
+            request.bookmark_id,
+            url_key=blob_url_key(canonical_key(request.url), request.quality, transcoded=True),
+            user_id=request.user_id
+        )
+        cloud_url = blob["cloud_url"]
 
-        logger.info(f"✅ Upload concluído!")
+        logger.info(f"✅ Upload concluído!{' (blob já existia)' if blob['deduplicated'] else ''}")
 
         # 4. Atualizar bookmark no Supabase
         update_data = {
@@ -1126,12 +1209,11 @@ async def process_video_to_supabase(request: ProcessToSupabaseRequest):
         if video_transcript or visual_analysis:
             update_data['analyzed_at'] = datetime.utcnow().isoformat()
 
-        supabase_client.table('bookmarks').update(update_data).eq('id', request.bookmark_id).execute()
+        await execute_async(supabase_client.table('bookmarks').update(update_data).eq('id', request.bookmark_id))
 
         logger.info(f"✅ Bookmark atualizado!")
 
-        # 5. Limpar arquivo transcodificado
-        os.unlink(transcoded_path)
+        # 5. Arquivo transcodificado fica no cache (evicção LRU pelo janitor do temp_storage)
 
         return ProcessToSupabaseResponse(
             success=True,
@@ -1213,6 +1295,11 @@ async def process_bookmark_complete(
     - bookmark_id: UUID do bookmark
     - estimated_time_seconds: Tempo estimado (60-150s)
 
+    **Modo de fila (BOOKMARK_QUEUE_MODE):**
+    - background (padrão): FastAPI BackgroundTasks no processo web
+    - celery: fila durável no Redis (workers separados, retry por etapa,
+      jobs sobrevivem a restart; job_id = id da task Celery)
+
     **Vantagens:**
     - ✅ Phone NÃO precisa ficar aberto
     - ✅ Simples (sem Redis/Celery)
@@ -1232,26 +1319,44 @@ async def process_bookmark_complete(
 
         # Atualizar status inicial no Supabase: queued
         try:
-            supabase_client.table('bookmarks').update({
+            await execute_async(supabase_client.table('bookmarks').update({
                 'processing_status': 'queued',
                 'error_message': None
-            }).eq('id', request.bookmark_id).execute()
+            }).eq('id', request.bookmark_id))
         except Exception as e:
             logger.warning(f"⚠️ Erro ao atualizar status inicial (bookmark pode não existir): {str(e)}")
             # Não bloqueia - background task vai criar/atualizar depois
 
-        # Adicionar task em background (FastAPI Background Tasks)
-        background_tasks.add_task(
-            process_bookmark_background,
-            bookmark_id=request.bookmark_id,
-            url=request.url,
-            user_id=request.user_id,
-            extract_metadata=request.extract_metadata,
-            analyze_video=request.analyze_video,
-            process_ai=request.process_ai,
-            upload_to_cloud=request.upload_to_cloud,
-            user_context=request.user_context
-        )
+        job_kwargs = {
+            'bookmark_id': request.bookmark_id,
+            'url': request.url,
+            'user_id': request.user_id,
+            'extract_metadata': request.extract_metadata,
+            'analyze_video': request.analyze_video,
+            'process_ai': request.process_ai,
+            'upload_to_cloud': request.upload_to_cloud,
+            'user_context': request.user_context,
+        }
+
+        job_id = None
+        if BOOKMARK_QUEUE_MODE == "celery":
+            # Fila durável: chain de tasks com retry por etapa (tasks.py)
+            try:
+                async_result = await run_blocking(
+                    "default",
+                    celery_app.send_task,
+                    "tasks.process_bookmark_complete_task",
+                    kwargs=job_kwargs
+                )
+                job_id = async_result.id
+                logger.info(f"📬 Job enfileirado no Celery - Bookmark: {request.bookmark_id}, Job: {job_id}")
+            except Exception as e:
+                # Broker fora do ar: processa no próprio processo em vez de perder o bookmark
+                logger.error(f"❌ Falha ao enfileirar no Celery ({str(e)}) - usando BackgroundTasks")
+
+        if job_id is None:
+            # Adicionar task em background (FastAPI Background Tasks)
+            background_tasks.add_task(process_bookmark_background, **job_kwargs)
 
         # Estimar tempo de processamento
         estimated_time = 60  # Base: 60s
@@ -1264,7 +1369,7 @@ async def process_bookmark_complete(
 
         return ProcessBookmarkCompleteResponse(
             success=True,
-            job_id=request.bookmark_id,  # Usa bookmark_id como job_id (não tem job_id separado)
+            job_id=job_id or request.bookmark_id,  # Sem Celery: usa bookmark_id como job_id
             bookmark_id=request.bookmark_id,
             estimated_time_seconds=estimated_time,
             message=f"Bookmark em processamento. Tempo estimado: {estimated_time}s"
@@ -1326,9 +1431,9 @@ async def process_idea_background(idea_id: str, audio_path: str, user_id: str):
         logger.info(f"🧠 INICIANDO processamento de ideia - ID: {idea_id}")
 
         # 1. Atualizar status → processing
-        supabase_client.table('ideas').update({
+        await execute_async(supabase_client.table('ideas').update({
             'status': 'processing'
-        }).eq('id', idea_id).execute()
+        }).eq('id', idea_id))
 
         # 2. Transcrever áudio com Whisper
         logger.info(f"🎤 Transcrevendo áudio da ideia...")
@@ -1342,7 +1447,7 @@ async def process_idea_background(idea_id: str, audio_path: str, user_id: str):
         # 3. Buscar projetos existentes do usuário para matching
         existing_projects = []
         try:
-            projects_result = supabase_client.table('bookmarks').select('projects').eq('user_id', user_id).not_.is_('projects', 'null').execute()
+            projects_result = await execute_async(supabase_client.table('bookmarks').select('projects').eq('user_id', user_id).not_.is_('projects', 'null'))
             if projects_result.data:
                 all_projects = set()
                 for row in projects_result.data:
@@ -1350,7 +1455,7 @@ async def process_idea_background(idea_id: str, audio_path: str, user_id: str):
                         for p in row['projects']:
                             all_projects.add(p)
                 # Também buscar projetos das ideas
-                ideas_result = supabase_client.table('ideas').select('project').eq('user_id', user_id).not_.is_('project', 'null').execute()
+                ideas_result = await execute_async(supabase_client.table('ideas').select('project').eq('user_id', user_id).not_.is_('project', 'null'))
                 if ideas_result.data:
                     for row in ideas_result.data:
                         if row.get('project'):
@@ -1480,28 +1585,27 @@ FORMATO DE RESPOSTA (JSON):
         if project:
             update_data['project'] = project
 
-        supabase_client.table('ideas').update(update_data).eq('id', idea_id).execute()
+        await execute_async(supabase_client.table('ideas').update(update_data).eq('id', idea_id))
 
         logger.info(f"✅ IDEIA PROCESSADA - ID: {idea_id}, Título: {title}")
 
         # 6. Enviar para separador-calls (organizar em pastas locais)
         try:
-            import httpx
-            async with httpx.AsyncClient() as http_client:
-                await http_client.post(
-                    "https://calls.beplus.community/api/idea",
-                    json={
-                        "type": "idea.processed",
-                        "title": title,
-                        "summary": summary,
-                        "transcription": transcription,
-                        "project": project,
-                        "tags": tags,
-                        "categories": categories,
-                        "note_type": note_type,
-                    },
-                    timeout=10
-                )
+            http_client = http_client_pool.get()
+            await http_client.post(
+                "https://calls.beplus.community/api/idea",
+                json={
+                    "type": "idea.processed",
+                    "title": title,
+                    "summary": summary,
+                    "transcription": transcription,
+                    "project": project,
+                    "tags": tags,
+                    "categories": categories,
+                    "note_type": note_type,
+                },
+                timeout=10
+            )
             logger.info("✅ Ideia enviada para separador-calls")
         except Exception as sc_error:
             logger.warning(f"⚠️ Falha ao enviar para separador-calls: {sc_error}")
@@ -1509,18 +1613,18 @@ FORMATO DE RESPOSTA (JSON):
     except Exception as e:
         logger.error(f"❌ ERRO processando ideia {idea_id}: {str(e)}", exc_info=True)
         try:
-            supabase_client.table('ideas').update({
+            await execute_async(supabase_client.table('ideas').update({
                 'status': 'failed',
                 'error_message': str(e)[:500],
                 'processed_at': 'now()',
-            }).eq('id', idea_id).execute()
+            }).eq('id', idea_id))
         except Exception as update_error:
             logger.error(f"❌ Erro ao atualizar status failed: {str(update_error)}")
     finally:
         # Limpar arquivo temporário
         try:
             if os.path.exists(audio_path):
-                os.remove(audio_path)
+                temp_storage.release_path(audio_path)
                 logger.debug(f"🗑️ Arquivo temporário removido: {audio_path}")
         except Exception:
             pass
@@ -1540,11 +1644,12 @@ async def process_idea(
     try:
         logger.info(f"🎤 Recebendo áudio de ideia: {audio_file.filename}, idea_id: {idea_id}")
 
-        # Salvar áudio temporário
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".m4a") as tmp_file:
-            content = await audio_file.read()
+        # Salvar áudio temporário (diretório de job, liberado pelo process_idea_background)
+        content = await audio_file.read()
+        idea_job = await temp_storage.ajob("idea-audio", reserve_bytes=len(content))
+        temp_path = idea_job.file("audio.m4a")
+        with open(temp_path, "wb") as tmp_file:
             tmp_file.write(content)
-            temp_path = tmp_file.name
 
         logger.info(f"📁 Áudio salvo: {temp_path} ({len(content)} bytes)")
 
@@ -1567,9 +1672,21 @@ async def process_idea(
         return {"success": False, "error": f"Erro ao processar ideia: {str(e)}"}
 
 
+@app.on_event("startup")
+async def startup_event():
+    # Recebe vetores novos gerados pelos workers Celery
+    await vector_index_service.start_listener()
+    # Limpeza periódica de temporários/transcodificados deste processo
+    await temp_storage.start_janitor()
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
+    await vector_index_service.stop_listener()
+    await temp_storage.stop_janitor()
     await apify_service.close()
+    await http_client_pool.aclose()
+    executor_service.shutdown()
 
 
 if __name__ == "__main__":
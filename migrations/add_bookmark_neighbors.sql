@@ -0,0 +1,23 @@
+-- Migration: Grafo de vizinhos pré-computado (/api/find-similar)
+-- Cada bookmark guarda os top-K bookmarks mais similares do MESMO usuário.
+-- Mantido pelo worker (update_bookmark_neighbors_task / rebuild_neighbor_graph_task).
+
+CREATE TABLE IF NOT EXISTS bookmark_neighbors (
+  bookmark_id uuid PRIMARY KEY REFERENCES bookmarks(id) ON DELETE CASCADE,
+  user_id uuid NOT NULL,
+  neighbors jsonb NOT NULL DEFAULT '[]'::jsonb,  -- [{"id": uuid, "similarity": float}, ...] ordenado
+  updated_at timestamp with time zone NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_bookmark_neighbors_user
+ON bookmark_neighbors (user_id);
+
+COMMENT ON TABLE bookmark_neighbors IS 'Top-K vizinhos por similaridade de embedding (mesmo usuário), recalculado incrementalmente';
+COMMENT ON COLUMN bookmark_neighbors.neighbors IS 'Lista ordenada [{id, similarity}] dos bookmarks mais similares';
+
+-- Workers usam service_role_key (bypassa RLS); leitura pelo app filtra por user_id
+ALTER TABLE bookmark_neighbors ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can read own bookmark neighbors"
+ON bookmark_neighbors FOR SELECT
+USING (auth.uid() = user_id);
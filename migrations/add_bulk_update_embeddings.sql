@@ -0,0 +1,24 @@
+-- Migration: Escrita em lote de embeddings
+-- Usada pelo EmbeddingBatcher (backfill e tasks em lote) para gravar centenas
+-- de vetores em uma única chamada, em vez de um UPDATE por bookmark.
+-- Upsert via PostgREST não serve aqui: o INSERT exigiria todas as colunas NOT NULL.
+
+CREATE OR REPLACE FUNCTION bulk_update_embeddings(updates jsonb)
+RETURNS integer
+LANGUAGE sql
+AS $$
+  WITH rows AS (
+    SELECT (item->>'id')::uuid AS id,
+           (item->>'embedding')::vector AS embedding
+    FROM jsonb_array_elements(updates) AS item
+  ), updated AS (
+    UPDATE bookmarks b
+    SET embedding = rows.embedding
+    FROM rows
+    WHERE b.id = rows.id
+    RETURNING b.id
+  )
+  SELECT count(*)::integer FROM updated;
+$$;
+
+COMMENT ON FUNCTION bulk_update_embeddings(jsonb) IS 'Grava vários embeddings de uma vez: [{"id": uuid, "embedding": "[...]"}]';
@@ -0,0 +1,30 @@
+-- Migration: Chave canônica da URL (services/url_canonicalizer.py)
+-- Mesma plataforma + id de conteúdo = mesma chave, independente de ?igsh=,
+-- /reel/ vs /p/, youtu.be vs watch?v=, barra final etc.
+-- Permite reaproveitar metadados já extraídos por OUTRO usuário (viral salvo
+-- por 50 pessoas = 1 scrape). Gravada pelo worker junto com os metadados.
+
+ALTER TABLE bookmarks
+ADD COLUMN IF NOT EXISTS url_key text;
+
+CREATE INDEX IF NOT EXISTS idx_bookmarks_url_key
+ON bookmarks (url_key)
+WHERE url_key IS NOT NULL;
+
+COMMENT ON COLUMN bookmarks.url_key IS 'Chave canônica do conteúdo (ex: instagram:<shortcode>, tiktok:<id>, youtube:<id>)';
+
+-- Backfill dos formatos principais (o resto é preenchido no próximo processamento)
+UPDATE bookmarks
+SET url_key = CASE
+  WHEN url ~ 'instagram\.com/([A-Za-z0-9_.]+/)?(p|reel|reels|tv)/[A-Za-z0-9_-]+'
+    THEN 'instagram:' || substring(url FROM 'instagram\.com/(?:[A-Za-z0-9_.]+/)?(?:p|reel|reels|tv)/([A-Za-z0-9_-]+)')
+  WHEN url ~ 'tiktok\.com/.*/video/[0-9]+'
+    THEN 'tiktok:' || substring(url FROM 'tiktok\.com/.*/video/([0-9]+)')
+  WHEN url ~ 'youtu\.be/[A-Za-z0-9_-]{11}'
+    THEN 'youtube:' || substring(url FROM 'youtu\.be/([A-Za-z0-9_-]{11})')
+  WHEN url ~ 'youtube\.com/.*[?&]v=[A-Za-z0-9_-]{11}'
+    THEN 'youtube:' || substring(url FROM '[?&]v=([A-Za-z0-9_-]{11})')
+  WHEN url ~ 'youtube\.com/(shorts|embed|live)/[A-Za-z0-9_-]{11}'
+    THEN 'youtube:' || substring(url FROM 'youtube\.com/(?:shorts|embed|live)/([A-Za-z0-9_-]{11})')
+END
+WHERE url_key IS NULL;
@@ -0,0 +1,19 @@
+-- Migration: Cache de análises de vídeo endereçado por conteúdo (services/analysis_cache.py)
+-- cache_key = "<modelo>@<versão do prompt>|sha256:<hash do vídeo>" ou "...|url:<chave canônica>"
+-- Reprocessamentos e o mesmo vídeo salvo por outro usuário reaproveitam a análise
+-- em vez de chamar o Replicate/OpenAI de novo.
+
+CREATE TABLE IF NOT EXISTS video_analysis_cache (
+  cache_key text PRIMARY KEY,
+  namespace text NOT NULL,  -- modelo + versão do prompt
+  result jsonb NOT NULL,    -- {transcript, visual_analysis, language, ...}
+  created_at timestamp with time zone NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_video_analysis_cache_namespace
+ON video_analysis_cache (namespace);
+
+COMMENT ON TABLE video_analysis_cache IS 'Análises multimodais (Gemini / Whisper + GPT-4o-mini) por hash do vídeo ou chave canônica da URL';
+
+-- Só o backend (service_role_key) lê e escreve
+ALTER TABLE video_analysis_cache ENABLE ROW LEVEL SECURITY;
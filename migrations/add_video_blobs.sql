@@ -0,0 +1,138 @@
+-- Migration: Storage de vídeos endereçado por conteúdo (services/blob_storage_service.py)
+-- Antes: cópia completa por bookmark em user-videos/{user_id}/{bookmark_id}.mp4,
+-- mesmo quando 50 usuários salvam o mesmo reel.
+-- Agora: um blob por conteúdo em user-videos/blobs/{sha256}.mp4; o bookmark
+-- guarda só a referência (video_blob_sha256). ref_count é mantido por trigger
+-- e blobs sem referência são apagados pelo GC (tasks.gc_video_blobs_task)
+-- depois de um período de carência.
+-- Idempotente: rodar de novo atualiza funções/trigger de uma versão anterior.
+
+CREATE TABLE IF NOT EXISTS video_blobs (
+  sha256 text PRIMARY KEY,
+  storage_path text NOT NULL,           -- blobs/{sha256}.mp4 no bucket user-videos
+  size_bytes bigint,
+  url_key text,                         -- URL canônica + qualidade + variante (blob_url_key; pula download)
+  ref_count integer NOT NULL DEFAULT 0,
+  created_at timestamp with time zone NOT NULL DEFAULT now(),
+  last_referenced_at timestamp with time zone NOT NULL DEFAULT now(),
+  gc_claimed_at timestamp with time zone  -- GC apagando o objeto (referências recusadas)
+);
+
+ALTER TABLE video_blobs
+ADD COLUMN IF NOT EXISTS gc_claimed_at timestamp with time zone;
+
+CREATE INDEX IF NOT EXISTS idx_video_blobs_url_key
+ON video_blobs (url_key)
+WHERE url_key IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_video_blobs_orphans
+ON video_blobs (last_referenced_at)
+WHERE ref_count <= 0;
+
+COMMENT ON TABLE video_blobs IS 'Vídeos deduplicados por SHA-256 (um objeto no storage por conteúdo)';
+
+-- Só o backend (service_role_key) lê e escreve
+ALTER TABLE video_blobs ENABLE ROW LEVEL SECURITY;
+
+ALTER TABLE bookmarks
+ADD COLUMN IF NOT EXISTS video_blob_sha256 text;
+
+CREATE INDEX IF NOT EXISTS idx_bookmarks_video_blob_sha256
+ON bookmarks (video_blob_sha256)
+WHERE video_blob_sha256 IS NOT NULL;
+
+COMMENT ON COLUMN bookmarks.video_blob_sha256 IS 'Blob do vídeo em video_blobs (storage: blobs/{sha256}.mp4)';
+
+-- Refcount: qualquer INSERT/UPDATE/DELETE em bookmarks que muda a referência
+-- ajusta o contador (inclusive deletes feitos fora do backend).
+-- SECURITY DEFINER: delete feito pelo cliente (JWT do usuário) roda o trigger
+-- como o usuário, e video_blobs tem RLS sem policies - o UPDATE não acharia
+-- a linha e o ref_count nunca cairia.
+CREATE OR REPLACE FUNCTION video_blob_refcount()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' AND OLD.video_blob_sha256 IS NOT DISTINCT FROM NEW.video_blob_sha256 THEN
+    RETURN NEW;
+  END IF;
+
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.video_blob_sha256 IS NOT NULL THEN
+    UPDATE video_blobs
+    SET ref_count = GREATEST(ref_count - 1, 0),
+        last_referenced_at = now()
+    WHERE sha256 = OLD.video_blob_sha256;
+  END IF;
+
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.video_blob_sha256 IS NOT NULL THEN
+    UPDATE video_blobs
+    SET ref_count = ref_count + 1,
+        last_referenced_at = now()
+    WHERE sha256 = NEW.video_blob_sha256;
+  END IF;
+
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS bookmarks_video_blob_refcount ON bookmarks;
+CREATE TRIGGER bookmarks_video_blob_refcount
+AFTER INSERT OR DELETE OR UPDATE OF video_blob_sha256 ON bookmarks
+FOR EACH ROW EXECUTE FUNCTION video_blob_refcount();
+
+-- Aponta o bookmark para um blob existente e devolve o storage_path. Trava a
+-- linha do blob, então não corre com o GC: se o GC apagou ou está apagando o
+-- objeto, retorna NULL (caller faz upload).
+DROP FUNCTION IF EXISTS reference_video_blob(uuid, text);
+CREATE OR REPLACE FUNCTION reference_video_blob(p_bookmark_id uuid, p_sha256 text)
+RETURNS text AS $$
+DECLARE
+  v_path text;
+BEGIN
+  SELECT storage_path INTO v_path
+  FROM video_blobs
+  WHERE sha256 = p_sha256 AND gc_claimed_at IS NULL
+  FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN NULL;
+  END IF;
+
+  UPDATE bookmarks SET video_blob_sha256 = p_sha256 WHERE id = p_bookmark_id;
+  RETURN v_path;
+END;
+$$ LANGUAGE plpgsql;
+
+-- GC em duas fases, objeto antes da linha:
+-- 1. claim_orphan_video_blobs marca (gc_claimed_at) e devolve blobs sem
+--    referência há mais de p_grace_hours; a partir daí reference_video_blob
+--    recusa o blob e um re-upload do mesmo conteúdo vai para um path novo
+-- 2. O backend apaga os objetos do storage
+-- 3. finish_video_blob_gc apaga as linhas que continuam marcadas e sem
+--    referência (re-upload no meio limpa a marca e a linha fica)
+-- Marca com mais de 1 hora (GC morreu no meio) pode ser reivindicada de novo.
+CREATE OR REPLACE FUNCTION claim_orphan_video_blobs(p_grace_hours integer, p_limit integer)
+RETURNS TABLE (blob_sha256 text, blob_path text) AS $$
+  UPDATE video_blobs b
+  SET gc_claimed_at = now()
+  WHERE b.sha256 IN (
+    SELECT v.sha256 FROM video_blobs v
+    WHERE v.ref_count <= 0
+      AND v.last_referenced_at < now() - make_interval(hours => p_grace_hours)
+      AND (v.gc_claimed_at IS NULL OR v.gc_claimed_at < now() - interval '1 hour')
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  AND b.ref_count <= 0
+  RETURNING b.sha256, b.storage_path;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION finish_video_blob_gc(p_sha256s text[])
+RETURNS SETOF text AS $$
+  DELETE FROM video_blobs
+  WHERE sha256 = ANY(p_sha256s)
+    AND gc_claimed_at IS NOT NULL
+    AND ref_count <= 0
+  RETURNING sha256;
+$$ LANGUAGE sql;
@@ -0,0 +1,135 @@
+"""
+Cache de análises de vídeo endereçado por conteúdo.
+
+Análise multimodal (Gemini via Replicate, Whisper + GPT-4o-mini) é a etapa
+mais cara do pipeline e rodava de novo a cada reprocessamento - mesmo quando
+o MESMO vídeo já estava analisado no bookmark de outro usuário.
+
+Chave = namespace (modelo + versão do prompt) + conteúdo:
+- sha256:<hash dos bytes do vídeo baixado>  (arquivo local)
+- url:<chave canônica>                       (ex: instagram:<shortcode>, quando
+                                              só há URL remota ou como 2ª chave)
+
+Resultado gravado sob todas as chaves conhecidas, então um reprocessamento
+que só tem a URL da cloud acha a análise feita a partir do arquivo local.
+Mudar o prompt = subir PROMPT_VERSION no serviço = cache novo. Entrada do
+usuário que entra no prompt (ex: contexto pessoal no Gemini) também vai no
+namespace (hash), então só análises sem entrada pessoal são compartilhadas.
+
+Níveis: LRU no processo + tabela video_analysis_cache no Supabase
+(durável, compartilhada entre web e workers). Falhas viram miss.
+"""
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from services.executor_service import execute_async, run_blocking
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_LOCAL_SIZE", "256"))
+ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() != "false"
+TABLE = "video_analysis_cache"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_content_hash(path: str) -> str:
+    """SHA-256 dos bytes do arquivo (bloqueante - rodar via run_blocking)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self):
+        self._local: "OrderedDict[str, Dict]" = OrderedDict()
+        self._supabase = None
+        self.stats = {"hits_local": 0, "hits_db": 0, "misses": 0, "stored": 0, "errors": 0}
+
+    def _get_supabase(self):
+        if self._supabase is None:
+            supabase_url = os.getenv("SUPABASE_URL")
+            supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+            if not supabase_url or not supabase_key:
+                return None
+            from supabase import create_client
+            self._supabase = create_client(supabase_url, supabase_key)
+        return self._supabase
+
+    async def content_keys(self, video: Optional[str], url_key: Optional[str] = None) -> List[str]:
+        """Chaves de conteúdo para um vídeo (arquivo local e/ou chave canônica da URL)"""
+        keys = []
+        if video and os.path.isfile(video):
+            try:
+                keys.append(f"sha256:{await run_blocking('default', file_content_hash, video)}")
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao calcular hash do vídeo: {str(e)}")
+        if url_key:
+            keys.append(f"url:{url_key}")
+        return keys
+
+    def _remember(self, key: str, result: Dict):
+        self._local[key] = result
+        self._local.move_to_end(key)
+        while len(self._local) > LOCAL_CACHE_SIZE:
+            self._local.popitem(last=False)
+
+    async def get(self, namespace: str, keys: List[str]) -> Optional[Dict]:
+        """Primeira análise encontrada para qualquer uma das chaves"""
+        if not ENABLED or not keys:
+            return None
+
+        full_keys = [f"{namespace}|{key}" for key in keys]
+        for full_key in full_keys:
+            if full_key in self._local:
+                self._local.move_to_end(full_key)
+                self.stats["hits_local"] += 1
+                return self._local[full_key]
+
+        supabase = self._get_supabase()
+        if supabase is not None:
+            try:
+                response = await execute_async(
+                    supabase.table(TABLE).select('cache_key, result').in_('cache_key', full_keys).limit(1)
+                )
+                if response.data:
+                    row = response.data[0]
+                    self.stats["hits_db"] += 1
+                    self._remember(row['cache_key'], row['result'])
+                    return row['result']
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.warning(f"⚠️ Leitura do cache de análises falhou: {str(e)[:100]}")
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, namespace: str, keys: List[str], result: Dict):
+        """Grava a análise sob todas as chaves de conteúdo"""
+        if not ENABLED or not keys or not result:
+            return
+
+        full_keys = [f"{namespace}|{key}" for key in keys]
+        for full_key in full_keys:
+            self._remember(full_key, result)
+
+        supabase = self._get_supabase()
+        if supabase is None:
+            return
+        try:
+            await execute_async(supabase.table(TABLE).upsert([
+                {"cache_key": full_key, "namespace": namespace, "result": result}
+                for full_key in full_keys
+            ], on_conflict='cache_key'))
+            self.stats["stored"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"⚠️ Gravação no cache de análises falhou: {str(e)[:100]}")
+
+
+# Singleton instance
+analysis_cache = AnalysisCache()
@@ -1,14 +1,28 @@
 import os
 import json
+import time
 import asyncio
 import redis.asyncio as redis
-from typing import List, Optional
+from typing import Dict, List, Optional
 from apify_client import ApifyClient
 from models import VideoMetadata, Comment, Platform
-import httpx
 import re
-from urllib.parse import urlparse, parse_qs
+from datetime import datetime, timedelta
 from services.storage_service import storage_service
+from services.executor_service import run_blocking, execute_async
+from services.http_client_pool import http_client_pool
+from services.process_pool import process_pool, PRIORITY_INTERACTIVE
+from services.temp_storage import temp_storage
+from services.apify_token_pool import ApifyTokenPool, is_token_failure
+from services.single_flight import single_flight
+from services.url_canonicalizer import canonicalize, canonical_key
+from services.metadata_cache import metadata_cache, STALE, STALE_COUNTS, PAID_COUNTS_TTL_SECONDS
+
+# Idade máxima de metadados reaproveitados de outro bookmark (mesmo TTL do cache Redis)
+SHARED_METADATA_MAX_AGE_HOURS = 168
+
+# URLs por actor run no modo batch (bulk_download_batched.py mediu ~8x mais rápido com 10)
+APIFY_BATCH_SIZE = int(os.getenv("APIFY_BATCH_SIZE", "10"))
 
 
 class ApifyService:
@@ -41,74 +55,89 @@ class ApifyService:
 
         # Cria clientes para cada token
         self.clients = [ApifyClient(token) for token in self.apify_tokens] if self.apify_tokens else []
-        self._current_client_index = 0
+        # Estado de saúde por token (esgotado, erros, latência, em voo) compartilhado via Redis
+        self.token_pool = ApifyTokenPool(self.apify_tokens, self.redis_url)
 
         # Mantém compatibilidade com código antigo
         self.apify_token = self.apify_tokens[0] if self.apify_tokens else None
         self.client = self.clients[0] if self.clients else None
 
         self.redis_client = None
+        self._supabase = None  # Lazy: busca de metadados já extraídos por outros usuários
 
         # Armazena última resposta bruta do Apify para debug
         self.last_raw_response = None
 
-    def _get_next_client(self) -> ApifyClient:
-        """Rotaciona entre os clientes Apify (round-robin)"""
-        if not self.clients:
-            raise ValueError("Nenhum APIFY_TOKEN configurado")
-
-        client = self.clients[self._current_client_index]
-        # Print ANTES de incrementar para mostrar o índice correto
-        print(f"🔄 Usando Apify token #{self._current_client_index + 1}/{len(self.clients)}")
-
-        self._current_client_index = (self._current_client_index + 1) % len(self.clients)
-        return client
-
     async def _try_all_clients(self, operation_func, operation_name: str = "operação"):
         """
-        Tenta executar uma operação com todos os clientes Apify até conseguir.
-        Se um token atingir o limite mensal, tenta automaticamente o próximo.
+        Executa uma operação escolhendo o token Apify menos carregado entre os saudáveis.
+        Se um token atingir o limite mensal, ele é marcado como esgotado até o
+        reset do billing (para todos os processos) e o próximo melhor é tentado.
 
         Args:
-            operation_func: Função async que recebe ApifyClient e retorna o resultado
+            operation_func: Função que recebe ApifyClient e retorna o resultado
+                (síncrona roda no pool 'apify'; async é aguardada direto)
             operation_name: Nome da operação para logs
 
         Returns:
             Resultado da operação bem-sucedida
 
         Raises:
-            ValueError: Se TODOS os tokens falharem
+            ValueError: Se TODOS os tokens estiverem esgotados
         """
         if not self.clients:
             raise ValueError("Nenhum APIFY_TOKEN configurado")
 
         last_error = None
-        attempts = len(self.clients)  # Tenta todos os tokens disponíveis
-
-        for attempt in range(attempts):
+        tried = set()
+
+        while True:
+            index = await self.token_pool.acquire(exclude=tried)
+            if index is None:
+                break
+            tried.add(index)
+            client = self.clients[index]
+            print(f"🔄 Usando Apify token #{index + 1}/{len(self.clients)} para {operation_name}")
+
+            started = time.monotonic()
+            released = False
             try:
-                client = self._get_next_client()
-                print(f"🔄 Tentativa {attempt + 1}/{attempts} para {operation_name}")
-
-                result = await operation_func(client)
-                print(f"✅ {operation_name} bem-sucedida com token #{self._current_client_index}/{len(self.clients)}")
-                return result
-
+                if asyncio.iscoroutinefunction(operation_func):
+                    result = await operation_func(client)
+                else:
+                    # SDK do Apify é bloqueante (actor.call espera o run terminar)
+                    # Limite de taxa/concorrência separado por token
+                    result = await run_blocking(f"apify:{index}", operation_func, client)
             except Exception as e:
                 error_msg = str(e).lower()
 
                 # Detecta erro de limite mensal
                 if "monthly usage" in error_msg or "hard limit" in error_msg or "limit exceeded" in error_msg:
-                    print(f"⚠️ Token #{self._current_client_index}/{len(self.clients)} atingiu limite mensal - tentando próximo token...")
+                    print(f"⚠️ Token #{index + 1}/{len(self.clients)} atingiu limite mensal - tentando próximo token...")
+                    released = True
+                    await self.token_pool.mark_exhausted(index)
                     last_error = e
                     continue
 
-                # Outros erros (não relacionados a limite) - falha imediatamente
+                # Outros erros (não relacionados a limite) - falha imediatamente.
+                # Só falha do token (rede, auth, quota) pesa na saúde; post privado/apagado não
+                released = True
+                await self.token_pool.release(index, ok=False if is_token_failure(e) else None)
                 print(f"❌ Erro inesperado em {operation_name}: {str(e)}")
                 raise
-
-        # Se chegou aqui, TODOS os tokens falharam
-        print(f"❌ TODOS os {attempts} tokens Apify atingiram limite mensal!")
+            else:
+                released = True
+                await self.token_pool.release(index, ok=True, duration=time.monotonic() - started)
+            finally:
+                if not released:
+                    # Cancelado no meio do run: devolve o slot em voo sem contar como erro
+                    await asyncio.shield(self.token_pool.release(index, ok=None))
+
+            print(f"✅ {operation_name} bem-sucedida com token #{index + 1}/{len(self.clients)}")
+            return result
+
+        # Se chegou aqui, não há token disponível (todos esgotados)
+        print(f"❌ TODOS os {len(self.clients)} tokens Apify atingiram limite mensal!")
         raise ValueError(f"Todos os tokens Apify esgotados. Último erro: {str(last_error)}")
 
     async def get_redis_client(self):
@@ -116,22 +145,26 @@ class ApifyService:
             self.redis_client = redis.from_url(self.redis_url)
         return self.redis_client
 
-    async def cache_set(self, key: str, value: dict, expire_hours: int = 168):  # 7 dias
-        try:
-            redis_client = await self.get_redis_client()
-            await redis_client.setex(key, expire_hours * 3600, json.dumps(value))
-        except Exception:
-            pass  # Cache silencioso
+    async def cache_set(self, key: str, value: dict, counts_only: bool = False):
+        """Grava no cache de metadados (LRU local + Redis, ver services/metadata_cache)"""
+        await metadata_cache.set(key, value, counts_only=counts_only)
 
-    async def cache_get(self, key: str) -> Optional[dict]:
-        try:
-            redis_client = await self.get_redis_client()
-            cached = await redis_client.get(key)
-            if cached:
-                return json.loads(cached)
-        except Exception:
-            pass
-        return None
+    async def cache_get(self, key: str, paid: bool = False) -> Optional[dict]:
+        """Lê do cache de metadados (inclui entradas vencidas - sem revalidar)"""
+        data, state = await metadata_cache.get(key, counts_ttl=PAID_COUNTS_TTL_SECONDS if paid else None)
+        return self._servable(data, state, paid)
+
+    @staticmethod
+    def _servable(data: Optional[dict], state: str, paid: bool) -> Optional[dict]:
+        """
+        Instagram/TikTok: thumbnail_url é link assinado do CDN que expira. Entrada
+        com contadores vencidos sai sem ele - a etapa de thumbnail usa o fallback
+        (frame do vídeo) em vez de baixar um link provavelmente morto. Thumbnail
+        do YouTube (i.ytimg.com) não expira.
+        """
+        if data and paid and state in (STALE, STALE_COUNTS) and data.get("thumbnail_url"):
+            return {**data, "thumbnail_url": None}
+        return data
 
     def detect_platform(self, url: str) -> Platform:
         if "youtube.com" in url or "youtu.be" in url:
@@ -144,19 +177,22 @@ class ApifyService:
             raise ValueError(f"Plataforma não suportada para URL: {url}")
 
     def extract_video_id_youtube(self, url: str) -> str:
-        if "youtu.be/" in url:
-            return url.split("youtu.be/")[-1].split("?")[0]
-        elif "youtube.com/watch" in url:
-            parsed = urlparse(url)
-            return parse_qs(parsed.query)["v"][0]
-        else:
+        canonical = canonicalize(url)
+        if canonical.platform != Platform.YOUTUBE:
             raise ValueError("URL do YouTube inválida")
+        return canonical.content_id
 
-    async def extract_youtube(self, url: str) -> VideoMetadata:
-        cache_key = f"youtube:{url}"
-        cached = await self.cache_get(cache_key)
-        if cached:
-            return VideoMetadata(**cached)
+    @staticmethod
+    def metadata_cache_key(url: str) -> str:
+        """Chave de cache compartilhada entre usuários (plataforma + id do conteúdo)"""
+        return f"metadata:{canonical_key(url)}"
+
+    async def extract_youtube(self, url: str, use_cache: bool = True) -> VideoMetadata:
+        cache_key = self.metadata_cache_key(url)
+        if use_cache:
+            cached = await self.cache_get(cache_key)
+            if cached:
+                return VideoMetadata(**{**cached, "url": url})
 
         if not self.youtube_api_key:
             raise ValueError("YOUTUBE_API_KEY não configurada")
@@ -164,97 +200,98 @@ class ApifyService:
         try:
             video_id = self.extract_video_id_youtube(url)
 
-            async with httpx.AsyncClient() as client:
-                # Buscar metadados do vídeo
-                video_response = await client.get(
-                    "https://www.googleapis.com/youtube/v3/videos",
-                    params={
-                        "part": "snippet,statistics,contentDetails",
-                        "id": video_id,
-                        "key": self.youtube_api_key
-                    }
-                )
-                video_data = video_response.json()
-
-                if not video_data["items"]:
-                    raise ValueError("Vídeo não encontrado")
-
-                video_info = video_data["items"][0]
-                snippet = video_info["snippet"]
-                stats = video_info["statistics"]
-
-                # Buscar comentários
-                comments_response = await client.get(
-                    "https://www.googleapis.com/youtube/v3/commentThreads",
-                    params={
-                        "part": "snippet",
-                        "videoId": video_id,
-                        "maxResults": 50,
-                        "order": "relevance",
-                        "key": self.youtube_api_key
-                    }
-                )
-                comments_data = comments_response.json()
-
-                top_comments = []
-                if "items" in comments_data:
-                    # Extrair comentários da resposta
-                    comments_list = []
-                    for item in comments_data["items"]:
-                        comment_snippet = item["snippet"]["topLevelComment"]["snippet"]
-                        comments_list.append({
-                            "text": comment_snippet["textDisplay"],
-                            "author": comment_snippet["authorDisplayName"],
-                            "likes": comment_snippet.get("likeCount", 0)
-                        })
-
-                    # Ordenar por likes (garantir que os mais relevantes vêm primeiro)
-                    sorted_comments = sorted(
-                        comments_list,
-                        key=lambda x: x.get("likes", 0),
-                        reverse=True
-                    )
-
-                    # Converter para objetos Comment
-                    for comment in sorted_comments:
-                        top_comments.append(Comment(
-                            text=comment["text"],
-                            author=comment["author"],
-                            likes=comment["likes"]
-                        ))
-
-                # Extrair hashtags da descrição
-                description = snippet.get("description", "")
-                hashtags = re.findall(r"#\w+", description)
-
-                metadata = VideoMetadata(
-                    url=url,
-                    platform=Platform.YOUTUBE,
-                    title=snippet["title"],
-                    description=description,
-                    hashtags=hashtags,
-                    views=int(stats.get("viewCount", 0)),
-                    likes=int(stats.get("likeCount", 0)),
-                    comments_count=int(stats.get("commentCount", 0)),
-                    top_comments=top_comments,
-                    thumbnail_url=snippet["thumbnails"]["high"]["url"],
-                    duration=video_info["contentDetails"]["duration"],
-                    author=snippet["channelTitle"],
-                    author_url=f"https://www.youtube.com/channel/{snippet['channelId']}",
-                    published_at=snippet["publishedAt"]
+            client = http_client_pool.get()
+            # Buscar metadados do vídeo
+            video_response = await client.get(
+                "https://www.googleapis.com/youtube/v3/videos",
+                params={
+                    "part": "snippet,statistics,contentDetails",
+                    "id": video_id,
+                    "key": self.youtube_api_key
+                }
+            )
+            video_data = video_response.json()
+
+            if not video_data["items"]:
+                raise ValueError("Vídeo não encontrado")
+
+            video_info = video_data["items"][0]
+            snippet = video_info["snippet"]
+            stats = video_info["statistics"]
+
+            # Buscar comentários
+            comments_response = await client.get(
+                "https://www.googleapis.com/youtube/v3/commentThreads",
+                params={
+                    "part": "snippet",
+                    "videoId": video_id,
+                    "maxResults": 50,
+                    "order": "relevance",
+                    "key": self.youtube_api_key
+                }
+            )
+            comments_data = comments_response.json()
+
+            top_comments = []
+            if "items" in comments_data:
+                # Extrair comentários da resposta
+                comments_list = []
+                for item in comments_data["items"]:
+                    comment_snippet = item["snippet"]["topLevelComment"]["snippet"]
+                    comments_list.append({
+                        "text": comment_snippet["textDisplay"],
+                        "author": comment_snippet["authorDisplayName"],
+                        "likes": comment_snippet.get("likeCount", 0)
+                    })
+
+                # Ordenar por likes (garantir que os mais relevantes vêm primeiro)
+                sorted_comments = sorted(
+                    comments_list,
+                    key=lambda x: x.get("likes", 0),
+                    reverse=True
                 )
 
-                await self.cache_set(cache_key, metadata.dict())
-                return metadata
+                # Converter para objetos Comment
+                for comment in sorted_comments:
+                    top_comments.append(Comment(
+                        text=comment["text"],
+                        author=comment["author"],
+                        likes=comment["likes"]
+                    ))
+
+            # Extrair hashtags da descrição
+            description = snippet.get("description", "")
+            hashtags = re.findall(r"#\w+", description)
+
+            metadata = VideoMetadata(
+                url=url,
+                platform=Platform.YOUTUBE,
+                title=snippet["title"],
+                description=description,
+                hashtags=hashtags,
+                views=int(stats.get("viewCount", 0)),
+                likes=int(stats.get("likeCount", 0)),
+                comments_count=int(stats.get("commentCount", 0)),
+                top_comments=top_comments,
+                thumbnail_url=snippet["thumbnails"]["high"]["url"],
+                duration=video_info["contentDetails"]["duration"],
+                author=snippet["channelTitle"],
+                author_url=f"https://www.youtube.com/channel/{snippet['channelId']}",
+                published_at=snippet["publishedAt"]
+            )
+
+            await self.cache_set(cache_key, metadata.dict())
+            return metadata
 
         except Exception as e:
             raise ValueError(f"Erro ao extrair metadados do YouTube: {str(e)}")
 
-    async def extract_tiktok(self, url: str) -> VideoMetadata:
-        cache_key = f"tiktok:{url}"
-        cached = await self.cache_get(cache_key)
-        if cached:
-            return VideoMetadata(**cached)
+    async def extract_tiktok(self, url: str, use_cache: bool = True) -> VideoMetadata:
+        cache_key = self.metadata_cache_key(url)
+        if use_cache:
+            cached = await self.cache_get(cache_key, paid=True)
+            if cached:
+                return VideoMetadata(**{**cached, "url": url})
 
         if not self.apify_token:
             raise ValueError("APIFY_TOKEN não configurado")
@@ -266,7 +303,7 @@ class ApifyService:
             }
 
             # Função para executar scraping TikTok com um cliente específico
-            async def run_tiktok_scraper(client: ApifyClient):
+            def run_tiktok_scraper(client: ApifyClient):
                 run = client.actor("apify/tiktok-scraper").call(run_input=run_input)
                 items = []
                 for item in client.dataset(run["defaultDatasetId"]).iterate_items():
@@ -278,57 +315,7 @@ class ApifyService:
             # Tenta com todos os tokens disponíveis até conseguir
             data = await self._try_all_clients(run_tiktok_scraper, "extract_tiktok")
 
-            # Extrair comentários se disponíveis (ordenados por likes)
-            top_comments = []
-            if "comments" in data and data["comments"]:
-                # Converter para lista e ordenar por likes (comentários mais relevantes primeiro)
-                comments_list = [
-                    c for c in data["comments"][:200]
-                    if c.get("text")  # Só comentários com texto
-                ]
-
-                # Ordenar por diggCount (likes no TikTok)
-                sorted_comments = sorted(
-                    comments_list,
-                    key=lambda x: x.get("diggCount", 0),
-                    reverse=True
-                )
-
-                # Pegar top 50 comentários com mais likes
-                for comment in sorted_comments[:50]:
-                    top_comments.append(Comment(
-                        text=comment.get("text", ""),
-                        author=comment.get("author", ""),
-                        likes=comment.get("diggCount", 0)
-                    ))
-
-            # Extrair hashtags
-            text = data.get("text", "")
-            hashtags = re.findall(r"#\w+", text)
-
-            # Thumbnail temporária do Apify
-            temp_thumbnail_url = data.get("imageURL", "")
-
-            # Upload para Supabase Storage (permanente)
-            permanent_thumbnail = await storage_service.upload_thumbnail(temp_thumbnail_url, url)
-            final_thumbnail_url = permanent_thumbnail if permanent_thumbnail else temp_thumbnail_url
-
-            metadata = VideoMetadata(
-                url=url,
-                platform=Platform.TIKTOK,
-                title=text[:100] + "..." if len(text) > 100 else text,
-                description=text,
-                hashtags=hashtags,
-                views=data.get("playCount", 0),
-                likes=data.get("diggCount", 0),
-                comments_count=data.get("commentCount", 0),
-                top_comments=top_comments,
-                thumbnail_url=final_thumbnail_url,
-                duration=str(data.get("videoMeta", {}).get("duration", "")),
-                author=data.get("authorMeta", {}).get("name", ""),
-                author_url=f"https://www.tiktok.com/@{data.get('authorMeta', {}).get('name', '')}",
-                published_at=data.get("createTime", "")
-            )
+            metadata = await self._build_tiktok_metadata(url, data)
 
             await self.cache_set(cache_key, metadata.dict())
             return metadata
@@ -336,11 +323,12 @@ class ApifyService:
         except Exception as e:
             raise ValueError(f"Erro ao extrair metadados do TikTok: {str(e)}")
 
-    async def extract_instagram_reel(self, url: str) -> VideoMetadata:
-        cache_key = f"instagram:{url}"
-        cached = await self.cache_get(cache_key)
-        if cached:
-            return VideoMetadata(**cached)
+    async def extract_instagram_reel(self, url: str, use_cache: bool = True) -> VideoMetadata:
+        cache_key = self.metadata_cache_key(url)
+        if use_cache:
+            cached = await self.cache_get(cache_key, paid=True)
+            if cached:
+                return VideoMetadata(**{**cached, "url": url})
 
         if not self.apify_token:
             # Fallback: retorna metadados básicos sem Apify
@@ -361,7 +349,7 @@ class ApifyService:
             }
 
             # Função para executar scraping Instagram com um cliente específico
-            async def run_instagram_scraper(client: ApifyClient):
+            def run_instagram_scraper(client: ApifyClient):
                 run = client.actor("apify/instagram-scraper").call(
                     run_input=run_input,
                     timeout_secs=120  # 2 minutos max
@@ -380,70 +368,12 @@ class ApifyService:
             # Salva resposta bruta para debug
             self.last_raw_response = data
 
-            # Validação de dados essenciais
-            # NOTA: Aceita dados parciais se tiver error (página restrita mas com thumbnail)
-            if not data.get("caption") and not data.get("ownerUsername") and not data.get("error"):
+            metadata = self._build_instagram_metadata(url, data)
+            if metadata is None:
                 print("⚠️ Instagram scraper retornou dados incompletos - usando fallback")
                 self.last_raw_response = {"fallback": True, "reason": "dados_incompletos", "original": data}
                 return await self._instagram_fallback(url)
 
-            # Extrair comentários se disponíveis (ordenados por likes)
-            top_comments = []
-            try:
-                if "latestComments" in data and data["latestComments"]:
-                    # Converter para lista e ordenar por likes (comentários mais relevantes primeiro)
-                    comments_list = [
-                        c for c in data["latestComments"][:200]
-                        if c.get("text")  # Só comentários com texto
-                    ]
-
-                    # Ordenar por likesCount (descendente)
-                    sorted_comments = sorted(
-                        comments_list,
-                        key=lambda x: x.get("likesCount", 0),
-                        reverse=True
-                    )
-
-                    # Pegar top 50 comentários com mais likes
-                    for comment in sorted_comments[:50]:
-                        top_comments.append(Comment(
-                            text=comment.get("text", ""),
-                            author=comment.get("ownerUsername", ""),
-                            likes=comment.get("likesCount", 0)
-                        ))
-            except Exception:
-                pass  # Ignora erros em comentários
-
-            # Extrair hashtags da caption
-            caption = data.get("caption", "Instagram Reel")
-            hashtags = re.findall(r"#\w+", caption)
-
-            # Thumbnail original do Instagram (CDN)
-            # IMPORTANTE: Não fazer upload aqui - o background_processor faz depois
-            # Busca displayUrl (resposta completa) ou image (resposta parcial/restrita)
-            thumbnail_url = data.get("displayUrl") or data.get("image") or ""
-
-            # Log se veio de resposta restrita
-            if data.get("error"):
-                print(f"⚠️ Apify retornou erro parcial: {data.get('error')} - {data.get('errorDescription', '')}")
-
-            metadata = VideoMetadata(
-                url=url,
-                platform=Platform.INSTAGRAM,
-                title=caption[:100] + "..." if len(caption) > 100 else caption if caption else "Instagram Reel",
-                description=caption,
-                hashtags=hashtags,
-                views=data.get("videoViewCount", 0),
-                likes=data.get("likesCount", 0),
-                comments_count=data.get("commentsCount", 0),
-                top_comments=top_comments,
-                thumbnail_url=thumbnail_url,
-                duration=str(data.get("videoDuration", "")) if data.get("videoDuration") else "",
-                author=data.get("ownerUsername", "Unknown"),
-                author_url=f"https://www.instagram.com/{data.get('ownerUsername', '')}" if data.get('ownerUsername') else "",
-                published_at=data.get("timestamp", "")
-            )
-
             await self.cache_set(cache_key, metadata.dict())
             return metadata
 
@@ -486,14 +416,132 @@ class ApifyService:
         )
 
     async def extract_metadata(self, url: str) -> VideoMetadata:
+        """
+        Extrai metadados com single-flight: chamadas simultâneas para a mesma
+        URL (mesmo em processos diferentes) compartilham um único scrape.
+        """
+        self.detect_platform(url)  # Valida antes de entrar no single-flight
+
+        cached = await self._cached_metadata(url)
+        if cached:
+            return cached
+
+        return await single_flight.run(
+            self.metadata_cache_key(url),
+            lambda: self._extract_metadata_uncoalesced(url),
+            encode=lambda metadata: metadata.dict(),
+            decode=lambda data: VideoMetadata(**{**data, "url": url}),
+        )
+
+    def _get_supabase(self):
+        if self._supabase is None:
+            supabase_url = os.getenv("SUPABASE_URL")
+            supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+            if not supabase_url or not supabase_key:
+                return None
+            from supabase import create_client
+            self._supabase = create_client(supabase_url, supabase_key)
+        return self._supabase
+
+    async def find_shared_metadata(self, url: str) -> Optional[VideoMetadata]:
+        """
+        Busca metadados já extraídos para o mesmo conteúdo (mesma url_key) em
+        bookmarks de qualquer usuário - evita pagar outro scrape do mesmo viral.
+        """
+        supabase = self._get_supabase()
+        if supabase is None:
+            return None
+
+        try:
+            response = await execute_async(
+                supabase.table('bookmarks')
+                .select('metadata, updated_at')
+                .eq('url_key', canonical_key(url))
+                .not_.is_('metadata', 'null')
+                .gte('updated_at', (datetime.utcnow() - timedelta(hours=SHARED_METADATA_MAX_AGE_HOURS)).isoformat())
+                .order('updated_at', desc=True)
+                .limit(5)
+            )
+        except Exception as e:
+            print(f"⚠️ Busca de metadados compartilhados falhou: {str(e)}")
+            return None
+
+        # Thumbnail assinada do Instagram/TikTok só vale enquanto contadores valeriam no cache
+        paid = self.detect_platform(url) != Platform.YOUTUBE
+        thumbnail_cutoff = (datetime.utcnow() - timedelta(seconds=PAID_COUNTS_TTL_SECONDS)).isoformat()
+
+        for row in response.data or []:
+            data = row.get('metadata') or {}
+            # Ignora metadados de fallback (sem autor nem descrição)
+            if not data.get('title') or not (data.get('author') or data.get('description')):
+                continue
+            if paid and (row.get('updated_at') or '') < thumbnail_cutoff:
+                data = {**data, "thumbnail_url": None}
+            try:
+                return VideoMetadata(**{**data, "url": url})
+            except Exception:
+                continue
+        return None
+
+    async def _cached_metadata(self, url: str) -> Optional[VideoMetadata]:
+        """
+        Lê do cache com stale-while-revalidate: entrada vencida é servida na
+        hora e revalidada em background (só contadores se o resto está fresco).
+
+        Instagram/TikTok: atualizar contadores custa um actor run inteiro,
+        então eles vencem em METADATA_CACHE_PAID_COUNTS_TTL_HOURS.
+        """
+        cache_key = self.metadata_cache_key(url)
+        paid = self.detect_platform(url) != Platform.YOUTUBE
+        data, state = await metadata_cache.get(cache_key, counts_ttl=PAID_COUNTS_TTL_SECONDS if paid else None)
+        if data is None:
+            return None
+
+        if state in (STALE, STALE_COUNTS):
+            async def fetch():
+                # Mesma chave do extract_metadata: refresh e miss simultâneos = 1 scrape
+                metadata = await single_flight.run(
+                    cache_key,
+                    lambda: self._scrape_metadata(url),
+                    encode=lambda metadata: metadata.dict(),
+                    decode=lambda data: VideoMetadata(**{**data, "url": url}),
+                )
+                # Fallback (sem autor nem descrição) não sobrescreve dado bom
+                if not (metadata.author or metadata.description):
+                    return None
+                return metadata.dict()
+
+            metadata_cache.schedule_refresh(cache_key, fetch, counts_only=(state == STALE_COUNTS))
+
+        return VideoMetadata(**{**self._servable(data, state, paid), "url": url})
+
+    async def _extract_metadata_uncoalesced(self, url: str) -> VideoMetadata:
+        # 1. Cache (outro líder pode ter acabado de preencher)
+        cache_key = self.metadata_cache_key(url)
+        cached = await self.cache_get(cache_key, paid=self.detect_platform(url) != Platform.YOUTUBE)
+        if cached:
+            return VideoMetadata(**{**cached, "url": url})
+
+        # 2. Bookmark de outro usuário com o mesmo conteúdo
+        shared = await self.find_shared_metadata(url)
+        if shared:
+            print(f"♻️ Metadados reaproveitados de outro bookmark ({canonical_key(url)})")
+            await self.cache_set(cache_key, shared.dict())
+            return shared
+
+        # 3. Scrape
+        return await self._scrape_metadata(url)
+
+    async def _scrape_metadata(self, url: str) -> VideoMetadata:
+        """Extrai direto da plataforma (sem ler cache; grava o resultado)"""
         platform = self.detect_platform(url)
 
         if platform == Platform.YOUTUBE:
-            return await self.extract_youtube(url)
+            return await self.extract_youtube(url, use_cache=False)
         elif platform == Platform.TIKTOK:
-            return await self.extract_tiktok(url)
+            return await self.extract_tiktok(url, use_cache=False)
         elif platform == Platform.INSTAGRAM:
-            return await self.extract_instagram_reel(url)
+            return await self.extract_instagram_reel(url, use_cache=False)
         else:
             raise ValueError(f"Plataforma não suportada: {platform}")
 
@@ -514,7 +562,7 @@ class ApifyService:
             }
 
             # Função para executar scraping TikTok com um cliente específico
-            async def run_tiktok_downloader(client: ApifyClient):
+            def run_tiktok_downloader(client: ApifyClient):
                 run = client.actor("apify/tiktok-scraper").call(run_input=run_input)
                 items = []
                 for item in client.dataset(run["defaultDatasetId"]).iterate_items():
@@ -526,35 +574,7 @@ class ApifyService:
             # Tenta com todos os tokens disponíveis até conseguir
             data = await self._try_all_clients(run_tiktok_downloader, "extract_video_download_url_tiktok")
 
-            # TikTok retorna videoUrl no campo "video"
-            video_url = None
-            file_size_mb = None
-
-            # Estrutura do TikTok Apify response:
-            # - data["video"]["downloadAddr"] = URL de download direto
-            # - data["videoMeta"]["width"], data["videoMeta"]["height"] = dimensões
-            # - data["videoMeta"]["duration"] = duração em segundos
-
-            if "video" in data:
-                video_data = data["video"]
-                # URL de download direto (HD se disponível)
-                video_url = video_data.get("downloadAddr") or video_data.get("playAddr")
-
-                # Tamanho estimado (TikTok não sempre retorna, estimamos)
-                if "videoMeta" in data:
-                    duration = data["videoMeta"].get("duration", 0)
-                    # Estimativa: ~1MB por 10 segundos em 480p
-                    file_size_mb = round((duration / 10) * 1.0, 2)
-
-            if not video_url:
-                raise ValueError("URL de vídeo não encontrada no response do TikTok")
-
-            return {
-                "download_url": video_url,
-                "file_size_mb": file_size_mb,
-                "quality": "original",  # TikTok geralmente retorna qualidade original
-                "expires_in_hours": 6,  # URLs do TikTok expiram em ~6 horas
-            }
+            return self._tiktok_download_info(data)
 
         except Exception as e:
             raise ValueError(f"Erro ao extrair URL de download do TikTok: {str(e)}")
@@ -581,7 +601,7 @@ class ApifyService:
             }
 
             # Função para executar scraping Instagram com um cliente específico
-            async def run_instagram_downloader(client: ApifyClient):
+            def run_instagram_downloader(client: ApifyClient):
                 run = client.actor("apify/instagram-scraper").call(
                     run_input=run_input,
                     timeout_secs=120  # 2 minutos max
@@ -601,23 +621,8 @@ class ApifyService:
             # Tenta com todos os tokens disponíveis até conseguir
             data = await self._try_all_clients(run_instagram_downloader, "extract_video_download_url_instagram")
 
-            # Instagram retorna videoUrl no campo "videoUrl"
-            video_url = data.get("videoUrl")
-
-            # Tamanho estimado
-            file_size_mb = None
-            if "videoDuration" in data:
-                duration = data["videoDuration"]
-                # Estimativa: ~1.5MB por 10 segundos em 480p
-                file_size_mb = round((duration / 10) * 1.5, 2)
-
             print("✅ URL de vídeo Instagram extraída via Apify")
-            return {
-                "download_url": video_url,
-                "file_size_mb": file_size_mb,
-                "quality": "original",  # Instagram retorna qualidade original
-                "expires_in_hours": 2,  # URLs do Instagram expiram em ~2 horas
-            }
+            return self._instagram_download_info(data)
 
         except Exception as e:
             print(f"❌ Apify falhou: {str(e)} - tentando yt-dlp")
@@ -626,9 +631,7 @@ class ApifyService:
     async def _extract_instagram_ytdlp(self, url: str, quality: str = "480p") -> dict:
         """Fallback usando yt-dlp para Instagram com formato compatível Android"""
         try:
-            import subprocess
             import json
-            import tempfile
 
             print(f"🔧 Tentando yt-dlp para Instagram: {url}")
 
@@ -655,34 +658,32 @@ class ApifyService:
 
             # Adicionar cookies se configurados
             instagram_cookies = os.getenv("INSTAGRAM_COOKIES")
-            cookies_file = None
+            cookies_job = None
 
             if instagram_cookies:
-                # Criar arquivo temporário com cookies
-                cookies_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
-                cookies_file.write(instagram_cookies)
-                cookies_file.close()
-                cmd.extend(["--cookies", cookies_file.name])
+                # Cookies no diretório de um job: apagado mesmo se o yt-dlp falhar
+                cookies_job = await temp_storage.ajob("ytdlp-cookies", reserve_bytes=0)
+                cookies_path = cookies_job.file("cookies.txt")
+                with open(cookies_path, "w") as f:
+                    f.write(instagram_cookies)
+                cmd.extend(["--cookies", cookies_path])
                 print("🍪 Usando cookies do Instagram configurados")
 
             cmd.append(url)
 
             # yt-dlp com formato específico compatível com Android
             # Prioriza H.264 (avc1) em MP4 para máxima compatibilidade
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-
-            # Limpar arquivo de cookies temporário
-            if cookies_file:
-                try:
-                    import os as os_module
-                    os_module.unlink(cookies_file.name)
-                except:
-                    pass
+            # Processo async (não trava o event loop); usuário esperando = prioridade interativa
+            try:
+                result = await process_pool.run(
+                    cmd,
+                    priority=PRIORITY_INTERACTIVE,
+                    text=True,
+                    timeout=30
+                )
+            finally:
+                if cookies_job:
+                    cookies_job.cleanup()
 
             if result.returncode != 0:
                 print(f"⚠️ yt-dlp stderr: {result.stderr}")
@@ -725,6 +726,373 @@ class ApifyService:
             print(f"❌ yt-dlp falhou completamente: {str(e)}")
             raise ValueError(f"Erro ao extrair URL de download do Instagram (yt-dlp): {str(e)}")
 
+    # ------------------------------------------------------------------
+    # Conversão item do dataset Apify → resultado (compartilhado single/batch)
+    # ------------------------------------------------------------------
+
+    async def _build_tiktok_metadata(self, url: str, data: dict) -> VideoMetadata:
+        # Extrair comentários se disponíveis (ordenados por likes)
+        top_comments = []
+        if "comments" in data and data["comments"]:
+            # Converter para lista e ordenar por likes (comentários mais relevantes primeiro)
+            comments_list = [
+                c for c in data["comments"][:200]
+                if c.get("text")  # Só comentários com texto
+            ]
+
+            # Ordenar por diggCount (likes no TikTok)
+            sorted_comments = sorted(
+                comments_list,
+                key=lambda x: x.get("diggCount", 0),
+                reverse=True
+            )
+
+            # Pegar top 50 comentários com mais likes
+            for comment in sorted_comments[:50]:
+                top_comments.append(Comment(
+                    text=comment.get("text", ""),
+                    author=comment.get("author", ""),
+                    likes=comment.get("diggCount", 0)
+                ))
+
+        # Extrair hashtags
+        text = data.get("text", "")
+        hashtags = re.findall(r"#\w+", text)
+
+        # Thumbnail temporária do Apify
+        temp_thumbnail_url = data.get("imageURL", "")
+
+        # Upload para Supabase Storage (permanente)
+        permanent_thumbnail = await storage_service.upload_thumbnail(temp_thumbnail_url, url)
+        final_thumbnail_url = permanent_thumbnail if permanent_thumbnail else temp_thumbnail_url
+
+        metadata = VideoMetadata(
+            url=url,
+            platform=Platform.TIKTOK,
+            title=text[:100] + "..." if len(text) > 100 else text,
+            description=text,
+            hashtags=hashtags,
+            views=data.get("playCount", 0),
+            likes=data.get("diggCount", 0),
+            comments_count=data.get("commentCount", 0),
+            top_comments=top_comments,
+            thumbnail_url=final_thumbnail_url,
+            duration=str(data.get("videoMeta", {}).get("duration", "")),
+            author=data.get("authorMeta", {}).get("name", ""),
+            author_url=f"https://www.tiktok.com/@{data.get('authorMeta', {}).get('name', '')}",
+            published_at=data.get("createTime", "")
+        )
+
+        return metadata
+
+    def _build_instagram_metadata(self, url: str, data: dict) -> Optional[VideoMetadata]:
+        """Retorna None se o item veio incompleto (caller usa _instagram_fallback)"""
+        # Validação de dados essenciais
+        # NOTA: Aceita dados parciais se tiver error (página restrita mas com thumbnail)
+        if not data.get("caption") and not data.get("ownerUsername") and not data.get("error"):
+            return None
+
+        # Extrair comentários se disponíveis (ordenados por likes)
+        top_comments = []
+        try:
+            if "latestComments" in data and data["latestComments"]:
+                # Converter para lista e ordenar por likes (comentários mais relevantes primeiro)
+                comments_list = [
+                    c for c in data["latestComments"][:200]
+                    if c.get("text")  # Só comentários com texto
+                ]
+
+                # Ordenar por likesCount (descendente)
+                sorted_comments = sorted(
+                    comments_list,
+                    key=lambda x: x.get("likesCount", 0),
+                    reverse=True
+                )
+
+                # Pegar top 50 comentários com mais likes
+                for comment in sorted_comments[:50]:
+                    top_comments.append(Comment(
+                        text=comment.get("text", ""),
+                        author=comment.get("ownerUsername", ""),
+                        likes=comment.get("likesCount", 0)
+                    ))
+        except Exception:
+            pass  # Ignora erros em comentários
+
+        # Extrair hashtags da caption
+        caption = data.get("caption", "Instagram Reel")
+        hashtags = re.findall(r"#\w+", caption)
+
+        # Thumbnail original do Instagram (CDN)
+        # IMPORTANTE: Não fazer upload aqui - o background_processor faz depois
+        # Busca displayUrl (resposta completa) ou image (resposta parcial/restrita)
+        thumbnail_url = data.get("displayUrl") or data.get("image") or ""
+
+        # Log se veio de resposta restrita
+        if data.get("error"):
+            print(f"⚠️ Apify retornou erro parcial: {data.get('error')} - {data.get('errorDescription', '')}")
+
+        metadata = VideoMetadata(
+            url=url,
+            platform=Platform.INSTAGRAM,
+            title=caption[:100] + "..." if len(caption) > 100 else caption if caption else "Instagram Reel",
+            description=caption,
+            hashtags=hashtags,
+            views=data.get("videoViewCount", 0),
+            likes=data.get("likesCount", 0),
+            comments_count=data.get("commentsCount", 0),
+            top_comments=top_comments,
+            thumbnail_url=thumbnail_url,
+            duration=str(data.get("videoDuration", "")) if data.get("videoDuration") else "",
+            author=data.get("ownerUsername", "Unknown"),
+            author_url=f"https://www.instagram.com/{data.get('ownerUsername', '')}" if data.get('ownerUsername') else "",
+            published_at=data.get("timestamp", "")
+        )
+
+        return metadata
+
+    def _tiktok_download_info(self, data: dict) -> dict:
+        # TikTok retorna videoUrl no campo "video"
+        video_url = None
+        file_size_mb = None
+
+        # Estrutura do TikTok Apify response:
+        # - data["video"]["downloadAddr"] = URL de download direto
+        # - data["videoMeta"]["width"], data["videoMeta"]["height"] = dimensões
+        # - data["videoMeta"]["duration"] = duração em segundos
+
+        if "video" in data:
+            video_data = data["video"]
+            # URL de download direto (HD se disponível)
+            video_url = video_data.get("downloadAddr") or video_data.get("playAddr")
+
+            # Tamanho estimado (TikTok não sempre retorna, estimamos)
+            if "videoMeta" in data:
+                duration = data["videoMeta"].get("duration", 0)
+                # Estimativa: ~1MB por 10 segundos em 480p
+                file_size_mb = round((duration / 10) * 1.0, 2)
+
+        if not video_url:
+            raise ValueError("URL de vídeo não encontrada no response do TikTok")
+
+        return {
+            "download_url": video_url,
+            "file_size_mb": file_size_mb,
+            "quality": "original",  # TikTok geralmente retorna qualidade original
+            "expires_in_hours": 6,  # URLs do TikTok expiram em ~6 horas
+        }
+
+    def _instagram_download_info(self, data: dict) -> dict:
+        if not data.get("videoUrl"):
+            raise ValueError("Instagram scraper não retornou videoUrl")
+
+        # Instagram retorna videoUrl no campo "videoUrl"
+        video_url = data.get("videoUrl")
+
+        # Tamanho estimado
+        file_size_mb = None
+        if "videoDuration" in data:
+            duration = data["videoDuration"]
+            # Estimativa: ~1.5MB por 10 segundos em 480p
+            file_size_mb = round((duration / 10) * 1.5, 2)
+
+        return {
+            "download_url": video_url,
+            "file_size_mb": file_size_mb,
+            "quality": "original",  # Instagram retorna qualidade original
+            "expires_in_hours": 2,  # URLs do Instagram expiram em ~2 horas
+        }
+
+    # ------------------------------------------------------------------
+    # Modo batch: 1 actor run por chunk de URLs (evita cold-start por URL)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _item_keys(item: dict) -> List[str]:
+        """Chaves candidatas de um item do dataset (URL de entrada, URL canônica, ids)"""
+        keys = []
+        for field in ("inputUrl", "submittedVideoUrl", "url", "webVideoUrl"):
+            if item.get(field):
+                keys.append(canonical_key(item[field]))
+        if item.get("shortCode"):
+            keys.append(f"{Platform.INSTAGRAM.value}:{item['shortCode']}")
+        if item.get("id") and str(item["id"]).isdigit() and "webVideoUrl" in item:
+            keys.append(f"{Platform.TIKTOK.value}:{item['id']}")
+        return keys
+
+    async def _scrape_batch(self, platform: Platform, urls: List[str], operation_name: str) -> dict:
+        """
+        Roda o scraper do Apify em chunks de APIFY_BATCH_SIZE URLs (chunks em paralelo,
+        espalhados pelo pool de tokens) e demultiplexa os itens do dataset por URL.
+
+        Returns:
+            Dict {url: item} - URLs sem item (não encontradas ou chunk falhou) ficam de fora
+        """
+        if not urls:
+            return {}
+        if not self.clients:
+            raise ValueError("Nenhum APIFY_TOKEN configurado")
+
+        chunks = [urls[i:i + APIFY_BATCH_SIZE] for i in range(0, len(urls), APIFY_BATCH_SIZE)]
+
+        def make_runner(chunk: List[str]):
+            if platform == Platform.TIKTOK:
+                actor_id = "apify/tiktok-scraper"
+                run_input = {"postUrls": chunk, "maxItems": len(chunk)}
+                timeout_secs = None
+            else:
+                actor_id = "apify/instagram-scraper"
+                run_input = {
+                    "directUrls": chunk,
+                    "resultsType": "posts",
+                    "resultsLimit": 1,  # Por URL
+                    "searchType": "hashtag",
+                    "searchLimit": 1,
+                    "addParentData": False,
+                }
+                timeout_secs = 120 + 30 * len(chunk)
+
+            def run_batch_scraper(client: ApifyClient):
+                run = client.actor(actor_id).call(run_input=run_input, timeout_secs=timeout_secs)
+                return list(client.dataset(run["defaultDatasetId"]).iterate_items())
+
+            return run_batch_scraper
+
+        async def run_chunk(chunk: List[str]) -> dict:
+            try:
+                items = await self._try_all_clients(make_runner(chunk), f"{operation_name} ({len(chunk)} URLs)")
+            except Exception as e:
+                print(f"❌ Chunk de {len(chunk)} URLs falhou em {operation_name}: {str(e)}")
+                return {}
+
+            wanted = {canonical_key(url): url for url in chunk}
+            found = {}
+            for item in items:
+                for key in self._item_keys(item):
+                    url = wanted.get(key)
+                    if url and url not in found:
+                        found[url] = item
+                        break
+            return found
+
+        results = {}
+        for found in await asyncio.gather(*(run_chunk(chunk) for chunk in chunks)):
+            results.update(found)
+
+        print(f"📦 {operation_name}: {len(results)}/{len(urls)} URLs resolvidas em {len(chunks)} actor run(s)")
+        return results
+
+    def _group_by_platform(self, urls: List[str]) -> Dict[Platform, List[str]]:
+        groups: Dict[Platform, List[str]] = {}
+        for url in dict.fromkeys(urls):  # Remove duplicadas mantendo ordem
+            try:
+                groups.setdefault(self.detect_platform(url), []).append(url)
+            except ValueError as e:
+                print(f"⚠️ {str(e)}")
+        return groups
+
+    async def extract_metadata_batch(self, urls: List[str]) -> Dict[str, VideoMetadata]:
+        """
+        Versão em lote de extract_metadata: agrupa por plataforma e roda 1 actor
+        por chunk de URLs. Lê e preenche o mesmo cache Redis do modo individual.
+
+        Returns:
+            Dict {url: VideoMetadata} - URLs que falharam ficam de fora
+            (Instagram sem item usa _instagram_fallback, como no modo individual)
+        """
+        results: Dict[str, VideoMetadata] = {}
+        groups = self._group_by_platform(urls)
+
+        # YouTube usa a Data API (sem actor) - só paraleliza
+        youtube_urls = groups.pop(Platform.YOUTUBE, [])
+        youtube_results = await asyncio.gather(
+            *(self.extract_metadata(url) for url in youtube_urls), return_exceptions=True
+        )
+        for url, metadata in zip(youtube_urls, youtube_results):
+            if isinstance(metadata, Exception):
+                print(f"❌ {url}: {str(metadata)}")
+            else:
+                results[url] = metadata
+
+        for platform, platform_urls in groups.items():
+            prefix = "tiktok" if platform == Platform.TIKTOK else "instagram"
+
+            missing = []
+            for url in platform_urls:
+                cached = await self._cached_metadata(url)
+                if cached:
+                    results[url] = cached
+                    continue
+                shared = await self.find_shared_metadata(url)
+                if shared:
+                    await self.cache_set(self.metadata_cache_key(url), shared.dict())
+                    results[url] = shared
+                    continue
+                missing.append(url)
+
+            if not self.apify_token:
+                items = {}
+            else:
+                items = await self._scrape_batch(platform, missing, f"extract_metadata_batch[{prefix}]")
+
+            for url in missing:
+                data = items.get(url)
+                try:
+                    if platform == Platform.TIKTOK:
+                        if data is None:
+                            raise ValueError("Vídeo do TikTok não encontrado")
+                        metadata = await self._build_tiktok_metadata(url, data)
+                    else:
+                        metadata = self._build_instagram_metadata(url, data) if data else None
+                        if metadata is None:
+                            results[url] = await self._instagram_fallback(url)
+                            continue
+
+                    await self.cache_set(self.metadata_cache_key(url), metadata.dict())
+                    results[url] = metadata
+                except Exception as e:
+                    print(f"❌ {url}: {str(e)}")
+
+        return results
+
+    async def extract_download_urls_batch(self, urls: List[str], quality: str = "480p") -> Dict[str, dict]:
+        """
+        Versão em lote de extract_video_download_url_{tiktok,instagram}.
+
+        Returns:
+            Dict {url: {download_url, file_size_mb, quality, expires_in_hours}}
+            - URLs que falharam ficam de fora (Instagram sem item tenta yt-dlp)
+        """
+        results: Dict[str, dict] = {}
+        groups = self._group_by_platform(urls)
+
+        for platform, platform_urls in groups.items():
+            if platform not in (Platform.TIKTOK, Platform.INSTAGRAM):
+                print(f"⚠️ Download em lote não suportado para {platform.value} - {len(platform_urls)} URL(s) ignorada(s)")
+                continue
+
+            items = await self._scrape_batch(platform, platform_urls, f"extract_download_urls_batch[{platform.value}]")
+
+            for url in platform_urls:
+                data = items.get(url)
+                try:
+                    if platform == Platform.TIKTOK:
+                        if data is None:
+                            raise ValueError("Vídeo do TikTok não encontrado")
+                        results[url] = self._tiktok_download_info(data)
+                    else:
+                        try:
+                            if data is None:
+                                raise ValueError("Instagram scraper retornou vazio")
+                            results[url] = self._instagram_download_info(data)
+                        except ValueError as e:
+                            print(f"❌ Apify falhou: {str(e)} - tentando yt-dlp")
+                            results[url] = await self._extract_instagram_ytdlp(url, quality)
+                except Exception as e:
+                    print(f"❌ {url}: {str(e)}")
+
+        return results
+
     async def extract_all_instagram_comments(
         self,
         post_url: str,
@@ -761,7 +1129,7 @@ class ApifyService:
             }
 
             # Executar Instagram Comments Scraper
-            async def run_comments_scraper(client: ApifyClient):
+            def run_comments_scraper(client: ApifyClient):
                 run = client.actor("apify/instagram-comment-scraper").call(
                     run_input=run_input,
                     timeout_secs=300  # 5 minutos max
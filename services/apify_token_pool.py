@@ -0,0 +1,322 @@
+"""
+Pool de tokens Apify com estado de saúde compartilhado (Redis).
+
+Antes a seleção era round-robin cega: cada request redescobria um token
+esgotado batendo num scrape real e recebendo "monthly usage".
+
+Estado por token (hash `apify:token:<fingerprint>`, sem guardar o token):
+- exhausted_until: token esgotado até o reset do billing. O ciclo do Apify
+  segue a data da assinatura de cada conta: APIFY_TOKEN_RESET_DAYS="5,12"
+  (dia do mês por token, na ordem dos tokens). Sem dia configurado, o token
+  volta a ser testado após APIFY_TOKEN_EXHAUSTED_PROBE_HOURS
+- error_rate / last_error: média móvel (EWMA) de falhas do token (rede,
+  autenticação, quota) e quando foi a última. Erro de conteúdo (post
+  privado/apagado) não conta
+- latency: média móvel (EWMA) da duração dos runs, em segundos
+- inflight: runs em andamento em todos os processos (chave própria com TTL)
+
+As médias são atualizadas no próprio Redis (script Lua atômico), então
+processos concorrentes não sobrescrevem o resultado uns dos outros.
+
+Seleção: entre os tokens saudáveis, o menos carregado
+(inflight + penalidade por erro + latência), então scrapes simultâneos se
+espalham pelas contas. Sem Redis o estado fica só no processo (fail-open).
+"""
+import os
+import time
+import random
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = 0.2
+ERROR_RATE_UNHEALTHY = float(os.getenv("APIFY_TOKEN_ERROR_RATE_UNHEALTHY", "0.8"))
+ERROR_COOLDOWN_SECONDS = 600   # Token com muitos erros volta a ser testado depois disso
+ERROR_PENALTY = 5.0          # Peso do error_rate no score (em "runs em voo")
+LATENCY_WEIGHT = 1 / 60.0    # 60s de latência média ≈ 1 run em voo
+STATE_TTL_SECONDS = 40 * 24 * 3600
+INFLIGHT_TTL_SECONDS = 3600  # Contador de um processo morto não fica preso
+REDIS_RETRY_SECONDS = 30
+EXHAUSTED_PROBE_SECONDS = float(os.getenv("APIFY_TOKEN_EXHAUSTED_PROBE_HOURS", "6")) * 3600
+
+# Status HTTP da API do Apify que indicam problema do token/conta (não do conteúdo)
+TOKEN_FAILURE_STATUS = {401, 402, 403, 429}
+TOKEN_FAILURE_MARKERS = (
+    "authentication token", "unauthorized", "invalid token", "rate limit",
+    "too many requests", "timed out", "timeout", "connection", "service unavailable",
+)
+
+# EWMA + contador em voo atualizados no Redis, sem read-modify-write entre processos
+# KEYS: hash do token, contador inflight
+# ARGV: alpha, falhou (1/0/-1 = não conta), duração (-1 = não medida), agora, ttl estado, ttl inflight
+RELEASE_SCRIPT = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'error_rate') or '0')
+local latency = tonumber(redis.call('HGET', KEYS[1], 'latency') or '0')
+local alpha = tonumber(ARGV[1])
+local failed = tonumber(ARGV[2])
+local duration = tonumber(ARGV[3])
+if failed >= 0 then
+  rate = (1 - alpha) * rate + alpha * failed
+  redis.call('HSET', KEYS[1], 'error_rate', tostring(rate))
+  if failed == 1 then
+    redis.call('HSET', KEYS[1], 'last_error', ARGV[4])
+  end
+end
+if duration >= 0 then
+  if latency == 0 then latency = duration else latency = (1 - alpha) * latency + alpha * duration end
+  redis.call('HSET', KEYS[1], 'latency', tostring(latency))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('DECRBY', KEYS[2], 1)
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+return {tostring(rate), tostring(latency)}
+"""
+
+
+def next_billing_reset(now: Optional[float] = None, day: int = 1) -> float:
+    """Timestamp do próximo reset do uso mensal (dia `day` do mês, 00:00 UTC)"""
+    dt = datetime.fromtimestamp(now if now is not None else time.time(), tz=timezone.utc)
+    day = min(max(day, 1), 28)  # Todo mês tem dia 28
+    reset = datetime(dt.year, dt.month, day, tzinfo=timezone.utc)
+    if reset <= dt:
+        if dt.month == 12:
+            reset = datetime(dt.year + 1, 1, day, tzinfo=timezone.utc)
+        else:
+            reset = datetime(dt.year, dt.month + 1, day, tzinfo=timezone.utc)
+    return reset.timestamp()
+
+
+def _parse_reset_days(raw: str, size: int) -> List[Optional[int]]:
+    """'5,,12' -> [5, None, 12, ...] (um dia do mês por token, vazio = sem data conhecida)"""
+    days: List[Optional[int]] = []
+    for item in raw.split(",") if raw.strip() else []:
+        try:
+            days.append(int(item) if item.strip() else None)
+        except ValueError:
+            logger.warning(f"⚠️ APIFY_TOKEN_RESET_DAYS inválido: '{item}'")
+            days.append(None)
+    return (days + [None] * size)[:size]
+
+
+def is_token_failure(error: BaseException) -> bool:
+    """
+    Falha que diz algo sobre o token (rede, autenticação, quota/rate limit).
+    Post privado, apagado ou sem resultado é erro do conteúdo - o token está ok.
+    """
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in TOKEN_FAILURE_STATUS or status >= 500
+    message = str(error).lower()
+    return any(marker in message for marker in TOKEN_FAILURE_MARKERS)
+
+
+class ApifyTokenPool:
+    def __init__(self, tokens: List[str], redis_url: Optional[str] = None):
+        self.size = len(tokens)
+        self.fingerprints = [hashlib.sha256(t.encode()).hexdigest()[:12] for t in tokens]
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.reset_days = _parse_reset_days(os.getenv("APIFY_TOKEN_RESET_DAYS", ""), self.size)
+        self._redis = None
+        self._release_script = None
+        self._redis_down_until = 0.0
+
+        # Estado local (espelho do Redis / fallback sem Redis)
+        self._state: List[Dict[str, float]] = [
+            {"exhausted_until": 0.0, "error_rate": 0.0, "last_error": 0.0, "latency": 0.0, "inflight": 0.0}
+            for _ in tokens
+        ]
+
+    # ------------------------------------------------------------------
+    # Redis
+    # ------------------------------------------------------------------
+
+    def _key(self, index: int) -> str:
+        return f"apify:token:{self.fingerprints[index]}"
+
+    async def _get_redis(self):
+        if time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            try:
+                import redis.asyncio as redis
+
+                self._redis = redis.from_url(self.redis_url, socket_timeout=2)
+            except Exception as e:
+                self._redis_failed(e)
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        if time.time() >= self._redis_down_until:
+            logger.warning(f"⚠️ Pool de tokens Apify sem Redis ({str(e)[:80]}) - usando estado local")
+        self._redis_down_until = time.time() + REDIS_RETRY_SECONDS
+
+    async def _refresh(self):
+        """Carrega estado de todos os tokens do Redis (1 round-trip)"""
+        client = await self._get_redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for i in range(self.size):
+                pipe.hgetall(self._key(i))
+                pipe.get(f"{self._key(i)}:inflight")
+            rows = await pipe.execute()
+        except Exception as e:
+            self._redis_failed(e)
+            return
+
+        for i, state in enumerate(self._state):
+            row, inflight = rows[2 * i], rows[2 * i + 1]
+            for field in ("exhausted_until", "error_rate", "last_error", "latency"):
+                value = row.get(field.encode()) if row else None
+                state[field] = float(value) if value is not None else 0.0
+            state["inflight"] = float(inflight) if inflight is not None else 0.0
+
+    async def _write(self, index: int, fields: Dict[str, float], inflight_delta: int = 0):
+        client = await self._get_redis()
+        if client is None:
+            return
+        try:
+            key = self._key(index)
+            pipe = client.pipeline(transaction=False)
+            if fields:
+                pipe.hset(key, mapping=fields)
+                pipe.expire(key, STATE_TTL_SECONDS)
+            if inflight_delta:
+                # Contador separado com TTL curto: runs de um processo morto expiram
+                pipe.incrby(f"{key}:inflight", inflight_delta)
+                pipe.expire(f"{key}:inflight", INFLIGHT_TTL_SECONDS)
+            await pipe.execute()
+        except Exception as e:
+            self._redis_failed(e)
+
+    # ------------------------------------------------------------------
+    # Seleção
+    # ------------------------------------------------------------------
+
+    def _is_healthy(self, index: int, now: float) -> bool:
+        state = self._state[index]
+        if state["exhausted_until"] > now:
+            return False
+        return state["error_rate"] < ERROR_RATE_UNHEALTHY or now - state["last_error"] > ERROR_COOLDOWN_SECONDS
+
+    def _score(self, index: int) -> float:
+        state = self._state[index]
+        return (
+            max(state["inflight"], 0.0)
+            + state["error_rate"] * ERROR_PENALTY
+            + state["latency"] * LATENCY_WEIGHT
+        )
+
+    async def acquire(self, exclude: Optional[Set[int]] = None) -> Optional[int]:
+        """
+        Escolhe o token menos carregado entre os saudáveis e marca como em voo.
+
+        Returns:
+            Índice do token ou None se não houver token disponível
+        """
+        await self._refresh()
+        now = time.time()
+        exclude = exclude or set()
+
+        candidates = [i for i in range(self.size) if i not in exclude and self._state[i]["exhausted_until"] <= now]
+        healthy = [i for i in candidates if self._is_healthy(i, now)]
+        # Tokens com muitos erros (mas não esgotados) ainda servem de último recurso
+        pool = healthy or candidates
+        if not pool:
+            return None
+
+        best = min(self._score(i) for i in pool)
+        index = random.choice([i for i in pool if self._score(i) == best])
+
+        self._state[index]["inflight"] += 1
+        await self._write(index, {}, inflight_delta=1)
+        return index
+
+    async def release(self, index: int, ok: Optional[bool], duration: Optional[float] = None):
+        """
+        Libera o token e atualiza error_rate/latência (EWMA)
+
+        Args:
+            ok: True = sucesso, False = falha do token (is_token_failure),
+                None = não conta (erro de conteúdo, run cancelado)
+            duration: Duração do run (só em sucesso)
+        """
+        state = self._state[index]
+        state["inflight"] = max(state["inflight"] - 1, 0.0)
+        if ok is False:
+            state["last_error"] = time.time()
+        if not ok:
+            duration = None
+
+        client = await self._get_redis()
+        if client is not None:
+            try:
+                if self._release_script is None:
+                    self._release_script = client.register_script(RELEASE_SCRIPT)
+                key = self._key(index)
+                rate, latency = await self._release_script(
+                    keys=[key, f"{key}:inflight"],
+                    args=[
+                        EWMA_ALPHA,
+                        -1 if ok is None else int(not ok),
+                        -1 if duration is None else round(duration, 2),
+                        state["last_error"],
+                        STATE_TTL_SECONDS,
+                        INFLIGHT_TTL_SECONDS,
+                    ],
+                )
+                state["error_rate"], state["latency"] = float(rate), float(latency)
+                return
+            except Exception as e:
+                self._redis_failed(e)
+
+        # Sem Redis: só o estado local
+        if ok is not None:
+            state["error_rate"] = (1 - EWMA_ALPHA) * state["error_rate"] + EWMA_ALPHA * (0.0 if ok else 1.0)
+        if duration is not None:
+            state["latency"] = duration if not state["latency"] else (
+                (1 - EWMA_ALPHA) * state["latency"] + EWMA_ALPHA * duration
+            )
+
+    async def mark_exhausted(self, index: int):
+        """Token atingiu o limite mensal - fora da seleção até o reset do billing (ou do re-teste)"""
+        day = self.reset_days[index]
+        reset_at = next_billing_reset(day=day) if day else time.time() + EXHAUSTED_PROBE_SECONDS
+        state = self._state[index]
+        state["inflight"] = max(state["inflight"] - 1, 0.0)
+        state["exhausted_until"] = reset_at
+
+        reset_str = datetime.fromtimestamp(reset_at, tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
+        if day:
+            logger.warning(f"🪫 Token Apify #{index + 1} esgotado até o reset do billing ({reset_str} UTC)")
+        else:
+            logger.warning(f"🪫 Token Apify #{index + 1} esgotado - novo teste em {reset_str} UTC")
+        await self._write(index, {"exhausted_until": reset_at}, inflight_delta=-1)
+
+    async def stats(self) -> List[Dict]:
+        await self._refresh()
+        now = time.time()
+        return [
+            {
+                "token": f"#{i + 1}",
+                "fingerprint": self.fingerprints[i],
+                "reset_day": self.reset_days[i],
+                "healthy": self._is_healthy(i, now),
+                "exhausted_until": (
+                    datetime.fromtimestamp(state["exhausted_until"], tz=timezone.utc).isoformat()
+                    if state["exhausted_until"] > now else None
+                ),
+                "error_rate": round(state["error_rate"], 3),
+                "latency_s": round(state["latency"], 1),
+                "inflight": int(max(state["inflight"], 0)),
+            }
+            for i, state in enumerate(self._state)
+        ]
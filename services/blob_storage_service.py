@@ -0,0 +1,332 @@
+"""
+Storage de vídeos endereçado por conteúdo (deduplicado entre usuários).
+
+Antes cada bookmark tinha sua cópia em user-videos/{user_id}/{bookmark_id}.mp4
+- um reel viral salvo por 50 usuários = 50 uploads e 50 cópias no bucket.
+
+Agora:
+- Objeto único por conteúdo: user-videos/blobs/{sha256}.mp4
+- Tabela video_blobs (sha256, path, tamanho, url_key, ref_count)
+- Bookmark guarda só a referência (bookmarks.video_blob_sha256); o ref_count
+  é mantido por trigger no banco (migrations/add_video_blobs.sql)
+- Blob já existente = upload pulado; blob conhecido pela chave canônica da
+  URL = download pulado também. A chave inclui a variante
+  (`blob_url_key`: qualidade + original/transcodificado) e só downloads
+  originais são reaproveitados por URL
+- GC (tasks.gc_video_blobs_task) apaga blobs sem referência há mais de
+  BLOB_GC_GRACE_HOURS: marca as linhas, apaga os objetos e só então as
+  linhas. Conteúdo re-enviado enquanto o GC trabalha vai para um path novo
+  (blobs/{sha256}-<geração>.mp4), então o GC nunca apaga o objeto recém-enviado
+- store_from_url: download → upload em streaming (TUS, services/resumable_upload)
+  sem arquivo local; o hash é calculado no caminho e o objeto enviado para
+  blobs/incoming/ é promovido para blobs/{sha256}.mp4 no fim
+
+Métodos são síncronos (usados direto pelo Celery). Em código async, chamar
+via run_blocking("storage", ...): a transferência (minutos) fica no pool e
+no limite "storage"; só as chamadas curtas (RPC, tabela, metadados do
+storage) pegam vaga do limite "supabase", aqui dentro.
+"""
+import os
+import uuid
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from services.analysis_cache import file_content_hash
+from services.download_service import download_service
+from services.rate_limiter import rate_limiter
+from services.resumable_upload import ResumableUpload
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "user-videos"
+BLOB_PREFIX = "blobs"
+INCOMING_PREFIX = f"{BLOB_PREFIX}/incoming"  # Uploads em streaming antes do hash ser conhecido
+TABLE = "video_blobs"
+SIGNED_URL_EXPIRES = 31536000  # 1 ano
+GC_GRACE_HOURS = int(os.getenv("BLOB_GC_GRACE_HOURS", "24"))
+GC_BATCH_SIZE = int(os.getenv("BLOB_GC_BATCH_SIZE", "100"))
+
+
+def blob_url_key(url_key: str, quality: str, transcoded: bool = False) -> str:
+    """url_key do blob: mesma URL em outra qualidade ou re-encodada é outro conteúdo"""
+    return f"{url_key}@{quality}/{'transcoded' if transcoded else 'original'}"
+
+
+def blob_path(sha256: str, generation: Optional[str] = None) -> str:
+    """Path do blob no bucket (geração: re-upload enquanto o GC apaga o path antigo)"""
+    if generation:
+        return f"{BLOB_PREFIX}/{sha256}-{generation}.mp4"
+    return f"{BLOB_PREFIX}/{sha256}.mp4"
+
+
+class BlobStorageService:
+    def __init__(self):
+        self._supabase = None
+        self.stats = {"uploads": 0, "streamed": 0, "dedup_hits": 0, "url_key_hits": 0, "gc_deleted": 0, "errors": 0}
+
+    def _get_supabase(self):
+        if self._supabase is None:
+            supabase_url = os.getenv("SUPABASE_URL")
+            supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+            if not supabase_url or not supabase_key:
+                raise ValueError("SUPABASE_URL e SUPABASE_SERVICE_ROLE_KEY são obrigatórios")
+            from supabase import create_client
+            self._supabase = create_client(supabase_url, supabase_key)
+        return self._supabase
+
+    # ------------------------------------------------------------------
+    # Referências
+    # ------------------------------------------------------------------
+
+    def _reference(self, bookmark_id: str, sha256: str) -> Optional[str]:
+        """Aponta o bookmark para o blob; retorna o storage_path (None se o blob não existe mais ou o GC está apagando)"""
+        with rate_limiter.limit_sync("supabase"):
+            response = self._get_supabase().rpc('reference_video_blob', {
+                'p_bookmark_id': bookmark_id,
+                'p_sha256': sha256,
+            }).execute()
+        return response.data or None
+
+    def _upload_path(self, sha256: str) -> str:
+        """
+        Path para enviar um blob que _reference recusou. Linha ainda existente =
+        GC marcou e está apagando o objeto do path antigo: usa path novo.
+        """
+        with rate_limiter.limit_sync("supabase"):
+            response = self._get_supabase().table(TABLE).select('sha256') \
+                .eq('sha256', sha256).not_.is_('gc_claimed_at', 'null').limit(1).execute()
+        if response.data:
+            logger.info(f"🗑️ Blob {sha256[:12]} sendo coletado pelo GC - re-upload em path novo")
+            return blob_path(sha256, uuid.uuid4().hex[:8])
+        return blob_path(sha256)
+
+    def _signed_url(self, path: str) -> str:
+        with rate_limiter.limit_sync("supabase"):
+            signed = self._get_supabase().storage.from_(BUCKET).create_signed_url(
+                path=path,
+                expires_in=SIGNED_URL_EXPIRES
+            )
+        cloud_url = signed.get("signedURL") if signed else None
+        if not cloud_url:
+            raise Exception("Falha ao gerar Signed URL")
+        return cloud_url
+
+    def _drop_legacy_copy(self, user_id: Optional[str], bookmark_id: str):
+        """Remove a cópia antiga por usuário ({user_id}/{bookmark_id}.mp4), se existir"""
+        if not user_id:
+            return
+        try:
+            with rate_limiter.limit_sync("supabase"):
+                self._get_supabase().storage.from_(BUCKET).remove([f"{user_id}/{bookmark_id}.mp4"])
+        except Exception as e:
+            logger.debug(f"Cópia legada não removida ({bookmark_id}): {str(e)[:80]}")
+
+    def _result(self, blob: Dict, deduplicated: bool) -> Dict:
+        return {
+            "sha256": blob["sha256"],
+            "storage_path": blob["storage_path"],
+            "size_bytes": blob.get("size_bytes"),
+            "cloud_url": self._signed_url(blob["storage_path"]),
+            "deduplicated": deduplicated,
+        }
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def attach_by_url_key(self, bookmark_id: str, url_key: Optional[str], quality: str,
+                          user_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Reaproveita download original já enviado para a mesma URL e qualidade
+        (sem baixar nada). Cópias transcodificadas nunca são reaproveitadas aqui.
+
+        Returns:
+            Dict (sha256, storage_path, size_bytes, cloud_url, deduplicated) ou
+            None se nenhum blob conhecido para essa URL
+        """
+        if not url_key:
+            return None
+        url_key = blob_url_key(url_key, quality)
+        try:
+            with rate_limiter.limit_sync("supabase"):
+                response = self._get_supabase().table(TABLE).select(
+                    'sha256, storage_path, size_bytes'
+                ).eq('url_key', url_key).order('last_referenced_at', desc=True).limit(1).execute()
+            if not response.data:
+                return None
+
+            blob = response.data[0]
+            storage_path = self._reference(bookmark_id, blob["sha256"])
+            if not storage_path:
+                return None
+            blob["storage_path"] = storage_path
+
+            self.stats["url_key_hits"] += 1
+            self._drop_legacy_copy(user_id, bookmark_id)
+            logger.info(f"♻️ Blob reaproveitado por URL ({url_key}): {blob['storage_path']}")
+            return self._result(blob, deduplicated=True)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"⚠️ Busca de blob por URL falhou ({url_key}): {str(e)[:100]}")
+            return None
+
+    def store_file(self, local_path: str, bookmark_id: str, url_key: Optional[str] = None,
+                   user_id: Optional[str] = None) -> Dict:
+        """
+        Guarda arquivo local como blob e referencia no bookmark
+
+        Upload só acontece se o conteúdo (SHA-256) ainda não está no bucket.
+
+        Returns:
+            Dict (sha256, storage_path, size_bytes, cloud_url, deduplicated)
+        """
+        supabase = self._get_supabase()
+        sha256 = file_content_hash(local_path)
+        size_bytes = os.path.getsize(local_path)
+
+        existing_path = self._reference(bookmark_id, sha256)
+        if existing_path:
+            self.stats["dedup_hits"] += 1
+            logger.info(f"♻️ Blob já existe, upload pulado: {existing_path}")
+            self._drop_legacy_copy(user_id, bookmark_id)
+            blob = {"sha256": sha256, "storage_path": existing_path, "size_bytes": size_bytes}
+            return self._result(blob, deduplicated=True)
+
+        path = self._upload_path(sha256)
+        blob = {"sha256": sha256, "storage_path": path, "size_bytes": size_bytes}
+
+        # Upload antes do registro: linha em video_blobs sempre aponta para objeto existente
+        with open(local_path, "rb") as video_file:
+            supabase.storage.from_(BUCKET).upload(
+                path=path,
+                file=video_file,
+                file_options={"content-type": "video/mp4", "upsert": "true"}
+            )
+        self.stats["uploads"] += 1
+        logger.info(f"✅ Blob enviado: {path} ({size_bytes / (1024 * 1024):.2f}MB)")
+        return self._register(blob, bookmark_id, url_key, user_id)
+
+    def store_from_url(self, download_url: str, bookmark_id: str, url_key: Optional[str] = None,
+                       user_id: Optional[str] = None) -> Dict:
+        """
+        Baixa e envia o vídeo em streaming, sem arquivo local
+
+        Memória limitada a ~1 chunk TUS (6MB) por transferência. Usar quando
+        nenhuma etapa seguinte precisa do arquivo (ffmpeg, análise local).
+
+        Returns:
+            Dict (sha256, storage_path, size_bytes, cloud_url, deduplicated)
+        """
+        supabase = self._get_supabase()
+        staging_path = f"{INCOMING_PREFIX}/{uuid.uuid4().hex}.mp4"
+        digest = hashlib.sha256()
+        upload = None
+
+        try:
+            with download_service.stream(download_url) as stream:
+                upload = ResumableUpload(BUCKET, staging_path, total_size=stream.total_size)
+                for chunk in stream:
+                    digest.update(chunk)
+                    upload.write(chunk)
+                size_bytes = upload.finish()
+        except Exception:
+            if upload is not None:
+                upload.abort()
+            raise
+
+        sha256 = digest.hexdigest()
+        self.stats["streamed"] += 1
+        logger.info(f"✅ Vídeo enviado em streaming: {size_bytes / (1024 * 1024):.2f}MB (sha256 {sha256[:12]})")
+
+        existing_path = self._reference(bookmark_id, sha256)
+        if existing_path:
+            self.stats["dedup_hits"] += 1
+            logger.info(f"♻️ Blob já existia, descartando cópia enviada: {existing_path}")
+            self._remove_quietly(staging_path)
+            self._drop_legacy_copy(user_id, bookmark_id)
+            blob = {"sha256": sha256, "storage_path": existing_path, "size_bytes": size_bytes}
+            return self._result(blob, deduplicated=True)
+
+        path = self._upload_path(sha256)
+        blob = {"sha256": sha256, "storage_path": path, "size_bytes": size_bytes}
+
+        # Promove incoming/<uuid> → blobs/<sha256> (move no servidor, sem reenviar bytes)
+        try:
+            with rate_limiter.limit_sync("supabase"):
+                supabase.storage.from_(BUCKET).move(staging_path, path)
+        except Exception as e:
+            # Outro worker promoveu o mesmo conteúdo antes: objeto final já existe
+            if not self._object_exists(path):
+                raise Exception(f"Falha ao promover blob {sha256[:12]}: {str(e)[:100]}")
+            self._remove_quietly(staging_path)
+
+        return self._register(blob, bookmark_id, url_key, user_id)
+
+    def _register(self, blob: Dict, bookmark_id: str, url_key: Optional[str], user_id: Optional[str]) -> Dict:
+        """Registra blob recém-enviado em video_blobs e referencia no bookmark"""
+        row = {**blob, "gc_claimed_at": None}  # Re-upload durante o GC: a linha fica
+        if url_key:
+            row["url_key"] = url_key
+        with rate_limiter.limit_sync("supabase"):
+            self._get_supabase().table(TABLE).upsert(row, on_conflict='sha256').execute()
+
+        if not self._reference(bookmark_id, blob["sha256"]):
+            raise Exception(f"Blob {blob['sha256'][:12]} sumiu logo após o registro")
+
+        self._drop_legacy_copy(user_id, bookmark_id)
+        return self._result(blob, deduplicated=False)
+
+    def _object_exists(self, path: str) -> bool:
+        folder, name = path.rsplit("/", 1)
+        with rate_limiter.limit_sync("supabase"):
+            items = self._get_supabase().storage.from_(BUCKET).list(folder, {"search": name, "limit": 1})
+        return any(item.get("name") == name for item in (items or []))
+
+    def _remove_quietly(self, path: str):
+        try:
+            with rate_limiter.limit_sync("supabase"):
+                self._get_supabase().storage.from_(BUCKET).remove([path])
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível remover {path}: {str(e)[:80]}")
+
+    def collect_garbage(self, limit: int = GC_BATCH_SIZE) -> Dict:
+        """
+        Apaga blobs sem referência há mais de BLOB_GC_GRACE_HOURS
+
+        Objeto antes da linha: enquanto a linha está marcada, nenhum bookmark
+        passa a referenciá-la e re-uploads vão para outro path.
+        """
+        supabase = self._get_supabase()
+        response = supabase.rpc('claim_orphan_video_blobs', {
+            'p_grace_hours': GC_GRACE_HOURS,
+            'p_limit': limit,
+        }).execute()
+        claimed = {row['blob_sha256']: row['blob_path'] for row in (response.data or [])}
+
+        paths = []
+        if claimed:
+            supabase.storage.from_(BUCKET).remove(list(claimed.values()))
+            finished = supabase.rpc('finish_video_blob_gc', {'p_sha256s': list(claimed)}).execute()
+            deleted = [row if isinstance(row, str) else row.get('finish_video_blob_gc') for row in (finished.data or [])]
+            paths = [claimed[sha256] for sha256 in deleted if sha256 in claimed]
+            self.stats["gc_deleted"] += len(paths)
+            logger.info(f"🗑️ GC de blobs: {len(paths)} vídeo(s) sem referência apagado(s)")
+
+        # Uploads em streaming interrompidos antes da promoção
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=GC_GRACE_HOURS)
+        stale = []
+        for item in supabase.storage.from_(BUCKET).list(INCOMING_PREFIX, {"limit": limit}) or []:
+            created_at = item.get("created_at")
+            if created_at and datetime.fromisoformat(created_at.replace("Z", "+00:00")) < cutoff:
+                stale.append(f"{INCOMING_PREFIX}/{item['name']}")
+        if stale:
+            supabase.storage.from_(BUCKET).remove(stale)
+            logger.info(f"🗑️ GC de blobs: {len(stale)} upload(s) incompleto(s) apagado(s)")
+
+        return {"deleted": len(paths), "paths": paths, "incoming_deleted": len(stale)}
+
+
+# Singleton instance
+blob_storage_service = BlobStorageService()
@@ -7,15 +7,29 @@ Usa OpenAI para embeddings (text-embedding-3-small, 1536 dims).
 
 from supabase import create_client, Client
 from typing import List, Dict, Any, Optional
+from collections import OrderedDict
 import os
-from openai import OpenAI
+import re
+import time
+import asyncio
+import unicodedata
+import httpx
+from openai import AsyncOpenAI
 import replicate
+from services.http_client_pool import http_client_pool
+from services.vector_index_service import vector_index_service, parse_embedding
+from services.neighbor_graph_service import neighbor_graph_service
+from services.executor_service import run_blocking, execute_async
+from services.rate_limiter import rate_limiter
 
 # Configuração
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")  # NUNCA hardcode esta chave!
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
+EMBEDDING_MODEL = "text-embedding-3-small"
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "86400"))
 
 # Validação
 if not SUPABASE_URL or not SUPABASE_KEY:
@@ -26,28 +40,85 @@ if not OPENAI_API_KEY:
 
 # Clientes globais
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# OpenAI async sobre o cliente HTTP compartilhado (keep-alive/TLS reaproveitados, um por event loop)
+http_client_pool.register("openai", httpx.Timeout(30.0, connect=5.0), max_connections=20)
+_openai_clients: Dict[asyncio.AbstractEventLoop, AsyncOpenAI] = {}
 replicate_client = replicate.Client(api_token=REPLICATE_API_TOKEN) if REPLICATE_API_TOKEN else None
 
 
-async def generate_embedding(text: str) -> List[float]:
+def normalize_query(text: str) -> str:
     """
-    Gera embedding usando OpenAI text-embedding-3-small.
+    Normaliza query para chave de cache.
 
-    Vantagens:
-    - Alta qualidade e precisão
-    - Suporta 100+ idiomas (incluindo português)
-    - 1536 dimensões
-    - API estável e confiável
+    "  Transições  Escuras?" e "transições escuras" viram a mesma chave.
+    Acentos são mantidos (mudam o significado em português).
     """
-    if not openai_client:
-        raise ValueError("OpenAI client não inicializado!")
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(" ?!.,;:")
+
+
+class QueryEmbeddingCache:
+    """LRU com TTL para embeddings de queries do chat (por processo)"""
+
+    def __init__(self, max_items: int = QUERY_CACHE_SIZE, ttl_seconds: int = QUERY_CACHE_TTL_SECONDS):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()  # chave → (expira_em, embedding)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, embedding = item
+        if time.time() > expires_at:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return embedding
+
+    def set(self, key: str, embedding: List[float]):
+        self._items[key] = (time.time() + self.ttl_seconds, embedding)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache()
 
-    # Chama OpenAI API
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
+
+def get_openai_client() -> AsyncOpenAI:
+    """Cliente OpenAI do event loop atual (httpx do http_client_pool)"""
+    http_client = http_client_pool.get("openai")
+    loop = asyncio.get_running_loop()
+    client = _openai_clients.get(loop)
+    if client is None or client._client is not http_client:
+        for closed in [l for l in _openai_clients if l.is_closed()]:
+            _openai_clients.pop(closed, None)
+        client = _openai_clients[loop] = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+    return client
+
+
+async def _create_embedding(text: str) -> List[float]:
+    async with rate_limiter.limit("openai"):
+        response = await get_openai_client().embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=text
+        )
 
     # Extrai embedding (1536 dimensões)
     embedding = response.data[0].embedding
@@ -58,7 +129,62 @@ async def generate_embedding(text: str) -> List[float]:
     return embedding
 
 
-async def search_bookmarks(query: str, limit: int = 10, threshold: float = 0.3) -> List[Dict[str, Any]]:
+async def generate_embedding(text: str) -> List[float]:
+    """
+    Gera embedding usando OpenAI text-embedding-3-small.
+
+    Vantagens:
+    - Alta qualidade e precisão
+    - Suporta 100+ idiomas (incluindo português)
+    - 1536 dimensões
+    - API estável e confiável
+
+    Queries repetidas (após normalização) saem do cache sem rede;
+    queries idênticas simultâneas compartilham a mesma chamada.
+    """
+    # Chave normalizada só para o cache - a API recebe o texto original do usuário
+    key = normalize_query(text) or text
+
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        query_embedding_cache.hits += 1
+        return cached
+
+    inflight = query_embedding_cache._inflight.get(key)
+    if inflight is not None:
+        query_embedding_cache.coalesced += 1
+        return await asyncio.shield(inflight)
+
+    query_embedding_cache.misses += 1
+    future = asyncio.get_event_loop().create_future()
+    query_embedding_cache._inflight[key] = future
+    try:
+        embedding = await _create_embedding(text)
+        query_embedding_cache.set(key, embedding)
+        future.set_result(embedding)
+        return embedding
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Marca como recuperada (evita warning sem aguardadores)
+        raise
+    finally:
+        query_embedding_cache._inflight.pop(key, None)
+
+
+def get_chat_stats() -> Dict[str, Any]:
+    """Métricas do cache de queries e do índice vetorial local"""
+    return {
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "vector_index": vector_index_service.stats(),
+    }
+
+
+async def search_bookmarks(
+    query: str,
+    limit: int = 10,
+    threshold: float = 0.3,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
     """
     Busca bookmarks semanticamente similares à query.
 
@@ -66,6 +192,7 @@ async def search_bookmarks(query: str, limit: int = 10, threshold: float = 0.3)
         query: Texto da busca (pergunta do usuário)
         limit: Quantos resultados retornar
         threshold: Limiar de similaridade (0-1)
+        user_id: ID do usuário (se informado, usa índice vetorial local em memória)
 
     Returns:
         Lista de bookmarks com similarity score
@@ -73,21 +200,42 @@ async def search_bookmarks(query: str, limit: int = 10, threshold: float = 0.3)
     # Gera embedding da query via OpenAI API
     query_embedding = await generate_embedding(query)
 
+    return await search_by_embedding(query_embedding, limit=limit, threshold=threshold, user_id=user_id)
+
+
+async def search_by_embedding(
+    query_embedding: List[float],
+    limit: int = 10,
+    threshold: float = 0.3,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Busca vetorial a partir de um embedding já calculado.
+
+    Com user_id: lookup no índice local do usuário (sub-milissegundo).
+    Sem user_id (ou índice indisponível): RPC search_bookmarks_semantic no Supabase.
+    """
+    if user_id:
+        local_results = await vector_index_service.search(user_id, query_embedding, limit, threshold)
+        if local_results is not None:
+            return local_results
+
     # Busca no Supabase usando função SQL
-    response = supabase.rpc(
-        'search_bookmarks_semantic',
-        {
-            'query_embedding': query_embedding,
-            'match_threshold': threshold,
-            'match_count': limit
-        }
-    ).execute()
+    rpc_params = {
+        'query_embedding': query_embedding,
+        'match_threshold': threshold,
+        'match_count': limit
+    }
+    if user_id:
+        rpc_params['filter_user_id'] = user_id
+
+    response = await execute_async(supabase.rpc('search_bookmarks_semantic', rpc_params))
 
     # Retorna resultados
     return response.data if response.data else []
 
 
-def get_full_bookmark_data(bookmark_ids: List[str]) -> List[Dict[str, Any]]:
+async def get_full_bookmark_data(bookmark_ids: List[str]) -> List[Dict[str, Any]]:
     """
     Busca dados completos dos bookmarks (incluindo tags, categorias, etc).
 
@@ -100,7 +248,7 @@ def get_full_bookmark_data(bookmark_ids: List[str]) -> List[Dict[str, Any]]:
     if not bookmark_ids:
         return []
 
-    response = supabase.table('bookmarks').select('*').in_('id', bookmark_ids).execute()
+    response = await execute_async(supabase.table('bookmarks').select('*').in_('id', bookmark_ids))
 
     # DEBUG: Log thumbnails
     if response.data:
@@ -111,6 +259,28 @@ def get_full_bookmark_data(bookmark_ids: List[str]) -> List[Dict[str, Any]]:
     return response.data if response.data else []
 
 
+async def forget_deleted_bookmarks(user_id: Optional[str], bookmark_ids: List[str], full_bookmarks: List[Dict[str, Any]]):
+    """
+    Bookmarks apagados direto no Supabase (pelo cliente) continuam nos
+    índices até alguém notar - a busca devolve o ID e a leitura não o acha.
+    Remove esses IDs do índice vetorial de todos os processos e das listas
+    de vizinhos pré-computadas.
+    """
+    if not user_id:
+        return
+    found = {b['id'] for b in full_bookmarks}
+    missing = [bid for bid in bookmark_ids if bid not in found]
+    if not missing:
+        return
+
+    print(f"🧹 {len(missing)} bookmark(s) apagado(s) ainda indexado(s) - removendo")
+    try:
+        await run_blocking("default", vector_index_service.publish_removal, user_id, missing)
+        await run_blocking("supabase", neighbor_graph_service.remove_bookmarks, user_id, missing)
+    except Exception as e:
+        print(f"⚠️ Falha ao remover bookmarks apagados dos índices: {e}")
+
+
 def format_bookmark_for_llm(bookmark: Dict[str, Any]) -> str:
     """
     Formata bookmark para enviar à IA (texto compacto e rico).
@@ -161,6 +331,11 @@ async def find_similar_bookmarks(
     """
     Encontra bookmarks similares a um bookmark específico.
 
+    Ordem de tentativa:
+    1. Grafo de vizinhos pré-computado (bookmark_neighbors) - leitura indexada
+    2. Embedding já salvo do bookmark de referência + busca vetorial do usuário
+    3. Fallback textual (bookmark ainda sem embedding)
+
     Args:
         bookmark_id: ID do bookmark de referência
         user_id: ID do usuário (para filtrar apenas seus bookmarks)
@@ -170,15 +345,63 @@ async def find_similar_bookmarks(
     Returns:
         Lista de bookmarks similares ordenados por relevância
     """
-    # 1. Busca o bookmark de referência
-    ref_bookmark = supabase.table('bookmarks').select('*').eq('id', bookmark_id).single().execute()
+    # 1. Vizinhos pré-computados
+    search_results = None
+    try:
+        neighbors = await run_blocking("supabase", neighbor_graph_service.get_neighbors, bookmark_id, user_id)
+        if neighbors is not None:
+            search_results = [n for n in neighbors if n.get('similarity', 0) > threshold]
+            print(f"🕸️ Vizinhos pré-computados: {len(search_results)} acima de {threshold}")
+    except Exception as e:
+        print(f"⚠️ Grafo de vizinhos indisponível: {e}")
+
+    if search_results is None:
+        # 2. Busca o bookmark de referência (só o necessário)
+        ref_bookmark = await execute_async(supabase.table('bookmarks').select(
+            'id, user_id, title, user_context_processed, auto_description, tags, auto_tags, categories, auto_categories, embedding'
+        ).eq('id', bookmark_id).eq('user_id', user_id).single())
+
+        if not ref_bookmark.data:
+            return []
+
+        ref = ref_bookmark.data
+        ref_embedding = parse_embedding(ref.get('embedding'))
+
+        print(f"🔍 Buscando similares para: '{(ref.get('title') or 'N/A')[:50]}...'")
+        if ref_embedding:
+            # Usa o embedding salvo - sem nova chamada à API de embeddings
+            search_results = await search_by_embedding(
+                ref_embedding, limit=max_results + 1, threshold=threshold, user_id=user_id
+            )
+        else:
+            # 3. Fallback: bookmark ainda sem embedding, monta query textual
+            search_query = _build_similarity_query(ref)
+            if not search_query:
+                return []
+            search_results = await search_bookmarks(search_query, limit=max_results + 1, threshold=threshold, user_id=user_id)
+
+    # Remove o próprio bookmark dos resultados
+    filtered_results = [r for r in search_results if r.get('id') != bookmark_id][:max_results]
 
-    if not ref_bookmark.data:
+    # Busca dados completos
+    if not filtered_results:
         return []
 
-    ref = ref_bookmark.data
+    bookmark_ids = [r['id'] for r in filtered_results]
+    full_bookmarks = await get_full_bookmark_data(bookmark_ids)
+    await forget_deleted_bookmarks(user_id, bookmark_ids, full_bookmarks)
+
+    # Ordena pelos IDs originais (mantém ordem de relevância) - só bookmarks do usuário
+    id_to_bookmark = {b['id']: b for b in full_bookmarks if b.get('user_id') == user_id}
+    user_bookmarks = [id_to_bookmark[bid] for bid in bookmark_ids if bid in id_to_bookmark]
+
+    print(f"✅ Encontrados: {len(user_bookmarks)} similares")
+
+    return user_bookmarks
+
 
-    # 2. Cria query de busca combinando múltiplos campos
+def _build_similarity_query(ref: Dict[str, Any]) -> str:
+    """Combina título, contexto, descrição, tags e categorias em uma query textual"""
     search_parts = []
 
     # Título
@@ -194,56 +417,23 @@ async def find_similar_bookmarks(
         search_parts.append(ref['auto_description'])
 
     # Tags (manual + auto)
-    all_tags = []
-    if ref.get('tags'):
-        all_tags.extend(ref['tags'])
-    if ref.get('auto_tags'):
-        all_tags.extend(ref['auto_tags'])
+    all_tags = (ref.get('tags') or []) + (ref.get('auto_tags') or [])
     if all_tags:
         search_parts.append(' '.join(all_tags))
 
     # Categorias (manual + auto)
-    all_categories = []
-    if ref.get('categories'):
-        all_categories.extend(ref['categories'])
-    if ref.get('auto_categories'):
-        all_categories.extend(ref['auto_categories'])
+    all_categories = (ref.get('categories') or []) + (ref.get('auto_categories') or [])
     if all_categories:
         search_parts.append(' '.join(all_categories))
 
-    # Combina tudo
-    search_query = ' '.join(search_parts)
-
-    # 3. Busca semântica
-    print(f"🔍 Buscando similares para: '{ref.get('title', 'N/A')[:50]}...'")
-    search_results = await search_bookmarks(search_query, limit=max_results + 1, threshold=threshold)
-
-    # 4. Remove o próprio bookmark dos resultados
-    filtered_results = [r for r in search_results if r.get('id') != bookmark_id][:max_results]
-
-    # 5. Busca dados completos
-    if not filtered_results:
-        return []
-
-    bookmark_ids = [r['id'] for r in filtered_results]
-    full_bookmarks = get_full_bookmark_data(bookmark_ids)
-
-    # Ordena pelos IDs originais (mantém ordem de relevância)
-    id_to_bookmark = {b['id']: b for b in full_bookmarks}
-    sorted_bookmarks = [id_to_bookmark[bid] for bid in bookmark_ids if bid in id_to_bookmark]
-
-    # Filtra apenas bookmarks do mesmo usuário
-    user_bookmarks = [b for b in sorted_bookmarks if b.get('user_id') == user_id]
-
-    print(f"✅ Encontrados: {len(user_bookmarks)} similares")
-
-    return user_bookmarks
+    return ' '.join(search_parts)
 
 
 async def chat_with_ai(
     user_message: str,
     conversation_history: Optional[List[Dict[str, str]]] = None,
-    max_bookmarks: int = 10
+    max_bookmarks: int = 10,
+    user_id: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Processa mensagem do usuário e retorna resposta com bookmarks relevantes.
@@ -252,6 +442,7 @@ async def chat_with_ai(
         user_message: Mensagem/pergunta do usuário
         conversation_history: Histórico da conversa (opcional)
         max_bookmarks: Máximo de bookmarks para buscar
+        user_id: ID do usuário (opcional - habilita índice vetorial local)
 
     Returns:
         {
@@ -263,7 +454,7 @@ async def chat_with_ai(
 
     # 1. Busca semântica
     print(f"🔍 Buscando bookmarks para: '{user_message}'")
-    search_results = await search_bookmarks(user_message, limit=max_bookmarks, threshold=0.3)
+    search_results = await search_bookmarks(user_message, limit=max_bookmarks, threshold=0.3, user_id=user_id)
 
     if not search_results:
         return {
@@ -276,7 +467,8 @@ async def chat_with_ai(
 
     # 2. Busca dados completos
     bookmark_ids = [r['id'] for r in search_results]
-    full_bookmarks = get_full_bookmark_data(bookmark_ids)
+    full_bookmarks = await get_full_bookmark_data(bookmark_ids)
+    await forget_deleted_bookmarks(user_id, bookmark_ids, full_bookmarks)
 
     # Ordena pelos IDs originais (mantém ordem de relevância)
     id_to_bookmark = {b['id']: b for b in full_bookmarks}
@@ -310,15 +502,16 @@ Analise esses bookmarks e responda ao usuário de forma conversacional, destacan
     # 5. Chama OpenAI GPT-4 para gerar resposta conversacional
     try:
         # Chama OpenAI Chat Completion API
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",  # Mais rápido e barato que GPT-4
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=1024,
-            temperature=0.7,
-        )
+        async with rate_limiter.limit("openai"):
+            response = await get_openai_client().chat.completions.create(
+                model="gpt-4o-mini",  # Mais rápido e barato que GPT-4
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=1024,
+                temperature=0.7,
+            )
 
         # Extrai resposta
         ai_message = response.choices[0].message.content
@@ -13,6 +13,8 @@ import replicate
 from typing import Optional, Dict, List
 import logging
 
+from services.executor_service import run_blocking
+
 logger = logging.getLogger(__name__)
 
 class ClaudeService:
@@ -28,6 +30,15 @@ class ClaudeService:
         # https://replicate.com/google/gemini-3-pro
         self.model_version = "google/gemini-3-pro"
 
+    def _run_model(self, model_input: Dict) -> List[str]:
+        """
+        Chamada bloqueante ao Replicate (roda no pool 'replicate').
+
+        Consome o iterator de chunks dentro da thread - iterar no event loop
+        também bloquearia, já que cada chunk vem da rede.
+        """
+        return list(self.client.run(self.model_version, input=model_input))
+
     async def process_context(
         self,
         user_context_raw: str,
@@ -79,9 +90,10 @@ class ClaudeService:
             # Chamar Gemini 3 Pro via Replicate
             # https://replicate.com/google/gemini-3-pro
             logger.info(f"🔮 Chamando Gemini 3 Pro com thinking_level=high...")
-            output = self.client.run(
-                self.model_version,
-                input={
+            output = await run_blocking(
+                "replicate",
+                self._run_model,
+                {
                     "images": [],  # Explicitamente incluir (mesmo vazio)
                     "max_output_tokens": 65535,  # Limite máximo (teste manual bem-sucedido)
                     "prompt": prompt,
@@ -272,9 +284,10 @@ RETORNE APENAS JSON (sem markdown, sem explicações):
             logger.info(f"🔮 Chamando Gemini 3 Pro (auto) com thinking_level=high...")
             logger.debug(f"🔮 DEBUG - Input parameters: max_output_tokens=65535, temperature=1, top_p=0.95, thinking_level=high, images=[], videos=[]")
 
-            output = self.client.run(
-                self.model_version,
-                input={
+            output = await run_blocking(
+                "replicate",
+                self._run_model,
+                {
                     "images": [],  # Explicitamente incluir (mesmo vazio)
                     "max_output_tokens": 65535,  # Limite máximo (teste manual bem-sucedido)
                     "prompt": prompt,
@@ -682,9 +695,10 @@ Tags principais: {tags_str}
 
             # Chamar Gemini 3 Pro (mesmo modelo usado para processamento)
             # Usa o mesmo self.model_version que já está funcionando
-            output = self.client.run(
-                self.model_version,  # "google/gemini-3-pro" (modelo que funciona)
-                input={
+            output = await run_blocking(
+                "replicate",
+                self._run_model,  # "google/gemini-3-pro" (modelo que funciona)
+                {
                     "prompt": prompt,
                     "max_output_tokens": 150,  # Título é curto
                     "temperature": 0.5,  # Baixa criatividade (consistência)
@@ -0,0 +1,331 @@
+"""
+Downloader compartilhado de vídeos (arquivo local ou stream).
+
+Antes TranscodingService, VideoStorageService e o upload do Celery tinham
+cada um seu loop de download: chunks de 8KB/64KB, cliente novo por
+tentativa e, em queda de conexão (RemoteProtocolError, comum no CDN do
+Instagram), recomeço do byte 0.
+
+Aqui:
+- Cliente "download" do http_client_pool (keep-alive entre downloads do
+  mesmo CDN)
+- Retomada via HTTP Range a partir do último byte recebido, com If-Range
+  (ETag/Last-Modified da primeira resposta): se o vídeo mudou no servidor,
+  não emenda bytes de versões diferentes
+- Arquivos grandes com Accept-Ranges: segmentos baixados em paralelo
+  (DOWNLOAD_PARALLEL_MIN_MB / DOWNLOAD_PARALLEL_SEGMENTS)
+- Arquivo gravado em `<path>.part` e renomeado só no fim (falha não deixa
+  arquivo truncado no destino)
+- Métricas de progresso e throughput (/api/download-stats)
+
+Síncrono (thread-safe): em código async, rodar via run_blocking("download", ...).
+
+Uso:
+    size = download_service.download_to_file(url, "/tmp/video.mp4")
+
+    with download_service.stream(url) as stream:
+        stream.total_size  # Content-Length (ou None)
+        for chunk in stream:
+            ...
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from services.http_client_pool import http_client_pool
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_KB", "256")) * 1024
+MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", "4"))
+PARALLEL_MIN_BYTES = int(float(os.getenv("DOWNLOAD_PARALLEL_MIN_MB", "16")) * 1024 * 1024)
+PARALLEL_SEGMENTS = int(os.getenv("DOWNLOAD_PARALLEL_SEGMENTS", "4"))
+MAX_CONNECTIONS = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "32"))
+PROGRESS_LOG_BYTES = 10 * 1024 * 1024
+
+# HTTP/1.1: com HTTP/2 os segmentos paralelos seriam multiplexados numa única
+# conexão TCP com o CDN (uma janela de congestionamento para todos)
+http_client_pool.register("download", httpx.Timeout(60.0, connect=30.0), max_connections=MAX_CONNECTIONS, http2=False)
+
+# Erros de rede em que vale retomar do offset atual
+RESUMABLE_ERRORS = (httpx.RemoteProtocolError, httpx.ReadTimeout, httpx.ReadError, httpx.ConnectTimeout, httpx.ConnectError)
+
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+def _validator(headers: httpx.Headers) -> Optional[str]:
+    """Validador para If-Range: ETag forte ou Last-Modified (ETag fraco não vale)"""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _range_headers(start: int, end: Optional[int], validator: Optional[str]) -> Dict[str, str]:
+    headers = {"Range": f"bytes={start}-{'' if end is None else end}"}
+    if validator:
+        headers["If-Range"] = validator
+    return headers
+
+
+class DownloadStream:
+    """Stream de bytes com retomada automática (usar como context manager)"""
+
+    def __init__(self, service: "DownloadService", url: str, track: bool = True):
+        self._service = service
+        self._track = track  # False = métricas contadas por quem consome (download_to_file)
+        self.url = url
+        self.total_size: Optional[int] = None
+        self.received = 0
+        self.validator: Optional[str] = None
+        self._response: Optional[httpx.Response] = None
+        self._ctx = None
+
+    def _open(self, offset: int):
+        headers = _range_headers(offset, None, self.validator) if offset else {}
+        self._ctx = self._service._get_client().stream("GET", self.url, headers=headers)
+        self._response = self._ctx.__enter__()
+        self._response.raise_for_status()
+        return self._response
+
+    def _close(self):
+        if self._ctx is not None:
+            try:
+                self._ctx.__exit__(None, None, None)
+            except Exception:
+                pass
+        self._ctx = None
+        self._response = None
+
+    def __enter__(self) -> "DownloadStream":
+        response = self._open(0)
+        length = response.headers.get("Content-Length")
+        # Content-Length só é o tamanho final sem compressão no transporte
+        if length and not response.headers.get("Content-Encoding"):
+            self.total_size = int(length)
+        self.validator = _validator(response.headers)
+        return self
+
+    def __exit__(self, *exc):
+        self._close()
+
+    def __iter__(self) -> Iterator[bytes]:
+        started = time.monotonic()
+        attempt = 0
+        skip = 0  # Servidor ignorou o Range: descarta o que já foi entregue
+        while True:
+            try:
+                if self._response is None:
+                    response = self._open(self.received)
+                    if response.status_code != 206:
+                        if self.validator and _validator(response.headers) != self.validator:
+                            raise Exception("Vídeo mudou no servidor durante o download")
+                        skip = self.received
+                for chunk in self._response.iter_bytes(chunk_size=CHUNK_SIZE):
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk = chunk[skip:]
+                        skip = 0
+                    self.received += len(chunk)
+                    yield chunk
+                if self._track:
+                    self._service._finished(self.received, started)
+                return
+            except RESUMABLE_ERRORS as e:
+                attempt += 1
+                self._close()
+                if attempt > MAX_RETRIES:
+                    if self._track:
+                        self._service._count("failed")
+                    raise
+                self._service._count("resumes")
+                wait_time = min(2 ** attempt, 10)
+                logger.warning(f"⚠️ Download interrompido em {self.received / (1024 * 1024):.1f}MB ({type(e).__name__}), retomando em {wait_time}s...")
+                time.sleep(wait_time)
+
+
+class DownloadService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._segments_pool: Optional[ThreadPoolExecutor] = None
+        self.counters = {
+            "downloads": 0,
+            "streams": 0,
+            "parallel": 0,
+            "failed": 0,
+            "resumes": 0,
+            "bytes": 0,
+            "seconds": 0.0,
+        }
+
+    def _get_client(self) -> httpx.Client:
+        return http_client_pool.get_sync("download")
+
+    def _get_segments_pool(self) -> ThreadPoolExecutor:
+        if self._segments_pool is None:
+            with self._lock:
+                if self._segments_pool is None:
+                    self._segments_pool = ThreadPoolExecutor(max_workers=PARALLEL_SEGMENTS * 2, thread_name_prefix="download-segment")
+        return self._segments_pool
+
+    def _count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _finished(self, size: int, started: float):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.counters["bytes"] += size
+            self.counters["seconds"] += elapsed
+        mbps = size / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+        logger.info(f"✅ Download concluído: {size / (1024 * 1024):.2f}MB em {elapsed:.1f}s ({mbps:.1f}MB/s)")
+
+    # ------------------------------------------------------------------
+    # Stream
+    # ------------------------------------------------------------------
+
+    def stream(self, url: str) -> DownloadStream:
+        """Stream com retomada via Range (para pipes download → upload)"""
+        self._count("streams")
+        return DownloadStream(self, url)
+
+    # ------------------------------------------------------------------
+    # Arquivo
+    # ------------------------------------------------------------------
+
+    def _probe(self, url: str) -> Tuple[Optional[int], bool, Optional[str]]:
+        """(tamanho, aceita Range, validador If-Range) via HEAD - falha = (None, False, None)"""
+        try:
+            response = self._get_client().head(url)
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            return (int(length) if length else None), accepts_ranges, _validator(response.headers)
+        except Exception:
+            return None, False, None
+
+    def _download_segment(self, url: str, path: str, start: int, end: int, validator: Optional[str], cancelled: threading.Event,
+                          progress: Optional[ProgressCallback], total: int, done: List[int]):
+        """Baixa bytes [start, end] para a posição certa do arquivo (com retomada; para se `cancelled`)"""
+        position = start
+        attempt = 0
+        with open(path, "r+b") as f:
+            while position <= end:
+                try:
+                    with self._get_client().stream("GET", url, headers=_range_headers(position, end, validator)) as response:
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            # Com If-Range, 200 = vídeo mudou desde o HEAD
+                            raise Exception("Servidor ignorou Range (ou vídeo mudou) em download segmentado")
+                        f.seek(position)
+                        for chunk in response.iter_bytes(chunk_size=CHUNK_SIZE):
+                            if cancelled.is_set():
+                                return
+                            f.write(chunk)
+                            position += len(chunk)
+                            if progress:
+                                with self._lock:
+                                    done[0] += len(chunk)
+                                    completed = done[0]
+                                progress(completed, total)
+                    if position <= end:
+                        raise httpx.RemoteProtocolError("Segmento terminou antes do fim")
+                except RESUMABLE_ERRORS:
+                    attempt += 1
+                    if attempt > MAX_RETRIES:
+                        raise
+                    self._count("resumes")
+                    if cancelled.wait(min(2 ** attempt, 10)):
+                        return
+
+    def _download_parallel(self, url: str, path: str, size: int, validator: Optional[str], progress: Optional[ProgressCallback]):
+        with open(path, "wb") as f:
+            f.truncate(size)
+
+        segment_size = -(-size // PARALLEL_SEGMENTS)
+        ranges = [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+        done = [0]
+        cancelled = threading.Event()
+        futures = [
+            self._get_segments_pool().submit(self._download_segment, url, path, start, end, validator, cancelled, progress, size, done)
+            for start, end in ranges
+        ]
+        finished, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = next((future for future in finished if future.exception()), None)
+        if failed is not None:
+            # Nenhum segmento pode continuar escrevendo no arquivo depois do fallback
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise failed.exception()
+
+    def download_to_file(self, url: str, path: str, progress: Optional[ProgressCallback] = None) -> int:
+        """
+        Baixa URL para `path` (segmentos paralelos se o arquivo é grande e o
+        servidor aceita Range; senão sequencial com retomada)
+
+        Returns:
+            Tamanho em bytes
+        """
+        started = time.monotonic()
+        partial_path = f"{path}.part"
+        try:
+            size, accepts_ranges, validator = self._probe(url)
+            parallel = bool(size and accepts_ranges and size >= PARALLEL_MIN_BYTES and PARALLEL_SEGMENTS > 1)
+
+            if parallel:
+                logger.info(f"📥 Download em {PARALLEL_SEGMENTS} segmentos paralelos ({size / (1024 * 1024):.1f}MB)...")
+                try:
+                    self._download_parallel(url, partial_path, size, validator, progress)
+                    self._count("parallel")
+                except Exception as e:
+                    logger.warning(f"⚠️ Download segmentado falhou ({str(e)[:80]}), baixando sequencial...")
+                    parallel = False
+
+            if not parallel:
+                logged = 0
+                with DownloadStream(self, url, track=False) as stream, open(partial_path, "wb") as f:
+                    for chunk in stream:
+                        f.write(chunk)
+                        if progress:
+                            progress(stream.received, stream.total_size)
+                        if stream.received - logged >= PROGRESS_LOG_BYTES:
+                            logged = stream.received
+                            logger.debug(f"📥 {logged / (1024 * 1024):.0f}MB baixados...")
+                size = os.path.getsize(partial_path)
+
+            os.replace(partial_path, path)
+            self._count("downloads")
+            self._finished(size, started)
+            return size
+        except Exception:
+            self._count("failed")
+            try:
+                os.remove(partial_path)
+            except OSError:
+                pass
+            raise
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self.counters)
+        seconds = counters.pop("seconds")
+        return {
+            **counters,
+            "mb_total": round(counters["bytes"] / (1024 * 1024), 1),
+            "avg_throughput_mbps": round(counters["bytes"] / (1024 * 1024) / seconds, 2) if seconds else 0.0,
+            "parallel_min_mb": PARALLEL_MIN_BYTES / (1024 * 1024),
+            "parallel_segments": PARALLEL_SEGMENTS,
+        }
+
+
+# Singleton instance
+download_service = DownloadService()
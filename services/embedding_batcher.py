@@ -0,0 +1,228 @@
+"""
+Geração de embeddings em lote (backfills e reprocessamentos em massa).
+
+Em vez de uma chamada genai.embed_content + um UPDATE por bookmark:
+- Acumula textos pendentes até EMBEDDING_BATCH_MAX_SIZE itens ou até
+  EMBEDDING_BATCH_FLUSH_INTERVAL segundos desde o primeiro item pendente
+- Envia o lote na API em lote do Gemini (embedding_service.generate_embeddings_batch)
+- Grava os resultados com uma única RPC (bulk_update_embeddings)
+- Isola falhas por item: um texto ruim não derruba o lote
+"""
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Any
+
+from services.embedding_service import embedding_service
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "100"))
+BATCH_FLUSH_INTERVAL = float(os.getenv("EMBEDDING_BATCH_FLUSH_INTERVAL", "2.0"))
+WRITE_CHUNK_SIZE = 200  # Vetores por chamada da RPC (limita tamanho do payload)
+BACKFILL_PAGE_SIZE = 1000  # Limite padrão de linhas do PostgREST
+
+BOOKMARK_TEXT_FIELDS = 'id, user_id, smart_title, auto_tags, auto_categories, video_transcript, visual_analysis'
+
+# Callback chamado após gravar: (bookmark_id, user_id, embedding)
+OnWritten = Callable[[str, str, List[float]], None]
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        supabase_client,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        flush_interval: float = BATCH_FLUSH_INTERVAL,
+        on_written: Optional[OnWritten] = None,
+        dry_run: bool = False
+    ):
+        self.supabase = supabase_client
+        self.max_batch_size = max(1, max_batch_size)
+        self.flush_interval = flush_interval
+        self.on_written = on_written
+        self.dry_run = dry_run
+
+        self._pending: List[Dict[str, Any]] = []
+        self._first_pending_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+        self.stats = {"submitted": 0, "embedded": 0, "written": 0, "failed": 0, "batches": 0}
+
+    # ------------------------------------------------------------------
+    # Coleta
+    # ------------------------------------------------------------------
+
+    def add(self, bookmark: dict):
+        """
+        Enfileira um bookmark (dict do Supabase com id, user_id e campos de texto).
+        Dispara flush ao atingir max_batch_size ou após flush_interval.
+        """
+        text = embedding_service.build_text_from_bookmark_dict(bookmark)
+        if not text:
+            logger.warning(f"⚠️ Bookmark {str(bookmark.get('id'))[:8]} sem conteúdo para embedding - ignorado")
+            self.stats["failed"] += 1
+            return
+
+        with self._lock:
+            self._pending.append({
+                "id": bookmark['id'],
+                "user_id": bookmark.get('user_id'),
+                "text": text,
+            })
+            self.stats["submitted"] += 1
+
+            if self._first_pending_at is None:
+                self._first_pending_at = time.time()
+                self._schedule_timer()
+
+            full = len(self._pending) >= self.max_batch_size
+
+        if full:
+            self.flush()
+
+    def _schedule_timer(self):
+        if self.flush_interval <= 0:
+            return
+        self._timer = threading.Timer(self.flush_interval, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self) -> int:
+        """
+        Processa tudo que está pendente.
+
+        Returns:
+            Número de embeddings gravados
+        """
+        with self._flush_lock:
+            with self._lock:
+                items = self._pending
+                self._pending = []
+                self._first_pending_at = None
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+
+            written = 0
+            for start in range(0, len(items), self.max_batch_size):
+                written += self._process(items[start:start + self.max_batch_size])
+            return written
+
+    def close(self) -> int:
+        """Flush final (chamar ao terminar de enfileirar)"""
+        return self.flush()
+
+    # ------------------------------------------------------------------
+    # Processamento
+    # ------------------------------------------------------------------
+
+    def _process(self, items: List[Dict[str, Any]]) -> int:
+        if not items:
+            return 0
+
+        started = time.time()
+        embeddings = embedding_service.generate_embeddings_batch([item["text"] for item in items])
+        self.stats["batches"] += 1
+
+        ready = []
+        for item, embedding in zip(items, embeddings):
+            if embedding:
+                ready.append((item, embedding))
+            else:
+                self.stats["failed"] += 1
+        self.stats["embedded"] += len(ready)
+
+        written = 0
+        if ready and not self.dry_run:
+            written = self._write(ready)
+        elif self.dry_run:
+            written = len(ready)
+
+        elapsed = time.time() - started
+        logger.info(f"📦 Lote de embeddings: {written}/{len(items)} gravados em {elapsed:.1f}s")
+        return written
+
+    def _write(self, ready: List[tuple]) -> int:
+        written = 0
+        for start in range(0, len(ready), WRITE_CHUNK_SIZE):
+            chunk = ready[start:start + WRITE_CHUNK_SIZE]
+            try:
+                self.supabase.rpc('bulk_update_embeddings', {
+                    'updates': [{'id': item["id"], 'embedding': embedding} for item, embedding in chunk]
+                }).execute()
+            except Exception as e:
+                # Lote inteiro recusado: grava item a item para isolar a linha problemática
+                logger.warning(f"⚠️ Escrita em lote falhou ({str(e)[:80]}) - gravando item a item")
+                chunk = self._write_individually(chunk)
+
+            written += len(chunk)
+            self.stats["written"] += len(chunk)
+
+            if self.on_written:
+                for item, embedding in chunk:
+                    try:
+                        self.on_written(item["id"], item["user_id"], embedding)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Callback pós-gravação falhou para {item['id'][:8]}: {str(e)[:80]}")
+
+        return written
+
+    def _write_individually(self, chunk: List[tuple]) -> List[tuple]:
+        ok = []
+        for item, embedding in chunk:
+            try:
+                self.supabase.table('bookmarks').update({
+                    'embedding': embedding
+                }).eq('id', item["id"]).execute()
+                ok.append((item, embedding))
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"❌ Falha ao gravar embedding de {item['id'][:8]}: {str(e)[:80]}")
+        return ok
+
+    # ------------------------------------------------------------------
+    # Backfill
+    # ------------------------------------------------------------------
+
+    def backfill(self, limit: Optional[int] = None, user_id: Optional[str] = None) -> Dict[str, int]:
+        """
+        Gera embeddings para todos os bookmarks com embedding NULL.
+
+        Pagina pelo id (keyset) e já traz os campos de texto na mesma query,
+        então o custo por bookmark é só a fatia dele no lote da API.
+        """
+        last_id = None
+        fetched = 0
+
+        while limit is None or fetched < limit:
+            page_size = BACKFILL_PAGE_SIZE if limit is None else min(BACKFILL_PAGE_SIZE, limit - fetched)
+
+            query = self.supabase.table('bookmarks').select(BOOKMARK_TEXT_FIELDS) \
+                .is_('embedding', 'null') \
+                .order('id') \
+                .limit(page_size)
+            if user_id:
+                query = query.eq('user_id', user_id)
+            if last_id:
+                query = query.gt('id', last_id)
+
+            rows = query.execute().data or []
+            if not rows:
+                break
+
+            for row in rows:
+                self.add(row)
+
+            fetched += len(rows)
+            last_id = rows[-1]['id']
+            logger.info(f"🔄 Backfill: {fetched} bookmarks enfileirados")
+
+            if len(rows) < page_size:
+                break
+
+        self.close()
+        return dict(self.stats)
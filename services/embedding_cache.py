@@ -0,0 +1,153 @@
+"""
+Cache de embeddings endereçado por conteúdo.
+
+Chave = SHA-256(model_name + task_type + combined_text). Se o texto combinado
+de um bookmark não mudou, o vetor também não muda - re-runs do auto-sync e
+scripts de reprocessamento não precisam chamar a API de novo.
+
+Dois níveis:
+- LRU local (por processo) na frente, sem rede
+- Redis compartilhado entre web e workers (vetor em float32 binário, TTL longo)
+
+Falhas de Redis nunca quebram a geração: o cache simplesmente vira miss.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_LOCAL_SIZE", "2048"))
+REDIS_TTL_SECONDS = int(os.getenv("EMBEDDING_CACHE_TTL_DAYS", "30")) * 24 * 3600
+KEY_PREFIX = "embedding:"
+REDIS_RETRY_SECONDS = 60  # Após falha de conexão, não tenta Redis por este tempo
+
+
+def content_hash(model_name: str, task_type: str, text: str) -> str:
+    """SHA-256 do conteúdo que determina o vetor"""
+    digest = hashlib.sha256()
+    for part in (model_name, task_type, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")  # Separador (evita colisão entre concatenações)
+    return digest.hexdigest()
+
+
+def _pack(embedding: List[float]) -> bytes:
+    return array("f", embedding).tobytes()
+
+
+def _unpack(raw: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(raw)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    def __init__(self, max_local_items: int = LOCAL_CACHE_SIZE, ttl_seconds: int = REDIS_TTL_SECONDS):
+        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.max_local_items = max_local_items
+        self.ttl_seconds = ttl_seconds
+
+        self._local: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_down_until = 0.0
+
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def _get_redis(self):
+        if time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            import redis as redis_sync
+
+            self._redis = redis_sync.from_url(self.redis_url, socket_timeout=2)
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        logger.warning(f"⚠️ Cache de embeddings sem Redis ({str(e)[:80]}) - usando só LRU local")
+        self._redis_down_until = time.time() + REDIS_RETRY_SECONDS
+
+    # ------------------------------------------------------------------
+    # LRU local
+    # ------------------------------------------------------------------
+
+    def _local_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            embedding = self._local.get(key)
+            if embedding is not None:
+                self._local.move_to_end(key)
+            return embedding
+
+    def _local_set(self, key: str, embedding: List[float]):
+        with self._lock:
+            self._local[key] = embedding
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_local_items:
+                self._local.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Busca várias chaves (LRU local, depois um MGET no Redis)"""
+        found: Dict[str, List[float]] = {}
+        missing = []
+
+        for key in keys:
+            embedding = self._local_get(key)
+            if embedding is not None:
+                found[key] = embedding
+                self.stats["local_hits"] += 1
+            else:
+                missing.append(key)
+
+        if missing:
+            try:
+                client = self._get_redis()
+                if client is not None:
+                    values = client.mget([KEY_PREFIX + key for key in missing])
+                    for key, raw in zip(missing, values):
+                        if raw:
+                            embedding = _unpack(raw)
+                            found[key] = embedding
+                            self._local_set(key, embedding)
+                            self.stats["redis_hits"] += 1
+            except Exception as e:
+                self._redis_failed(e)
+
+        self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[List[float]]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+
+        for key, embedding in items.items():
+            self._local_set(key, embedding)
+
+        try:
+            client = self._get_redis()
+            if client is not None:
+                pipe = client.pipeline(transaction=False)
+                for key, embedding in items.items():
+                    pipe.setex(KEY_PREFIX + key, self.ttl_seconds, _pack(embedding))
+                pipe.execute()
+        except Exception as e:
+            self._redis_failed(e)
+
+    def set(self, key: str, embedding: List[float]):
+        self.set_many({key: embedding})
+
+
+# Singleton instance
+embedding_cache = EmbeddingCache()
@@ -15,8 +15,14 @@ import logging
 from typing import Optional, List
 import google.generativeai as genai
 
+from services.embedding_cache import embedding_cache, content_hash
+from services.rate_limiter import rate_limiter
+
 logger = logging.getLogger(__name__)
 
+# Limite de textos por chamada de batch da API do Gemini
+MAX_API_BATCH_SIZE = 100
+
 
 class EmbeddingService:
     def __init__(self):
@@ -30,6 +36,7 @@ class EmbeddingService:
 
         # Modelo de embedding (768 dimensões)
         self.model_name = "models/text-embedding-004"
+        self.task_type = "clustering"  # Otimizado para clusterização
 
     def generate_embedding(
         self,
@@ -64,50 +71,36 @@ class EmbeddingService:
             return None
 
         try:
-            # Montar texto combinado (priorizando campos mais importantes)
-            text_parts = []
-
-            # 1. Smart title (repetido 2x para dar mais peso)
-            if smart_title:
-                text_parts.append(smart_title)
-                text_parts.append(smart_title)
-
-            # 2. Tags (separadas por vírgula)
-            if auto_tags:
-                text_parts.append(", ".join(auto_tags))
-
-            # 3. Categorias
-            if auto_categories:
-                text_parts.append(", ".join(auto_categories))
-
-            # 4. Transcrição (primeiros 500 caracteres)
-            if video_transcript:
-                text_parts.append(video_transcript[:500])
-
-            # 5. Análise visual (primeiros 500 caracteres)
-            if visual_analysis:
-                text_parts.append(str(visual_analysis)[:500])
-
-            # Combinar tudo
-            combined_text = " | ".join(filter(None, text_parts))
+            combined_text = self.build_combined_text(
+                smart_title=smart_title,
+                auto_tags=auto_tags,
+                auto_categories=auto_categories,
+                video_transcript=video_transcript,
+                visual_analysis=visual_analysis
+            )
 
             if not combined_text:
                 logger.warning("⚠️ Nenhum conteúdo para gerar embedding")
                 return None
 
+            # Texto idêntico já embedado (re-runs, reprocessamentos): sem chamada à API
+            cache_key = self.cache_key(combined_text)
+            cached = embedding_cache.get(cache_key)
+            if cached:
+                logger.info(f"♻️ Embedding em cache - Texto combinado: {len(combined_text)} chars")
+                return cached
+
             logger.info(f"📊 Gerando embedding - Texto combinado: {len(combined_text)} chars")
             logger.debug(f"Preview: {combined_text[:200]}...")
 
             # Chamar API do Gemini
-            result = genai.embed_content(
-                model=self.model_name,
-                content=combined_text,
-                task_type="clustering"  # Otimizado para clusterização
-            )
+            result = self._embed(combined_text)
 
             # Extrair embedding
             embedding = result['embedding']
 
+            embedding_cache.set(cache_key, embedding)
+
             logger.info(f"✅ Embedding gerado - Dimensões: {len(embedding)}")
 
             return embedding
@@ -116,6 +109,129 @@ class EmbeddingService:
             logger.error(f"❌ Erro ao gerar embedding: {str(e)}")
             return None
 
+    def _embed(self, content):
+        """Chamada à API do Gemini (texto ou lista de textos) sob o limite de taxa compartilhado"""
+        with rate_limiter.limit_sync("gemini"):
+            return genai.embed_content(
+                model=self.model_name,
+                content=content,
+                task_type=self.task_type
+            )
+
+    def cache_key(self, combined_text: str) -> str:
+        """Chave de cache: muda se o modelo, o task_type ou o texto mudarem"""
+        return content_hash(self.model_name, self.task_type, combined_text)
+
+    def build_combined_text(
+        self,
+        smart_title: Optional[str] = None,
+        auto_tags: Optional[List[str]] = None,
+        auto_categories: Optional[List[str]] = None,
+        video_transcript: Optional[str] = None,
+        visual_analysis: Optional[str] = None
+    ) -> str:
+        """
+        Monta texto combinado (priorizando campos mais importantes)
+
+        Returns:
+            Texto combinado ou string vazia se não houver conteúdo
+        """
+        text_parts = []
+
+        # 1. Smart title (repetido 2x para dar mais peso)
+        if smart_title:
+            text_parts.append(smart_title)
+            text_parts.append(smart_title)
+
+        # 2. Tags (separadas por vírgula)
+        if auto_tags:
+            text_parts.append(", ".join(auto_tags))
+
+        # 3. Categorias
+        if auto_categories:
+            text_parts.append(", ".join(auto_categories))
+
+        # 4. Transcrição (primeiros 500 caracteres)
+        if video_transcript:
+            text_parts.append(video_transcript[:500])
+
+        # 5. Análise visual (primeiros 500 caracteres)
+        if visual_analysis:
+            text_parts.append(str(visual_analysis)[:500])
+
+        # Combinar tudo
+        return " | ".join(filter(None, text_parts))
+
+    def build_text_from_bookmark_dict(self, bookmark: dict) -> str:
+        """Helper para montar texto combinado a partir de dict do Supabase"""
+        return self.build_combined_text(
+            smart_title=bookmark.get('smart_title'),
+            auto_tags=bookmark.get('auto_tags'),
+            auto_categories=bookmark.get('auto_categories'),
+            video_transcript=bookmark.get('video_transcript'),
+            visual_analysis=bookmark.get('visual_analysis')
+        )
+
+    def generate_embeddings_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Gera embeddings para vários textos usando a API em lote do Gemini
+
+        Isolamento de falhas: se a chamada em lote falhar, cada texto é
+        tentado individualmente - um item ruim não derruba o lote inteiro.
+
+        Args:
+            texts: Textos combinados (já montados com build_combined_text)
+
+        Returns:
+            Lista alinhada com `texts` (None para itens vazios ou que falharam)
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        if not self.client:
+            logger.error("❌ Embedding client não inicializado (GEMINI_API_KEY faltando)")
+            return results
+
+        keys = {i: self.cache_key(text) for i, text in enumerate(texts) if text}
+        cached = embedding_cache.get_many(list(set(keys.values())))
+
+        pending = []
+        for i, key in keys.items():
+            if key in cached:
+                results[i] = cached[key]
+            else:
+                pending.append(i)
+
+        if len(pending) < len(keys):
+            logger.info(f"♻️ {len(keys) - len(pending)}/{len(keys)} embeddings em cache")
+
+        for start in range(0, len(pending), MAX_API_BATCH_SIZE):
+            chunk = pending[start:start + MAX_API_BATCH_SIZE]
+
+            try:
+                result = self._embed([texts[i] for i in chunk])
+                embeddings = result['embedding']
+
+                if len(embeddings) != len(chunk):
+                    raise ValueError(f"API retornou {len(embeddings)} embeddings para {len(chunk)} textos")
+
+                for i, embedding in zip(chunk, embeddings):
+                    results[i] = embedding
+                embedding_cache.set_many({keys[i]: results[i] for i in chunk})
+
+                logger.info(f"✅ Lote de embeddings gerado: {len(chunk)} itens")
+
+            except Exception as e:
+                logger.warning(f"⚠️ Lote de {len(chunk)} embeddings falhou ({str(e)[:80]}) - tentando item a item")
+                for i in chunk:
+                    try:
+                        result = self._embed(texts[i])
+                        results[i] = result['embedding']
+                        embedding_cache.set(keys[i], results[i])
+                    except Exception as item_error:
+                        logger.error(f"❌ Embedding falhou para item {i}: {str(item_error)[:80]}")
+
+        return results
+
     def generate_from_bookmark_dict(self, bookmark: dict) -> Optional[List[float]]:
         """
         Helper para gerar embedding a partir de dict do Supabase
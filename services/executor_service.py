@@ -0,0 +1,168 @@
+"""
+Camada de execução assíncrona para SDKs bloqueantes.
+
+Replicate, Apify, Supabase (postgrest) e a API do Gemini são síncronos.
+Chamados direto de um `async def`, travam o event loop do uvicorn durante
+todo o round-trip - uma análise de vídeo de 60s deixava /health e /api/chat
+parados junto.
+
+Aqui cada provedor tem seu próprio ThreadPoolExecutor limitado (nomeado),
+então uma fila de chamadas lentas ao Replicate não rouba threads das
+consultas rápidas ao Supabase. Métricas por pool: fila, em execução,
+tempo de espera e tempo de execução.
+
+Antes de entrar no pool, a chamada passa pelo governador distribuído
+(services/rate_limiter): token bucket + limite de concorrência por
+provedor, compartilhado entre processos web e workers Celery.
+
+Uso:
+    output = await run_blocking("replicate", client.run, model, input={...})
+    result = await run_blocking("apify:2", run_actor, client)  # limite por chave de API
+    response = await execute_async(supabase.table('bookmarks').select('*'))
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from services.rate_limiter import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Threads por provedor (override: EXECUTOR_<NOME>_WORKERS)
+DEFAULT_POOL_SIZES = {
+    "replicate": 8,   # Gemini Flash, Gemini 3 Pro, Whisper (chamadas longas)
+    "apify": 4,       # Actor runs (até minutos)
+    "supabase": 16,   # Queries e storage (rápidas)
+    "gemini": 4,      # Embeddings
+    "download": 8,    # Downloads de vídeo (services/download_service)
+    "storage": 4,     # Upload de vídeo para o Supabase Storage (minutos por chamada)
+    "default": 8,
+}
+
+
+class _PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            finished = self.completed + self.failed
+            return {
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self.total_wait / finished * 1000, 1) if finished else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "avg_run_ms": round(self.total_run / finished * 1000, 1) if finished else 0.0,
+            }
+
+
+class ExecutorService:
+    def __init__(self):
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._sizes: Dict[str, int] = {}
+        self._stats: Dict[str, _PoolStats] = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self, name: str) -> ThreadPoolExecutor:
+        pool = self._pools.get(name)
+        if pool is not None:
+            return pool
+
+        with self._lock:
+            if name not in self._pools:
+                size = int(os.getenv(
+                    f"EXECUTOR_{name.upper()}_WORKERS",
+                    DEFAULT_POOL_SIZES.get(name, DEFAULT_POOL_SIZES["default"])
+                ))
+                self._sizes[name] = size
+                self._stats[name] = _PoolStats()
+                self._pools[name] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"exec-{name}")
+                logger.info(f"🧵 Pool '{name}' criado com {size} threads")
+            return self._pools[name]
+
+    async def run(self, provider: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Executa função bloqueante no pool do provedor sem travar o event loop.
+
+        `provider` pode ser "nome" ou "nome:chave" - a chave (ex: índice do
+        token Apify) separa os limites de taxa, mas o pool é o mesmo.
+        """
+        provider, _, key_id = provider.partition(":")
+        async with rate_limiter.limit(provider, key_id or None):
+            return await self._run_in_pool(provider, func, *args, **kwargs)
+
+    async def _run_in_pool(self, provider: str, func: Callable, *args, **kwargs) -> Any:
+        pool = self._get_pool(provider)
+        stats = self._stats[provider]
+        submitted_at = time.monotonic()
+
+        with stats.lock:
+            stats.queued += 1
+
+        def _call():
+            started_at = time.monotonic()
+            wait = started_at - submitted_at
+            with stats.lock:
+                stats.queued -= 1
+                stats.running += 1
+                stats.total_wait += wait
+                stats.max_wait = max(stats.max_wait, wait)
+
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                with stats.lock:
+                    stats.running -= 1
+                    stats.total_run += time.monotonic() - started_at
+                    if ok:
+                        stats.completed += 1
+                    else:
+                        stats.failed += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, _call)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "workers": self._sizes[name],
+                **self._stats[name].snapshot(),
+                "rate_limit": rate_limiter.stats.get(name, {}),
+            }
+            for name in list(self._pools)
+        }
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False)
+        self._pools.clear()
+
+
+# Singleton instance
+executor_service = ExecutorService()
+
+
+async def run_blocking(provider: str, func: Callable, *args, **kwargs) -> Any:
+    """Atalho para executor_service.run"""
+    return await executor_service.run(provider, func, *args, **kwargs)
+
+
+async def execute_async(query) -> Any:
+    """Executa query do Supabase (builder do postgrest) no pool 'supabase'"""
+    return await executor_service.run("supabase", query.execute)
@@ -11,13 +11,20 @@ Gemini Flash 2.5 é um modelo multimodal nativo que analisa vídeos completos:
 Custo estimado: ~$0.015-0.025 por vídeo (30-40% mais barato que Whisper + GPT-4 Vision)
 """
 import os
+import hashlib
 import replicate
 from typing import Optional, Dict
 import logging
 import json
 
+from services.executor_service import run_blocking
+from services.analysis_cache import analysis_cache
+
 logger = logging.getLogger(__name__)
 
+# Subir sempre que _build_analysis_prompt mudar (invalida o cache de análises)
+PROMPT_VERSION = "timeline-v2"
+
 
 class GeminiService:
     def __init__(self):
@@ -35,17 +42,64 @@ class GeminiService:
             "google/gemini-2.5-flash"
         )
 
+    def _run_model(self, model_input: Dict):
+        """Chamada bloqueante ao Replicate (pool 'replicate'); consome o stream na thread"""
+        # Caminhos locais viram file handles (Replicate faz upload do arquivo),
+        # então a análise não precisa esperar o upload para o Supabase
+        handles = []
+        videos = []
+        for video in model_input.get("videos") or []:
+            if isinstance(video, str) and os.path.isfile(video):
+                handle = open(video, "rb")
+                handles.append(handle)
+                videos.append(handle)
+            else:
+                videos.append(video)
+
+        try:
+            if handles:
+                model_input = {**model_input, "videos": videos}
+            output = self.client.run(self.model_version, input=model_input)
+            if hasattr(output, '__iter__') and not isinstance(output, (str, dict)):
+                return list(output)
+            return output
+        finally:
+            for handle in handles:
+                handle.close()
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"{self.model_version}@{PROMPT_VERSION}"
+
+    def _cache_namespace_for(self, user_context: Optional[str]) -> str:
+        """
+        Namespace do cache para o prompt efetivo. O contexto do usuário entra
+        no prompt, então análise com contexto fica sob o hash dele (nunca é
+        servida a outro usuário); só análises sem contexto são compartilhadas.
+        """
+        if not user_context:
+            return self.cache_namespace
+        context_hash = hashlib.sha256(user_context.encode()).hexdigest()[:16]
+        return f"{self.cache_namespace}#ctx:{context_hash}"
+
     async def analyze_video(
         self,
         video_url: str,
-        user_context: Optional[str] = None
+        user_context: Optional[str] = None,
+        url_key: Optional[str] = None
     ) -> Optional[Dict]:
         """
         Analisa vídeo completo usando Gemini Flash 2.5
 
+        Resultado fica no cache de análises (hash do arquivo e/ou url_key):
+        reprocessamento ou o mesmo vídeo de outro usuário não chama o Replicate.
+        Análise com contexto do usuário fica num namespace próprio (hash do
+        contexto) - a nota pessoal não vaza para quem salvar o mesmo vídeo.
+
         Args:
             video_url: URL do vídeo (pode ser URL pública ou caminho local se via file upload)
             user_context: Contexto do usuário (opcional - peso 40% na análise!)
+            url_key: Chave canônica da URL original (services/url_canonicalizer)
 
         Returns:
             Dict com:
@@ -62,6 +116,14 @@ class GeminiService:
             logger.error("❌ Gemini client não inicializado (REPLICATE_API_TOKEN faltando)")
             return None
 
+        user_context = (user_context or "").strip() or None
+        cache_namespace = self._cache_namespace_for(user_context)
+        cache_keys = await analysis_cache.content_keys(video_url, url_key)
+        cached = await analysis_cache.get(cache_namespace, cache_keys)
+        if cached:
+            logger.info(f"♻️ Análise Gemini reaproveitada do cache ({cache_keys[0]})")
+            return cached
+
         try:
             logger.info(f"🎬 Analisando vídeo com Gemini Flash 2.5: {video_url}")
 
@@ -70,9 +132,10 @@ class GeminiService:
 
             # Chamar Gemini via Replicate
             # IMPORTANTE: Parâmetro correto é "videos" (plural, array) e não "video" (singular)
-            output = self.client.run(
-                self.model_version,
-                input={
+            output = await run_blocking(
+                "replicate",
+                self._run_model,
+                {
                     "prompt": prompt,
                     "videos": [video_url],  # Array de URIs (corrigido de "video" para "videos")
                     "temperature": 0.3,  # Baixa temperatura = mais determinístico
@@ -86,6 +149,9 @@ class GeminiService:
 
             if result:
                 logger.info(f"✅ Vídeo analisado com sucesso - Idioma: {result.get('language')}, FOOH: {result.get('is_fooh')}")
+                # Vídeo sem fala (música, só visual) também é análise válida - mesmo critério do VideoAnalysisService
+                if result.get('transcript') or result.get('visual_analysis'):
+                    await analysis_cache.set(cache_namespace, cache_keys, result)
             else:
                 logger.error("❌ Falha ao parsear output do Gemini")
 
@@ -0,0 +1,244 @@
+"""
+Registro de clientes HTTP compartilhados (vida útil do processo).
+
+Thumbnails, downloads de vídeo, YouTube Data API, webhook de ideias...
+cada chamada criava seu `httpx.AsyncClient` - um handshake TCP + TLS novo
+para os mesmos CDNs toda vez.
+
+Aqui cada perfil ("default", "media", "download", ...) tem um cliente
+persistente com:
+- keep-alive ajustado (HTTP_KEEPALIVE_EXPIRY / HTTP_MAX_KEEPALIVE)
+- HTTP/2 quando o pacote `h2` está instalado (httpx[http2]), exceto perfis
+  registrados com http2=False (ex: "download")
+- limite de conexões por host (HTTP_HOST_LIMITS="*.cdninstagram.com=8,...")
+- métricas de reuso de conexão (requisições vs conexões/handshakes novos)
+
+Clientes async são por event loop (httpx.AsyncClient não pode trocar de
+loop). Abertos sob demanda e fechados no shutdown do FastAPI e do worker
+Celery (`aclose` / `close`). Métricas em /api/http-client-stats.
+
+Uso:
+    client = http_client_pool.get("media")
+    response = await client.get(url)
+
+    client = http_client_pool.get_sync("download")  # threads / Celery
+"""
+import os
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "90"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() != "false"
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+HTTP2 = HTTP2_ENABLED and _h2_available()
+
+
+def _parse_host_limits(raw: str) -> Dict[str, int]:
+    """'*.cdninstagram.com=8,*.tiktokcdn.com=8' -> {padrão: conexões}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        host, _, value = item.partition("=")
+        try:
+            limits[host.strip()] = int(value)
+        except ValueError:
+            logger.warning(f"⚠️ HTTP_HOST_LIMITS inválido: '{item}'")
+    return limits
+
+
+HOST_LIMITS = _parse_host_limits(os.getenv("HTTP_HOST_LIMITS", ""))
+
+
+class _Profile:
+    def __init__(self, timeout: httpx.Timeout, max_connections: int = MAX_CONNECTIONS, follow_redirects: bool = True,
+                 http2: bool = True):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.follow_redirects = follow_redirects
+        self.http2 = HTTP2 and http2
+
+
+class _ClientStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+
+    def event(self, name: str):
+        with self.lock:
+            if name == "connection.connect_tcp.complete":
+                self.new_connections += 1
+            elif name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+            elif name == "http2.send_request_headers.started":
+                self.http2_requests += 1
+
+    def request(self):
+        with self.lock:
+            self.requests += 1
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "http2_requests": self.http2_requests,
+                "reuse_rate": round(reused / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+class HttpClientPool:
+    def __init__(self):
+        self._profiles: Dict[str, _Profile] = {
+            "default": _Profile(httpx.Timeout(30.0, connect=10.0)),
+            "media": _Profile(httpx.Timeout(180.0, connect=30.0)),  # CDNs de vídeo/imagem
+        }
+        self._async: Dict[Tuple[str, asyncio.AbstractEventLoop], httpx.AsyncClient] = {}
+        self._sync: Dict[str, httpx.Client] = {}
+        self._stats: Dict[str, _ClientStats] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, timeout: httpx.Timeout, max_connections: int = MAX_CONNECTIONS,
+                 follow_redirects: bool = True, http2: bool = True):
+        """Registra perfil de cliente (timeouts/limites próprios; http2=False força HTTP/1.1)"""
+        self._profiles[name] = _Profile(timeout, max_connections, follow_redirects, http2)
+
+    # ------------------------------------------------------------------
+    # Construção
+    # ------------------------------------------------------------------
+
+    def _limits(self, max_connections: int) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(MAX_KEEPALIVE, max_connections),
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+
+    def _client_kwargs(self, name: str, transport_cls) -> Dict:
+        profile = self._profiles.get(name) or self._profiles["default"]
+        stats = self._stats.setdefault(name, _ClientStats())
+        # Limite por host: transport próprio (pool separado) para o padrão
+        mounts = {
+            f"all://{pattern}": transport_cls(http2=profile.http2, limits=self._limits(limit))
+            for pattern, limit in HOST_LIMITS.items()
+        }
+        return {
+            "timeout": profile.timeout,
+            "limits": self._limits(profile.max_connections),
+            "http2": profile.http2,
+            "follow_redirects": profile.follow_redirects,
+            "mounts": mounts or None,
+        }, stats
+
+    def get(self, name: str = "default") -> httpx.AsyncClient:
+        """Cliente async do perfil (um por event loop)"""
+        loop = asyncio.get_running_loop()
+        client = self._async.get((name, loop))
+        if client is not None and not client.is_closed:
+            return client
+
+        kwargs, stats = self._client_kwargs(name, httpx.AsyncHTTPTransport)
+
+        async def trace(event_name: str, info: dict):
+            stats.event(event_name)
+
+        async def on_request(request: httpx.Request):
+            stats.request()
+            request.extensions["trace"] = trace
+
+        client = httpx.AsyncClient(event_hooks={"request": [on_request]}, **kwargs)
+        with self._lock:
+            # Loops fechados (ex: asyncio.run de scripts) não voltam
+            for key in [k for k in self._async if k[1].is_closed()]:
+                self._async.pop(key, None)
+            self._async[(name, loop)] = client
+        logger.debug(f"🌐 Cliente HTTP '{name}' criado (http2={kwargs['http2']})")
+        return client
+
+    def get_sync(self, name: str = "default") -> httpx.Client:
+        """Cliente síncrono do perfil (thread-safe, compartilhado no processo)"""
+        client = self._sync.get(name)
+        if client is not None and not client.is_closed:
+            return client
+
+        with self._lock:
+            client = self._sync.get(name)
+            if client is None or client.is_closed:
+                kwargs, stats = self._client_kwargs(name, httpx.HTTPTransport)
+
+                def trace(event_name: str, info: dict):
+                    stats.event(event_name)
+
+                def on_request(request: httpx.Request):
+                    stats.request()
+                    request.extensions["trace"] = trace
+
+                client = httpx.Client(event_hooks={"request": [on_request]}, **kwargs)
+                self._sync[name] = client
+                logger.debug(f"🌐 Cliente HTTP síncrono '{name}' criado (http2={kwargs['http2']})")
+        return client
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    async def aclose(self):
+        """Fecha clientes do loop atual e todos os síncronos (shutdown do FastAPI)"""
+        loop = asyncio.get_running_loop()
+        for key in [k for k in self._async if k[1] is loop]:
+            client = self._async.pop(key)
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+        self.close()
+
+    def close(self):
+        """Fecha clientes síncronos e esquece os async (shutdown do worker Celery)"""
+        with self._lock:
+            clients = list(self._sync.values())
+            self._sync.clear()
+            self._async.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def reset(self):
+        """Descarta clientes herdados do processo pai (após fork do worker)"""
+        with self._lock:
+            self._sync.clear()
+            self._async.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "http2": HTTP2,
+            "host_limits": HOST_LIMITS,
+            "keepalive_expiry": KEEPALIVE_EXPIRY,
+            "clients": {name: stats.snapshot() for name, stats in self._stats.items()},
+        }
+
+
+# Singleton instance
+http_client_pool = HttpClientPool()
@@ -0,0 +1,186 @@
+"""
+Toolkit de mídia (ffprobe/ffmpeg) com probe único e extração em uma passada.
+
+Antes, por vídeo analisado: 1 ffprobe (duração) + 4 ffmpeg (um por frame)
++ 1 ffmpeg (áudio) na análise, mais 1 ffmpeg no thumbnail e 1 ffprobe na
+transcodificação - cada um abrindo e decodificando o mesmo arquivo.
+
+Agora:
+- probe(): um ffprobe JSON (formato + streams), cacheado por arquivo
+  (path + tamanho + mtime; URL remota pela própria URL)
+- extract(): todos os frames + trilha de áudio numa única invocação do
+  ffmpeg com várias saídas. Cada frame é uma entrada com `-ss` próprio
+  (seek por keyframe, sem decodificar o vídeo inteiro até o último frame);
+  áudio só é pedido se o probe achou stream de áudio
+- Processos pelo process_pool (async, slots de CPU, prioridade, kill no
+  timeout) - `priority` define a fila (thumbnail = PRIORITY_INTERACTIVE)
+
+Uso:
+    info = await media_toolkit.probe(path)       # info["duration"], info["video"]["codec_name"]...
+    result = await media_toolkit.extract(path, frame_times=[0, 5.2], frames_dir=d, audio_path=a)
+    result["frames"], result["audio"]
+"""
+import os
+import json
+import logging
+import subprocess
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from services.process_pool import process_pool, PRIORITY_ANALYSIS
+
+logger = logging.getLogger(__name__)
+
+PROBE_CACHE_SIZE = int(os.getenv("MEDIA_PROBE_CACHE_SIZE", "256"))
+PROBE_TIMEOUT = 15
+EXTRACT_TIMEOUT = 120
+
+
+class MediaToolError(Exception):
+    """ffprobe/ffmpeg falhou ou estourou o timeout"""
+
+
+def _is_remote(path: str) -> bool:
+    return path.startswith(("http://", "https://"))
+
+
+class MediaToolkit:
+    def __init__(self):
+        self._probes: "OrderedDict[str, Dict]" = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # Processos
+    # ------------------------------------------------------------------
+
+    async def _run(self, args: List[str], timeout: float, priority: int) -> bytes:
+        """Executa no process_pool; erro ou timeout = MediaToolError"""
+        try:
+            result = await process_pool.run(args, priority=priority, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise MediaToolError(f"{args[0]} excedeu {timeout:.0f}s")
+
+        if result.returncode != 0:
+            raise MediaToolError(f"{args[0]} falhou ({result.returncode}): {result.stderr.decode(errors='replace')[-300:]}")
+        return result.stdout
+
+    # ------------------------------------------------------------------
+    # Probe
+    # ------------------------------------------------------------------
+
+    def _cache_key(self, path: str) -> str:
+        if _is_remote(path):
+            return path
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    async def probe(self, path: str, priority: int = PRIORITY_ANALYSIS) -> Dict:
+        """
+        Informações do arquivo (um ffprobe, cacheado)
+
+        Returns:
+            Dict com duration (float ou None), format_name, size, bit_rate,
+            video / audio (primeiro stream de cada tipo ou None) e streams
+        """
+        key = self._cache_key(path)
+        cached = self._probes.get(key)
+        if cached is not None:
+            self._probes.move_to_end(key)
+            return cached
+
+        stdout = await self._run(
+            ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path],
+            timeout=PROBE_TIMEOUT,
+            priority=priority
+        )
+        raw = json.loads(stdout or b"{}")
+        fmt = raw.get("format", {})
+        streams = raw.get("streams", [])
+
+        duration = fmt.get("duration")
+        info = {
+            "duration": float(duration) if duration not in (None, "N/A") else None,
+            "format_name": fmt.get("format_name"),
+            "size": int(fmt["size"]) if fmt.get("size") else None,
+            "bit_rate": int(fmt["bit_rate"]) if fmt.get("bit_rate") else None,
+            "video": next((s for s in streams if s.get("codec_type") == "video"), None),
+            "audio": next((s for s in streams if s.get("codec_type") == "audio"), None),
+            "streams": streams,
+        }
+
+        self._probes[key] = info
+        while len(self._probes) > PROBE_CACHE_SIZE:
+            self._probes.popitem(last=False)
+        return info
+
+    async def duration(self, path: str, priority: int = PRIORITY_ANALYSIS) -> Optional[float]:
+        return (await self.probe(path, priority))["duration"]
+
+    # ------------------------------------------------------------------
+    # Extração
+    # ------------------------------------------------------------------
+
+    async def extract(
+        self,
+        path: str,
+        frame_times: Sequence[float] = (),
+        frames_dir: Optional[str] = None,
+        audio_path: Optional[str] = None,
+        audio_bitrate: str = "64k",
+        timeout: float = EXTRACT_TIMEOUT,
+        priority: int = PRIORITY_ANALYSIS
+    ) -> Dict:
+        """
+        Extrai frames (JPEG) e áudio (MP3 16kHz mono, formato do Whisper)
+        numa única invocação do ffmpeg
+
+        Args:
+            path: Arquivo local ou URL
+            frame_times: Segundos de cada frame (frame_{i}.jpg em frames_dir)
+            frames_dir: Diretório de saída dos frames
+            audio_path: Saída do áudio (ignorado se o vídeo não tem áudio)
+
+        Returns:
+            Dict com frames (paths gerados, na ordem pedida) e audio (path ou None)
+        """
+        info = await self.probe(path, priority)
+        frame_times = list(frame_times) if frames_dir and info["video"] else []
+        want_audio = bool(audio_path and info["audio"])
+        if not frame_times and not want_audio:
+            return {"frames": [], "audio": None}
+
+        inputs: List[str] = []
+        outputs: List[str] = []
+        frame_paths = []
+        for i, time_sec in enumerate(frame_times):
+            frame_path = os.path.join(frames_dir, f"frame_{i}.jpg")
+            frame_paths.append(frame_path)
+            inputs += ["-ss", f"{max(time_sec, 0):.3f}", "-i", path]
+            outputs += ["-map", f"{i}:v:0", "-frames:v", "1", "-q:v", "2", frame_path]
+
+        if want_audio:
+            audio_input = len(frame_times)
+            inputs += ["-i", path]
+            outputs += [
+                "-map", f"{audio_input}:a:0",
+                "-vn",
+                "-ar", "16000",  # Sample rate 16kHz
+                "-ac", "1",      # Mono
+                "-b:a", audio_bitrate,
+                audio_path
+            ]
+
+        await self._run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *inputs, *outputs],
+            timeout=timeout,
+            priority=priority
+        )
+
+        # Frame perto do fim pode não sair (seek além do último keyframe decodificável)
+        return {
+            "frames": [p for p in frame_paths if os.path.exists(p)],
+            "audio": audio_path if want_audio and os.path.exists(audio_path) else None,
+        }
+
+
+# Singleton instance
+media_toolkit = MediaToolkit()
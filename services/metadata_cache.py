@@ -0,0 +1,259 @@
+"""
+Cache de metadados em dois níveis com stale-while-revalidate.
+
+Níveis:
+- L1: LRU no processo (sem round-trip)
+- L2: Redis (compartilhado entre web e workers, chave canônica da URL)
+
+Frescor por grupo de campos:
+- Contadores (views, likes, comentários, thumbnail do CDN que expira):
+  frescos por METADATA_CACHE_COUNTS_TTL_HOURS. Em plataformas onde
+  atualizar contadores custa um scrape pago inteiro (Apify), o chamador
+  passa METADATA_CACHE_PAID_COUNTS_TTL_HOURS
+- Campos imutáveis (título, autor, descrição, data): frescos por
+  METADATA_CACHE_TTL_HOURS
+
+Entrada vencida NÃO vira miss: é servida na hora e um refresh roda em
+background (só contadores se os campos imutáveis ainda estão frescos).
+Quem serve entrada vencida de plataforma com thumbnail assinada (Instagram,
+TikTok) entrega sem thumbnail_url (ApifyService._servable).
+Um refresh por chave em todos os processos: lock no Redis (SET NX) com
+METADATA_CACHE_REFRESH_LOCK_SECONDS, que também espaça novas tentativas
+depois de uma falha.
+Só depois de METADATA_CACHE_MAX_STALE_DAYS a entrada some de vez.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+COUNTS_TTL_SECONDS = float(os.getenv("METADATA_CACHE_COUNTS_TTL_HOURS", "6")) * 3600
+PAID_COUNTS_TTL_SECONDS = float(os.getenv("METADATA_CACHE_PAID_COUNTS_TTL_HOURS", "48")) * 3600
+REFRESH_LOCK_SECONDS = int(os.getenv("METADATA_CACHE_REFRESH_LOCK_SECONDS", "300"))
+FIELDS_TTL_SECONDS = float(os.getenv("METADATA_CACHE_TTL_HOURS", "168")) * 3600
+MAX_STALE_SECONDS = int(float(os.getenv("METADATA_CACHE_MAX_STALE_DAYS", "30")) * 86400)
+LOCAL_SIZE = int(os.getenv("METADATA_CACHE_LOCAL_SIZE", "1024"))
+REDIS_RETRY_SECONDS = 30
+
+# Campos que mudam com o tempo (atualizados no refresh só de contadores)
+VOLATILE_FIELDS = ("views", "likes", "comments_count", "top_comments", "thumbnail_url")
+
+FRESH = "fresh"
+STALE_COUNTS = "stale_counts"  # Campos imutáveis frescos, contadores vencidos
+STALE = "stale"
+MISS = "miss"
+
+
+def _merge(old: Optional[dict], new: dict, counts_only: bool) -> dict:
+    """Refresh não apaga dado bom: valores vazios no scrape novo mantêm o antigo"""
+    if not old:
+        return new
+    if counts_only:
+        merged = dict(old)
+        for field in VOLATILE_FIELDS:
+            if new.get(field) not in (None, "", []):
+                merged[field] = new[field]
+        return merged
+    return {**old, **{k: v for k, v in new.items() if v not in (None, "", [])}}
+
+
+class MetadataCache:
+    def __init__(self):
+        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._local: "OrderedDict[str, dict]" = OrderedDict()
+        self._refreshing: Set[str] = set()
+        self._background: Set[asyncio.Task] = set()
+        self.counters = {
+            "hits_local": 0,
+            "hits_redis": 0,
+            "misses": 0,
+            "stale_served": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "refresh_skipped": 0,  # Outro processo já revalidando a chave
+            "redis_errors": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Redis
+    # ------------------------------------------------------------------
+
+    async def _get_redis(self):
+        if time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            try:
+                import redis.asyncio as redis
+
+                self._redis = redis.from_url(self.redis_url, socket_timeout=2)
+            except Exception as e:
+                self._redis_failed(e)
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        self.counters["redis_errors"] += 1
+        if time.time() >= self._redis_down_until:
+            logger.warning(f"⚠️ Cache de metadados sem Redis ({str(e)[:80]}) - usando só LRU local")
+        self._redis_down_until = time.time() + REDIS_RETRY_SECONDS
+
+    # ------------------------------------------------------------------
+    # Leitura / escrita
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _state(entry: dict, now: float, counts_ttl: float = COUNTS_TTL_SECONDS) -> str:
+        if now - entry["stored_at"] >= FIELDS_TTL_SECONDS:
+            return STALE
+        if now - entry["counts_at"] >= counts_ttl:
+            return STALE_COUNTS
+        return FRESH
+
+    def _remember(self, key: str, entry: dict):
+        self._local[key] = entry
+        self._local.move_to_end(key)
+        while len(self._local) > LOCAL_SIZE:
+            self._local.popitem(last=False)
+
+    async def _read_redis(self, key: str) -> Optional[dict]:
+        client = await self._get_redis()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(key)
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        if not raw:
+            return None
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            return None
+        # Formato antigo (dict puro, sem timestamps): trata como vencido
+        if "data" not in entry:
+            entry = {"data": entry, "stored_at": 0.0, "counts_at": 0.0}
+        return entry
+
+    async def get(self, key: str, counts_ttl: Optional[float] = None) -> Tuple[Optional[dict], str]:
+        """
+        Retorna (dados, estado) - estado: fresh | stale_counts | stale | miss
+
+        Args:
+            counts_ttl: Frescor dos contadores em segundos (default COUNTS_TTL_SECONDS)
+        """
+        now = time.time()
+        counts_ttl = COUNTS_TTL_SECONDS if counts_ttl is None else counts_ttl
+
+        entry = self._local.get(key)
+        if entry is not None:
+            self._local.move_to_end(key)
+            state = self._state(entry, now, counts_ttl)
+            if state == FRESH:
+                self.counters["hits_local"] += 1
+                return entry["data"], FRESH
+
+        # L1 vencido ou ausente: outro processo pode ter atualizado o Redis
+        remote = await self._read_redis(key)
+        if remote is not None and (entry is None or remote["counts_at"] > entry["counts_at"]):
+            entry = remote
+            self._remember(key, entry)
+
+        if entry is None:
+            self.counters["misses"] += 1
+            return None, MISS
+
+        state = self._state(entry, now, counts_ttl)
+        if state == FRESH:
+            self.counters["hits_redis"] += 1
+        else:
+            self.counters["stale_served"] += 1
+        return entry["data"], state
+
+    async def set(self, key: str, data: dict, counts_only: bool = False):
+        """Grava nos dois níveis (merge com a entrada existente)"""
+        now = time.time()
+        old = self._local.get(key) or await self._read_redis(key)
+
+        if counts_only and old:
+            entry = {"data": _merge(old["data"], data, True), "stored_at": old["stored_at"], "counts_at": now}
+        else:
+            entry = {"data": _merge(old["data"] if old else None, data, False), "stored_at": now, "counts_at": now}
+
+        self._remember(key, entry)
+
+        client = await self._get_redis()
+        if client is None:
+            return
+        try:
+            await client.setex(key, MAX_STALE_SECONDS, json.dumps(entry, default=str))
+        except Exception as e:
+            self._redis_failed(e)
+
+    # ------------------------------------------------------------------
+    # Revalidação em background
+    # ------------------------------------------------------------------
+
+    async def _claim_refresh(self, key: str) -> bool:
+        """Lock de refresh entre processos (SET NX); sem Redis, só o controle local vale"""
+        client = await self._get_redis()
+        if client is None:
+            return True
+        try:
+            return bool(await client.set(f"{key}:refreshing", 1, nx=True, ex=REFRESH_LOCK_SECONDS))
+        except Exception as e:
+            self._redis_failed(e)
+            return True
+
+    def schedule_refresh(self, key: str, fetch: Callable[[], Awaitable[Optional[dict]]], counts_only: bool):
+        """Dispara refresh em background (1 por chave entre todos os processos)"""
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def _refresh():
+            try:
+                # Lock expira sozinho: após falha, nova tentativa só depois de REFRESH_LOCK_SECONDS
+                if not await self._claim_refresh(key):
+                    self.counters["refresh_skipped"] += 1
+                    return
+                data = await fetch()
+                if data:
+                    await self.set(key, data, counts_only=counts_only)
+                    self.counters["refreshes"] += 1
+                    logger.info(f"🔄 Cache de metadados revalidado ({'contadores' if counts_only else 'completo'}): {key}")
+            except Exception as e:
+                self.counters["refresh_failures"] += 1
+                logger.warning(f"⚠️ Refresh de metadados falhou ({key}): {str(e)[:100]}")
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.ensure_future(_refresh())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def stats(self) -> Dict:
+        lookups = self.counters["hits_local"] + self.counters["hits_redis"] + self.counters["stale_served"] + self.counters["misses"]
+        served = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(served / lookups, 3) if lookups else 0.0,
+            "local_entries": len(self._local),
+            "refreshing": len(self._refreshing),
+            "ttl_hours": {
+                "counts": COUNTS_TTL_SECONDS / 3600,
+                "paid_counts": PAID_COUNTS_TTL_SECONDS / 3600,
+                "fields": FIELDS_TTL_SECONDS / 3600,
+                "max_stale": MAX_STALE_SECONDS / 3600,
+            },
+        }
+
+
+# Singleton instance
+metadata_cache = MetadataCache()
@@ -0,0 +1,242 @@
+"""
+Grafo de vizinhos pré-computado para /api/find-similar.
+
+Mantém, para cada bookmark, a lista dos top-K bookmarks mais similares
+do MESMO usuário (tabela bookmark_neighbors). Assim o endpoint vira uma
+leitura indexada por chave primária: sem chamada de embedding e sem
+buscar vetores de outros usuários para filtrar depois.
+
+Atualização:
+- Incremental: quando um embedding muda, recalcula a lista do bookmark,
+  tira o bookmark das listas onde ele estava (score antigo) e o insere nas
+  listas já computadas dos vizinhos onde ele entra no top-K
+- Remoção: bookmark apagado sai das listas dos outros (remove_bookmarks)
+- Completa: rebuild periódico por usuário (corrige listas que ficaram velhas)
+"""
+import os
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+
+from services.vector_index_service import vector_index_service, parse_embedding
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOR_K = int(os.getenv("NEIGHBOR_GRAPH_K", "20"))
+NEIGHBOR_MIN_SIMILARITY = float(os.getenv("NEIGHBOR_GRAPH_MIN_SIMILARITY", "0.3"))
+UPSERT_CHUNK_SIZE = 200
+REBUILD_BLOCK_SIZE = 512  # Linhas por bloco no produto V @ V.T (limita memória)
+
+
+class NeighborGraphService:
+    def __init__(self, supabase_client=None):
+        self._supabase = supabase_client
+
+    def _get_supabase(self):
+        if self._supabase is None:
+            self._supabase = vector_index_service._get_supabase()
+        return self._supabase
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def get_neighbors(self, bookmark_id: str, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Lê lista pré-computada de vizinhos.
+
+        Returns:
+            Lista de {"id", "similarity"} ou None se ainda não foi computada
+        """
+        response = self._get_supabase().table('bookmark_neighbors') \
+            .select('neighbors') \
+            .eq('bookmark_id', bookmark_id) \
+            .eq('user_id', user_id) \
+            .limit(1) \
+            .execute()
+
+        if not response.data:
+            return None
+        return response.data[0].get('neighbors') or []
+
+    # ------------------------------------------------------------------
+    # Atualização incremental
+    # ------------------------------------------------------------------
+
+    def update_for_bookmark(self, bookmark_id: str, user_id: str, embedding: Optional[List[float]] = None) -> int:
+        """
+        Recalcula vizinhos de um bookmark e propaga para as listas afetadas.
+
+        Returns:
+            Número de listas gravadas
+        """
+        if embedding is None:
+            ref = self._get_supabase().table('bookmarks').select('embedding') \
+                .eq('id', bookmark_id).single().execute()
+            embedding = parse_embedding(ref.data.get('embedding') if ref.data else None)
+            if not embedding:
+                logger.warning(f"⚠️ Bookmark {bookmark_id[:8]} sem embedding - vizinhos não computados")
+                return 0
+
+        index = vector_index_service.get_index_sync(user_id)
+        vector_index_service.upsert(user_id, bookmark_id, embedding)
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        # K+1 porque o próprio bookmark sempre aparece
+        neighbors = [
+            {"id": bid, "similarity": round(score, 4)}
+            for bid, score in index.search(query, NEIGHBOR_K + 1, NEIGHBOR_MIN_SIMILARITY)
+            if bid != bookmark_id
+        ][:NEIGHBOR_K]
+
+        rows = [self._row(bookmark_id, user_id, neighbors)]
+
+        # Listas que já citam o bookmark (score do embedding antigo) + listas dos vizinhos novos
+        lists = self._lists_referencing(user_id, [bookmark_id])
+        missing = [n["id"] for n in neighbors if n["id"] not in lists]
+        if missing:
+            existing = self._get_supabase().table('bookmark_neighbors') \
+                .select('bookmark_id, neighbors') \
+                .in_('bookmark_id', missing) \
+                .execute()
+            lists.update({r['bookmark_id']: r.get('neighbors') or [] for r in (existing.data or [])})
+
+        new_scores = {n["id"]: n["similarity"] for n in neighbors}
+        for owner_id, entries in lists.items():
+            current = [x for x in entries if x.get("id") != bookmark_id]
+            # Vizinho sem lista ainda: não cria lista parcial (get_neighbors a trataria como
+            # completa) - ela é computada quando o vizinho ganhar embedding ou no rebuild
+            score = new_scores.get(owner_id)
+            if score is not None:
+                worst = min((x.get("similarity", 0) for x in current), default=0)
+                if len(current) < NEIGHBOR_K or score > worst:
+                    current.append({"id": bookmark_id, "similarity": score})
+                    current.sort(key=lambda x: x.get("similarity", 0), reverse=True)
+                    current = current[:NEIGHBOR_K]
+            if current != entries:
+                rows.append(self._row(owner_id, user_id, current))
+
+        self._upsert_rows(rows)
+        logger.info(f"🕸️ Vizinhos atualizados - {bookmark_id[:8]}: {len(neighbors)} vizinhos, {len(rows)} listas gravadas")
+        return len(rows)
+
+    def remove_bookmarks(self, user_id: str, bookmark_ids: List[str]) -> int:
+        """
+        Tira bookmarks apagados das listas de vizinhos dos outros bookmarks
+        (a lista do próprio bookmark sai por ON DELETE CASCADE).
+
+        Returns:
+            Número de listas gravadas
+        """
+        removed = set(bookmark_ids)
+        rows = []
+        for owner_id, entries in self._lists_referencing(user_id, bookmark_ids).items():
+            if owner_id in removed:
+                continue
+            rows.append(self._row(owner_id, user_id, [x for x in entries if x.get("id") not in removed]))
+
+        self._upsert_rows(rows)
+        if rows:
+            logger.info(f"🕸️ {len(bookmark_ids)} bookmark(s) apagado(s) removido(s) de {len(rows)} listas de vizinhos")
+        return len(rows)
+
+    # ------------------------------------------------------------------
+    # Rebuild completo
+    # ------------------------------------------------------------------
+
+    def rebuild_user(self, user_id: str) -> int:
+        """Recalcula todas as listas de um usuário (produto V @ V.T em blocos)"""
+        index = vector_index_service._fetch_user_embeddings(user_id)
+        vector_index_service._store(user_id, index)
+
+        n = len(index)
+        if n == 0:
+            return 0
+
+        vectors = np.asarray(index.vectors, dtype=np.float32)
+        k = min(NEIGHBOR_K, n - 1)
+        rows = []
+
+        for start in range(0, n, REBUILD_BLOCK_SIZE):
+            block = vectors[start:start + REBUILD_BLOCK_SIZE] @ vectors.T
+            for offset, scores in enumerate(block):
+                row = start + offset
+                scores[row] = -1.0  # Exclui o próprio bookmark
+                neighbors = []
+                if k > 0:
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    top = top[np.argsort(-scores[top])]
+                    neighbors = [
+                        {"id": index.ids[j], "similarity": round(float(scores[j]), 4)}
+                        for j in top
+                        if scores[j] > NEIGHBOR_MIN_SIMILARITY
+                    ]
+                rows.append(self._row(index.ids[row], user_id, neighbors))
+
+            if len(rows) >= UPSERT_CHUNK_SIZE:
+                self._upsert_rows(rows)
+                rows = []
+
+        self._upsert_rows(rows)
+        logger.info(f"🕸️ Grafo de vizinhos reconstruído - user {user_id[:8]}: {n} bookmarks")
+        return n
+
+    def list_users_with_embeddings(self) -> List[str]:
+        """IDs de usuários com pelo menos um embedding (paginado)"""
+        supabase = self._get_supabase()
+        users = set()
+        start = 0
+        while True:
+            response = supabase.table('bookmarks').select('user_id') \
+                .not_.is_('embedding', 'null') \
+                .range(start, start + 999) \
+                .execute()
+            data = response.data or []
+            users.update(r['user_id'] for r in data if r.get('user_id'))
+            if len(data) < 1000:
+                break
+            start += 1000
+        return sorted(users)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _lists_referencing(self, user_id: str, bookmark_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Listas do usuário que contêm algum dos bookmarks (containment jsonb @>)"""
+        lists: Dict[str, List[Dict[str, Any]]] = {}
+        for bookmark_id in bookmark_ids:
+            response = self._get_supabase().table('bookmark_neighbors') \
+                .select('bookmark_id, neighbors') \
+                .eq('user_id', user_id) \
+                .contains('neighbors', json.dumps([{"id": bookmark_id}])) \
+                .execute()
+            lists.update({r['bookmark_id']: r.get('neighbors') or [] for r in (response.data or [])})
+        return lists
+
+    def _row(self, bookmark_id: str, user_id: str, neighbors: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            'bookmark_id': bookmark_id,
+            'user_id': user_id,
+            'neighbors': neighbors,
+            'updated_at': datetime.utcnow().isoformat(),
+        }
+
+    def _upsert_rows(self, rows: List[Dict[str, Any]]):
+        for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[i:i + UPSERT_CHUNK_SIZE]
+            if chunk:
+                self._get_supabase().table('bookmark_neighbors').upsert(
+                    chunk, on_conflict='bookmark_id'
+                ).execute()
+
+
+# Singleton instance
+neighbor_graph_service = NeighborGraphService()
@@ -0,0 +1,80 @@
+"""
+Executor de DAG para o pipeline de bookmarks.
+
+Cada etapa declara de quais etapas depende; etapas sem dependência entre
+si rodam em paralelo (asyncio). Ex: upload da thumbnail não espera o
+download do vídeo, e o upload para a cloud roda junto com a análise Gemini
+do arquivo local.
+
+Semântica (igual ao pipeline sequencial antigo):
+- Falha em uma etapa NÃO derruba o pipeline - o resultado dela vira None
+  e as dependentes rodam mesmo assim (decidem o que fazer sem o dado)
+- Uma etapa pode aguardar outra sob demanda com `await dag.wait(nome)`
+  (ex: fallback de thumbnail que só precisa do vídeo se o upload falhar)
+"""
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class PipelineDAG:
+    def __init__(self, name: str = "pipeline"):
+        self.name = name
+        self._stages: Dict[str, StageFunc] = {}
+        self._deps: Dict[str, List[str]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, func: StageFunc, deps: Optional[List[str]] = None) -> "PipelineDAG":
+        """
+        Registra etapa. `func(results)` recebe os resultados das etapas já concluídas.
+        Dependências precisam ter sido registradas antes (garante ausência de ciclos).
+        """
+        deps = deps or []
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Etapa '{name}' depende de '{dep}', que não foi registrada")
+        self._stages[name] = func
+        self._deps[name] = deps
+        return self
+
+    async def wait(self, name: str) -> Any:
+        """Aguarda etapa (já agendada) e retorna seu resultado (None se falhou ou não existe)"""
+        task = self._tasks.get(name)
+        if task is None:
+            return None
+        await asyncio.shield(task)
+        return self.results.get(name)
+
+    async def _run_stage(self, name: str):
+        for dep in self._deps[name]:
+            await asyncio.shield(self._tasks[dep])
+
+        started = time.time()
+        try:
+            self.results[name] = await self._stages[name](self.results)
+        except Exception as e:
+            logger.error(f"❌ [{self.name}] Etapa '{name}' falhou: {str(e)}")
+            self.results[name] = None
+            self.errors[name] = str(e)[:200]
+        finally:
+            self.timings[name] = time.time() - started
+
+    async def run(self) -> Dict[str, Any]:
+        """Agenda todas as etapas e aguarda o DAG inteiro"""
+        started = time.time()
+        for name in self._stages:
+            self._tasks[name] = asyncio.ensure_future(self._run_stage(name))
+
+        await asyncio.gather(*self._tasks.values())
+
+        timings = " ".join(f"{name}={elapsed:.1f}s" for name, elapsed in self.timings.items())
+        logger.info(f"⏱️ [{self.name}] DAG concluído em {time.time() - started:.1f}s | {timings}")
+        return self.results
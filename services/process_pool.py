@@ -0,0 +1,221 @@
+"""
+Pool async de subprocessos (ffmpeg, ffprobe, yt-dlp) com agendamento por CPU.
+
+Antes, ffmpeg/yt-dlp rodavam com `subprocess.run` dentro de métodos async:
+uma transcodificação de 10 minutos travava o event loop inteiro, e nada
+limitava quantos encodes disputavam os mesmos núcleos.
+
+Aqui:
+- Processos via asyncio.create_subprocess_exec (loop livre enquanto rodam)
+- Capacidade = SUBPROCESS_CPU_SLOTS (default: núcleos disponíveis ao
+  processo); cada job ocupa `weight` slots (encode x264 pesa mais que um
+  ffprobe)
+- Fila por prioridade quando não há slots: PRIORITY_INTERACTIVE (usuário
+  esperando: thumbnail, yt-dlp) antes de PRIORITY_ANALYSIS antes de
+  PRIORITY_BATCH (transcodificação)
+- Timeout (e cancelamento) mata o grupo de processos inteiro (yt-dlp pode
+  ter filhos) e levanta subprocess.TimeoutExpired, como subprocess.run
+- Métricas por programa: espera na fila, tempo de execução, timeouts
+  (/api/subprocess-stats)
+
+Uso:
+    result = await process_pool.run(["ffmpeg", ...], priority=PRIORITY_BATCH, timeout=600)
+    result.returncode, result.stdout, result.stderr  # subprocess.CompletedProcess
+"""
+import os
+import time
+import heapq
+import signal
+import asyncio
+import logging
+import itertools
+import subprocess
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_ANALYSIS = 5
+PRIORITY_BATCH = 10
+
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CPU_SLOTS = max(int(os.getenv("SUBPROCESS_CPU_SLOTS", "0")) or _available_cores(), 1)
+
+
+class _ProgramStats:
+    def __init__(self):
+        self.runs = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.queued = 0  # Execuções que precisaram esperar slot
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self.max_run_seconds = 0.0
+
+    def snapshot(self) -> Dict:
+        return {
+            "runs": self.runs,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "queued": self.queued,
+            "avg_wait_seconds": round(self.wait_seconds / self.runs, 3) if self.runs else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+            "avg_run_seconds": round(self.run_seconds / self.runs, 3) if self.runs else 0.0,
+            "max_run_seconds": round(self.max_run_seconds, 3),
+        }
+
+
+class _Scheduler:
+    """Slots + fila de prioridade de um event loop"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.running = 0
+        self.waiting: List = []  # heap (prioridade, ordem, weight, future)
+        self._order = itertools.count()
+
+    async def acquire(self, priority: int, weight: int) -> bool:
+        """Ocupa `weight` slots; retorna True se precisou esperar"""
+        if not self.waiting and self.in_use + weight <= self.capacity:
+            self.in_use += weight
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self._order), weight, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(weight)  # Slot já concedido: devolve
+            raise
+        return True
+
+    def release(self, weight: int):
+        self.in_use -= weight
+        # Cabeça da fila primeiro: prioridade baixa não fura quem espera slots
+        while self.waiting:
+            priority, order, head_weight, future = self.waiting[0]
+            if future.done():
+                heapq.heappop(self.waiting)
+                continue
+            if self.in_use + head_weight > self.capacity:
+                break
+            heapq.heappop(self.waiting)
+            self.in_use += head_weight
+            future.set_result(None)
+
+
+class ProcessPool:
+    def __init__(self, capacity: int = CPU_SLOTS):
+        self.capacity = capacity
+        self._schedulers: Dict[asyncio.AbstractEventLoop, _Scheduler] = {}
+        self._stats: Dict[str, _ProgramStats] = {}
+
+    def _scheduler(self) -> _Scheduler:
+        """Scheduler do loop atual (FastAPI e worker Celery têm loops próprios)"""
+        loop = asyncio.get_running_loop()
+        scheduler = self._schedulers.get(loop)
+        if scheduler is None:
+            for closed in [l for l in self._schedulers if l.is_closed()]:
+                self._schedulers.pop(closed, None)
+            scheduler = self._schedulers[loop] = _Scheduler(self.capacity)
+        return scheduler
+
+    @staticmethod
+    async def _kill(process: asyncio.subprocess.Process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        await process.wait()
+
+    async def run(
+        self,
+        args: Sequence[str],
+        priority: int = PRIORITY_ANALYSIS,
+        timeout: Optional[float] = None,
+        weight: int = 1,
+        text: bool = False
+    ) -> subprocess.CompletedProcess:
+        """
+        Executa programa quando houver slots livres
+
+        Args:
+            args: Comando (args[0] = programa, usado nas métricas)
+            priority: PRIORITY_INTERACTIVE / PRIORITY_ANALYSIS / PRIORITY_BATCH
+            timeout: Segundos de execução (sem contar a fila) antes do kill
+            weight: Slots de CPU ocupados (limitado à capacidade)
+            text: Decodifica stdout/stderr como UTF-8
+
+        Raises:
+            subprocess.TimeoutExpired: processo morto por timeout
+        """
+        args = list(args)
+        stats = self._stats.setdefault(os.path.basename(args[0]), _ProgramStats())
+        scheduler = self._scheduler()
+        weight = min(max(weight, 1), self.capacity)
+
+        queued_at = time.monotonic()
+        waited = await scheduler.acquire(priority, weight)
+        started = time.monotonic()
+        wait_seconds = started - queued_at
+        if waited:
+            stats.queued += 1
+            logger.debug(f"⏳ {args[0]} esperou {wait_seconds:.1f}s por slot de CPU")
+
+        scheduler.running += 1
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,  # Grupo próprio: kill alcança os filhos
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+            except asyncio.TimeoutError:
+                await self._kill(process)
+                stats.timeouts += 1
+                logger.warning(f"⏱️ {args[0]} morto após {timeout:g}s")
+                raise subprocess.TimeoutExpired(args, timeout)
+            except asyncio.CancelledError:
+                await self._kill(process)
+                raise
+        finally:
+            scheduler.running -= 1
+            scheduler.release(weight)
+            run_seconds = time.monotonic() - started
+            stats.runs += 1
+            stats.wait_seconds += wait_seconds
+            stats.max_wait_seconds = max(stats.max_wait_seconds, wait_seconds)
+            stats.run_seconds += run_seconds
+            stats.max_run_seconds = max(stats.max_run_seconds, run_seconds)
+
+        if process.returncode != 0:
+            stats.failed += 1
+        if text:
+            stdout = stdout.decode(errors="replace")
+            stderr = stderr.decode(errors="replace")
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+    def stats(self) -> Dict:
+        return {
+            "cpu_slots": self.capacity,
+            "slots_in_use": sum(s.in_use for s in self._schedulers.values()),
+            "running": sum(s.running for s in self._schedulers.values()),
+            "waiting": sum(len([w for w in s.waiting if not w[3].done()]) for s in self._schedulers.values()),
+            "programs": {name: stats.snapshot() for name, stats in self._stats.items()},
+        }
+
+
+# Singleton instance
+process_pool = ProcessPool()
@@ -0,0 +1,161 @@
+"""
+Resposta de arquivo com Range / If-Range / ETag (GET condicional).
+
+O FileResponse usado em /api/download-transcoded mandava o MP4 inteiro a
+cada requisição: o player Android faz seek com Range e clientes retomam
+downloads parciais - cada seek/retomada relia e reenviava o arquivo todo.
+
+Aqui:
+- Range de um intervalo (bytes=a-b, bytes=a-, bytes=-n) → 206 só com os
+  bytes pedidos; fora do arquivo → 416
+- If-Range: ETag diferente = ignora Range e manda o arquivo inteiro
+- If-None-Match igual ao ETag → 304 sem corpo
+- Zero-copy (sendfile) quando o servidor ASGI anuncia a extensão
+  `http.response.zerocopy`; senão lê só o intervalo pedido, em chunks,
+  fora do event loop
+- HEAD: só headers
+
+Uso:
+    return RangeFileResponse(request, path, etag=video_id, media_type="video/mp4",
+                             filename=f"{video_id}.mp4", immutable=True)
+"""
+import os
+import re
+from typing import Optional, Tuple
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 1024 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Intervalo (início, fim inclusivo) de um header Range
+
+    Returns:
+        (start, end), None se o header não é um intervalo único de bytes
+        válido (servir inteiro) ou (-1, -1) se começa depois do fim (416)
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None  # Múltiplos intervalos / unidade desconhecida: 200 com tudo
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:  # bytes=-n (últimos n bytes)
+        length = int(last)
+        if length == 0:
+            return -1, -1
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None  # bytes=5-2 é range-spec inválido: ignorado (RFC 9110 §14.1.1)
+    if start >= size:
+        return -1, -1
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class RangeFileResponse(Response):
+    def __init__(
+        self,
+        request: Request,
+        path: str,
+        etag: Optional[str] = None,
+        media_type: str = "application/octet-stream",
+        filename: Optional[str] = None,
+        immutable: bool = False
+    ):
+        """
+        Args:
+            request: Requisição (headers Range/If-Range/If-None-Match, método)
+            path: Arquivo a servir
+            etag: Identificador estável do conteúdo (default: tamanho + mtime)
+            filename: Content-Disposition attachment
+            immutable: Conteúdo nunca muda para esse path (cache de 1 ano no cliente)
+        """
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.etag = f'"{etag or f"{stat.st_size:x}-{stat.st_mtime_ns:x}"}"'
+        self.send_body = request.method != "HEAD"
+        self.start, self.end = 0, self.size - 1
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": self.etag,
+            "cache-control": "public, max-age=31536000, immutable" if immutable else "no-cache",
+        }
+        if filename:
+            headers["content-disposition"] = f'attachment; filename="{filename}"'
+
+        status_code = 200
+        range_header = request.headers.get("range")
+        if range_header and request.headers.get("if-range") not in (None, self.etag):
+            range_header = None  # Arquivo mudou desde o download parcial: manda inteiro
+
+        if _etag_matches(request.headers.get("if-none-match"), self.etag):
+            status_code = 304
+            self.send_body = False
+        elif range_header and self.size:
+            byte_range = _parse_range(range_header, self.size)
+            if byte_range == (-1, -1):
+                status_code = 416
+                self.send_body = False
+                headers["content-range"] = f"bytes */{self.size}"
+            elif byte_range:
+                status_code = 206
+                self.start, self.end = byte_range
+                headers["content-range"] = f"bytes {self.start}-{self.end}/{self.size}"
+
+        if status_code in (200, 206):
+            headers["content-length"] = str(self.end - self.start + 1 if self.size else 0)
+        elif status_code == 416:
+            headers["content-length"] = "0"
+
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        length = self.end - self.start + 1
+        if not self.send_body or not self.size or length <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                # sendfile: kernel copia direto do page cache para o socket
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": f.fileno(),
+                    "offset": self.start,
+                    "count": length,
+                    "more_body": False,
+                })
+                return
+
+            position = self.start
+            remaining = length
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, f.fileno(), min(CHUNK_SIZE, remaining), position)
+                if not chunk:
+                    break  # Arquivo truncado durante o envio
+                position += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
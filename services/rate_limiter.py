@@ -0,0 +1,250 @@
+"""
+Governador de taxa e concorrência por provedor (distribuído via Redis).
+
+Web e workers Celery compartilham os mesmos limites de Apify, Replicate,
+OpenAI, Gemini e Supabase. Antes, rajadas do auto-sync ou dos scripts de
+bulk download estouravam o rate limit do provedor e viravam
+`self.retry(countdown=...)`.
+
+Por provedor (e por chave de API, ex: cada token Apify):
+- Token bucket: `rate` requisições/s com rajada de até `burst`
+- Semáforo: no máximo `concurrency` chamadas em voo (lease com TTL, então
+  um processo que morre não segura a vaga para sempre)
+
+Quem não consegue vaga espera (fila) até `max_wait` segundos; depois disso
+a carga é descartada com RateLimitExceeded em vez de bater no provedor.
+Sem Redis, o limitador libera tudo (fail-open) para não derrubar o app.
+
+Config: RATE_LIMIT_<PROVEDOR>="rate,burst,concurrency" (ex: "5,10,4").
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# rate (req/s), burst, concurrency
+DEFAULT_LIMITS: Dict[str, Tuple[float, int, int]] = {
+    "apify": (1.0, 5, 4),        # Por token (actor runs)
+    "replicate": (5.0, 10, 8),   # Gemini Flash, Gemini 3 Pro, Whisper
+    "openai": (20.0, 40, 16),    # Embeddings + chat
+    "gemini": (20.0, 40, 8),     # Embeddings (API direta)
+    "supabase": (50.0, 100, 32), # Queries + metadados do storage (chamadas curtas)
+    "storage": (2.0, 5, 8),      # Transferências de vídeo (download → upload), longas
+}
+MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "60"))
+LEASE_TTL_SECONDS = int(os.getenv("RATE_LIMIT_LEASE_TTL_SECONDS", "900"))
+POLL_INTERVAL = 0.05
+REDIS_RETRY_SECONDS = 30
+
+# Token bucket atômico. Retorna 0 se consumiu um token, senão ms até o próximo.
+TOKEN_BUCKET_LUA = """
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+# Semáforo com lease. Retorna 1 se conseguiu a vaga.
+SEMAPHORE_ACQUIRE_LUA = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local holder = ARGV[4]
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - ttl)
+if redis.call('ZCARD', key) < limit then
+  redis.call('ZADD', key, now, holder)
+  redis.call('PEXPIRE', key, ttl)
+  return 1
+end
+return 0
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Sem vaga no provedor dentro do tempo máximo de espera (carga descartada)"""
+
+
+def _parse_limits(provider: str) -> Optional[Tuple[float, int, int]]:
+    raw = os.getenv(f"RATE_LIMIT_{provider.upper()}")
+    if raw:
+        try:
+            rate, burst, concurrency = [x.strip() for x in raw.split(",")]
+            return float(rate), int(burst), int(concurrency)
+        except ValueError:
+            logger.warning(f"⚠️ RATE_LIMIT_{provider.upper()} inválido ('{raw}') - usando padrão")
+    return DEFAULT_LIMITS.get(provider)
+
+
+class RateLimiter:
+    def __init__(self):
+        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self._async_redis = None
+        self._sync_redis = None
+        self._redis_down_until = 0.0
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _stat(self, provider: str) -> Dict[str, float]:
+        return self.stats.setdefault(provider, {"acquired": 0, "shed": 0, "waited_ms": 0.0})
+
+    def _redis_failed(self, e: Exception):
+        if time.time() >= self._redis_down_until:
+            logger.warning(f"⚠️ Rate limiter sem Redis ({str(e)[:80]}) - liberando chamadas (fail-open)")
+        self._redis_down_until = time.time() + REDIS_RETRY_SECONDS
+
+    @staticmethod
+    def _keys(provider: str, key_id: Optional[str]) -> Tuple[str, str]:
+        suffix = f"{provider}:{key_id}" if key_id else provider
+        return f"ratelimit:bucket:{suffix}", f"ratelimit:sem:{suffix}"
+
+    # ------------------------------------------------------------------
+    # Async (event loop)
+    # ------------------------------------------------------------------
+
+    async def _get_async_redis(self):
+        if self._async_redis is None:
+            import redis.asyncio as redis
+
+            self._async_redis = redis.from_url(self.redis_url, socket_timeout=2)
+        return self._async_redis
+
+    @asynccontextmanager
+    async def limit(self, provider: str, key_id: Optional[str] = None, max_wait: float = MAX_WAIT_SECONDS):
+        """Aguarda token + vaga de concorrência; libera a vaga ao sair"""
+        limits = _parse_limits(provider)
+        if limits is None or time.time() < self._redis_down_until:
+            yield
+            return
+
+        rate, burst, concurrency = limits
+        bucket_key, sem_key = self._keys(provider, key_id)
+        holder = uuid.uuid4().hex
+        started = time.monotonic()
+        acquired = False
+
+        try:
+            client = await self._get_async_redis()
+
+            # 1. Token bucket (taxa)
+            while True:
+                wait_ms = await client.eval(TOKEN_BUCKET_LUA, 1, bucket_key, rate, burst, int(time.time() * 1000))
+                if int(wait_ms) == 0:
+                    break
+                if time.monotonic() - started + int(wait_ms) / 1000 > max_wait:
+                    raise RateLimitExceeded(f"{provider}: taxa excedida por mais de {max_wait:.0f}s")
+                await asyncio.sleep(int(wait_ms) / 1000)
+
+            # 2. Semáforo (concorrência)
+            while not int(await client.eval(
+                SEMAPHORE_ACQUIRE_LUA, 1, sem_key, concurrency, int(time.time() * 1000), LEASE_TTL_SECONDS * 1000, holder
+            )):
+                if time.monotonic() - started > max_wait:
+                    raise RateLimitExceeded(f"{provider}: {concurrency} chamadas em voo por mais de {max_wait:.0f}s")
+                await asyncio.sleep(POLL_INTERVAL)
+            acquired = True
+
+        except RateLimitExceeded:
+            self._stat(provider)["shed"] += 1
+            logger.warning(f"🚦 Carga descartada - {provider}{':' + key_id if key_id else ''}")
+            raise
+        except Exception as e:
+            self._redis_failed(e)
+
+        stat = self._stat(provider)
+        stat["acquired"] += 1
+        stat["waited_ms"] += (time.monotonic() - started) * 1000
+
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    await client.zrem(sem_key, holder)
+                except Exception as e:
+                    self._redis_failed(e)
+
+    # ------------------------------------------------------------------
+    # Sync (workers Celery / threads)
+    # ------------------------------------------------------------------
+
+    def _get_sync_redis(self):
+        if self._sync_redis is None:
+            import redis as redis_sync
+
+            self._sync_redis = redis_sync.from_url(self.redis_url, socket_timeout=2)
+        return self._sync_redis
+
+    @contextmanager
+    def limit_sync(self, provider: str, key_id: Optional[str] = None, max_wait: float = MAX_WAIT_SECONDS):
+        """Versão bloqueante de limit() para código síncrono"""
+        limits = _parse_limits(provider)
+        if limits is None or time.time() < self._redis_down_until:
+            yield
+            return
+
+        rate, burst, concurrency = limits
+        bucket_key, sem_key = self._keys(provider, key_id)
+        holder = uuid.uuid4().hex
+        started = time.monotonic()
+        acquired = False
+
+        try:
+            client = self._get_sync_redis()
+
+            while True:
+                wait_ms = int(client.eval(TOKEN_BUCKET_LUA, 1, bucket_key, rate, burst, int(time.time() * 1000)))
+                if wait_ms == 0:
+                    break
+                if time.monotonic() - started + wait_ms / 1000 > max_wait:
+                    raise RateLimitExceeded(f"{provider}: taxa excedida por mais de {max_wait:.0f}s")
+                time.sleep(wait_ms / 1000)
+
+            while not int(client.eval(
+                SEMAPHORE_ACQUIRE_LUA, 1, sem_key, concurrency, int(time.time() * 1000), LEASE_TTL_SECONDS * 1000, holder
+            )):
+                if time.monotonic() - started > max_wait:
+                    raise RateLimitExceeded(f"{provider}: {concurrency} chamadas em voo por mais de {max_wait:.0f}s")
+                time.sleep(POLL_INTERVAL)
+            acquired = True
+
+        except RateLimitExceeded:
+            self._stat(provider)["shed"] += 1
+            logger.warning(f"🚦 Carga descartada - {provider}{':' + key_id if key_id else ''}")
+            raise
+        except Exception as e:
+            self._redis_failed(e)
+
+        stat = self._stat(provider)
+        stat["acquired"] += 1
+        stat["waited_ms"] += (time.monotonic() - started) * 1000
+
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    client.zrem(sem_key, holder)
+                except Exception as e:
+                    self._redis_failed(e)
+
+
+# Singleton instance
+rate_limiter = RateLimiter()
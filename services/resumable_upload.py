@@ -0,0 +1,164 @@
+"""
+Upload resumível (protocolo TUS) para Supabase Storage.
+
+O upload padrão do SDK manda o arquivo inteiro numa requisição - exige o
+vídeo completo em disco (ou em memória). Aqui os bytes entram aos poucos
+(`write`) e saem em chunks de 6MB (tamanho exigido pelo Supabase), então a
+memória por transferência fica limitada a ~1 chunk e dá para encadear
+direto com o download (sem arquivo temporário).
+
+Chunk que falha por rede é reenviado a partir do offset confirmado pelo
+servidor (HEAD), sem recomeçar o upload.
+
+Uso (síncrono - em código async, rodar via run_blocking):
+    upload = ResumableUpload("user-videos", "blobs/incoming/abc.mp4")
+    for chunk in response.iter_bytes():
+        upload.write(chunk)
+    size = upload.finish()
+"""
+import os
+import time
+import base64
+import logging
+from typing import Optional
+
+import httpx
+
+from services.http_client_pool import http_client_pool
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 6 * 1024 * 1024  # Supabase exige exatamente 6MB (exceto o último)
+MAX_RETRIES = 3
+TUS_VERSION = "1.0.0"
+
+http_client_pool.register("storage", httpx.Timeout(120.0, connect=30.0))
+
+
+def _encode_metadata(**fields: str) -> str:
+    return ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in fields.items())
+
+
+class ResumableUpload:
+    def __init__(
+        self,
+        bucket: str,
+        object_name: str,
+        content_type: str = "video/mp4",
+        total_size: Optional[int] = None,
+        upsert: bool = True
+    ):
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        if not supabase_url or not supabase_key:
+            raise ValueError("SUPABASE_URL e SUPABASE_SERVICE_ROLE_KEY são obrigatórios")
+
+        self.endpoint = f"{supabase_url.rstrip('/')}/storage/v1/upload/resumable"
+        self.bucket = bucket
+        self.object_name = object_name
+        self.content_type = content_type
+        self.total_size = total_size  # None = Upload-Defer-Length (tamanho só no fim)
+        self.upsert = upsert
+        self.offset = 0
+        self.location: Optional[str] = None
+        self._buffer = bytearray()
+        self._client = http_client_pool.get_sync("storage")
+        self._auth = {
+            "authorization": f"Bearer {supabase_key}",
+            "apikey": supabase_key,
+            "Tus-Resumable": TUS_VERSION,
+        }
+
+    # ------------------------------------------------------------------
+    # Protocolo
+    # ------------------------------------------------------------------
+
+    def _create(self):
+        headers = {
+            "x-upsert": "true" if self.upsert else "false",
+            "Upload-Metadata": _encode_metadata(
+                bucketName=self.bucket,
+                objectName=self.object_name,
+                contentType=self.content_type,
+                cacheControl="3600",
+            ),
+        }
+        if self.total_size is not None:
+            headers["Upload-Length"] = str(self.total_size)
+        else:
+            headers["Upload-Defer-Length"] = "1"
+
+        response = self._client.post(self.endpoint, headers={**self._auth, **headers})
+        response.raise_for_status()
+        location = response.headers.get("Location")
+        if not location:
+            raise Exception("Servidor TUS não retornou Location")
+        self.location = location if location.startswith("http") else str(httpx.URL(self.endpoint).join(location))
+
+    def _server_offset(self) -> int:
+        response = self._client.head(self.location, headers=self._auth)
+        response.raise_for_status()
+        return int(response.headers["Upload-Offset"])
+
+    def _send(self, chunk: bytes, final: bool):
+        if self.location is None:
+            self._create()
+
+        attempt = 0
+        while True:
+            headers = {
+                **self._auth,
+                "Content-Type": "application/offset+octet-stream",
+                "Upload-Offset": str(self.offset),
+            }
+            if final and self.total_size is None:
+                headers["Upload-Length"] = str(self.offset + len(chunk))
+            try:
+                response = self._client.patch(self.location, content=chunk, headers=headers)
+                response.raise_for_status()
+                self.offset = int(response.headers.get("Upload-Offset", self.offset + len(chunk)))
+                return
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                attempt += 1
+                if attempt >= MAX_RETRIES:
+                    raise
+                wait_time = 2 ** attempt
+                logger.warning(f"⚠️ Chunk TUS falhou em {self.offset} (tentativa {attempt}/{MAX_RETRIES}): {str(e)[:80]} - retomando em {wait_time}s")
+                time.sleep(wait_time)
+
+                # Retoma do que o servidor já recebeu
+                server_offset = self._server_offset()
+                skip = server_offset - self.offset
+                if skip < 0 or skip > len(chunk):
+                    raise Exception(f"Offset TUS inconsistente (local {self.offset}, servidor {server_offset})")
+                chunk = chunk[skip:]
+                self.offset = server_offset
+                if not chunk and not (final and self.total_size is None):
+                    return
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def write(self, data: bytes):
+        """Acumula bytes e envia chunks completos (sempre guarda 1 byte+ para o final)"""
+        self._buffer.extend(data)
+        while len(self._buffer) > CHUNK_SIZE:
+            self._send(bytes(self._buffer[:CHUNK_SIZE]), final=False)
+            del self._buffer[:CHUNK_SIZE]
+
+    def finish(self) -> int:
+        """Envia o último chunk e retorna o tamanho total enviado"""
+        if not self._buffer and self.offset == 0:
+            raise Exception("Upload vazio")
+        self._send(bytes(self._buffer), final=True)
+        self._buffer = bytearray()
+        return self.offset
+
+    def abort(self):
+        """Descarta upload parcial (best-effort)"""
+        try:
+            if self.location:
+                self._client.delete(self.location, headers=self._auth)
+        except Exception:
+            pass
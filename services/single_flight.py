@@ -0,0 +1,190 @@
+"""
+Single-flight: coalescência de chamadas idênticas simultâneas.
+
+Se a mesma URL chega duas vezes ao mesmo tempo (dois usuários, retry, app
+reenviando), só uma chamada paga (ex: actor run do Apify) é feita - as
+outras esperam o resultado dela.
+
+Duas camadas:
+- No processo: chamadas concorrentes aguardam o mesmo Future
+- Entre processos (web + workers Celery): lock no Redis (SET NX PX) elege
+  o líder; o resultado é publicado via pub/sub e guardado por alguns
+  segundos (quem se inscreve depois do publish ainda pega)
+
+Se o líder morrer (lock expira sem resultado), um seguidor assume.
+Sem Redis, só a camada local funciona (fail-open).
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LOCK_TTL_SECONDS = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL_SECONDS", "300"))
+RESULT_TTL_SECONDS = 30
+POLL_INTERVAL = 1.0
+REDIS_RETRY_SECONDS = 30
+
+
+class SingleFlight:
+    def __init__(self):
+        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"leader": 0, "coalesced_local": 0, "coalesced_remote": 0, "takeover": 0}
+
+    async def _get_redis(self):
+        if time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            try:
+                import redis.asyncio as redis
+
+                self._redis = redis.from_url(self.redis_url, socket_timeout=5)
+            except Exception as e:
+                self._redis_failed(e)
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        if time.time() >= self._redis_down_until:
+            logger.warning(f"⚠️ Single-flight sem Redis ({str(e)[:80]}) - coalescendo só no processo")
+        self._redis_down_until = time.time() + REDIS_RETRY_SECONDS
+
+    async def run(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda value: value,
+    ) -> Any:
+        """
+        Executa `func()` uma única vez por `key` entre chamadas simultâneas.
+
+        Args:
+            key: Chave de deduplicação (ex: URL normalizada)
+            func: Coroutine function que produz o resultado
+            encode/decode: Conversão resultado <-> JSON para o broadcast entre processos
+
+        Raises:
+            ValueError: Se o líder falhou (mesma mensagem para todos os seguidores)
+        """
+        existing = self._inflight.get(key)
+        if existing is not None:
+            self.stats["coalesced_local"] += 1
+            return await asyncio.shield(existing)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._run_distributed(key, func, encode, decode)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita "exception was never retrieved" quando não há seguidores
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_distributed(self, key, func, encode, decode) -> Any:
+        client = await self._get_redis()
+        if client is None:
+            self.stats["leader"] += 1
+            return await func()
+
+        lock_key = f"singleflight:lock:{key}"
+        result_key = f"singleflight:result:{key}"
+        channel = f"singleflight:channel:{key}"
+        owner = uuid.uuid4().hex
+
+        try:
+            acquired = await client.set(lock_key, owner, nx=True, px=LOCK_TTL_SECONDS * 1000)
+        except Exception as e:
+            self._redis_failed(e)
+            self.stats["leader"] += 1
+            return await func()
+
+        if acquired:
+            return await self._lead(client, key, func, encode, lock_key, result_key, channel, owner)
+
+        # Outro processo já está buscando - aguardar o broadcast
+        logger.info(f"🔗 Single-flight: aguardando chamada em andamento ({key})")
+        payload = await self._follow(client, lock_key, result_key, channel)
+        if payload is None:
+            # Líder morreu sem publicar (ou Redis falhou) - assume
+            self.stats["takeover"] += 1
+            logger.warning(f"⚠️ Single-flight: líder sumiu sem resultado - executando ({key})")
+            return await self._run_distributed(key, func, encode, decode)
+
+        self.stats["coalesced_remote"] += 1
+        if "error" in payload:
+            raise ValueError(payload["error"])
+        return decode(payload["result"])
+
+    async def _lead(self, client, key, func, encode, lock_key, result_key, channel, owner) -> Any:
+        self.stats["leader"] += 1
+        payload = {"error": "Chamada cancelada"}
+        try:
+            try:
+                await client.delete(result_key)  # Resultado de uma rodada anterior
+            except Exception as e:
+                self._redis_failed(e)
+
+            result = await func()
+            payload = {"result": encode(result)}
+            return result
+        except Exception as e:
+            payload = {"error": str(e)}
+            raise
+        finally:
+            try:
+                message = json.dumps(payload, default=str)
+                pipe = client.pipeline(transaction=False)
+                pipe.set(result_key, message, ex=RESULT_TTL_SECONDS)
+                pipe.publish(channel, message)
+                await pipe.execute()
+                # Só libera o lock se ainda for nosso
+                if await client.get(lock_key) == owner.encode():
+                    await client.delete(lock_key)
+            except Exception as e:
+                self._redis_failed(e)
+
+    async def _follow(self, client, lock_key, result_key, channel) -> Optional[dict]:
+        """Aguarda o resultado do líder. Retorna None se o lock sumiu sem resultado."""
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            deadline = time.monotonic() + LOCK_TTL_SECONDS + POLL_INTERVAL
+            while time.monotonic() < deadline:
+                # Resultado publicado antes do subscribe
+                stored = await client.get(result_key)
+                if stored:
+                    return json.loads(stored)
+
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=POLL_INTERVAL)
+                if message and message.get("type") == "message":
+                    return json.loads(message["data"])
+
+                if not await client.exists(lock_key):
+                    stored = await client.get(result_key)
+                    return json.loads(stored) if stored else None
+            return None
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        finally:
+            try:
+                await pubsub.unsubscribe(channel)
+                await pubsub.close()
+            except Exception:
+                pass
+
+
+# Singleton instance
+single_flight = SingleFlight()
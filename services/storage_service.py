@@ -10,6 +10,8 @@ import hashlib
 from typing import Optional
 from supabase import create_client, Client
 
+from services.http_client_pool import http_client_pool
+
 
 class StorageService:
     def __init__(self):
@@ -95,14 +97,13 @@ class StorageService:
                 pass  # Continuar com upload
 
             # Fazer download da thumbnail
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(thumbnail_url)
+            response = await http_client_pool.get("media").get(thumbnail_url, timeout=30.0)
 
-                if response.status_code != 200:
-                    print(f"❌ Falha ao baixar thumbnail: HTTP {response.status_code}")
-                    return None
+            if response.status_code != 200:
+                print(f"❌ Falha ao baixar thumbnail: HTTP {response.status_code}")
+                return None
 
-                image_data = response.content
+            image_data = response.content
 
             # Upload para Supabase Storage
             self.supabase.storage.from_(self.bucket_name).upload(
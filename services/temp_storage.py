@@ -0,0 +1,363 @@
+"""
+Gerenciador de armazenamento temporário com cota e janitor.
+
+Antes: arquivos soltos em /tmp com nomes ad-hoc (NamedTemporaryFile,
+temp_frames/ compartilhado entre análises concorrentes, *_audio.mp3) e o
+diretório de vídeos transcodificados só crescia - sob carga o disco
+enchia e tudo falhava junto.
+
+Agora:
+- Todo arquivo de trabalho vive num diretório por job em TEMP_STORAGE_DIR
+  (`with temp_storage.job("download") as job: path = job.file("video.mp4")`),
+  apagado inteiro no fim do job
+- Reserva antes de baixar: o job declara quanto espera escrever; se a cota
+  (TEMP_STORAGE_QUOTA_MB) ou o disco livre (TEMP_STORAGE_MIN_FREE_MB) não
+  comportam, espera até TEMP_STORAGE_RESERVE_TIMEOUT_SECONDS e então recusa
+  com DiskFullError. A reserva fica num arquivo no diretório do job, então
+  vale entre processos (web + workers no mesmo disco)
+- Janitor (tasks.cleanup_temp_files_task e loop no processo web): apaga
+  jobs abandonados (TEMP_STORAGE_MAX_AGE_HOURS), sobras antigas do formato
+  legado em /tmp e aplica cota + idade nos diretórios de cache registrados
+  (ex: vídeos transcodificados), removendo os mais antigos primeiro
+- Métricas em /api/temp-storage-stats
+"""
+import os
+import time
+import uuid
+import fcntl
+import glob
+import shutil
+import asyncio
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from services.executor_service import run_blocking
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+TEMP_ROOT = os.getenv("TEMP_STORAGE_DIR", os.path.join(tempfile.gettempdir(), "video-refs"))
+QUOTA_BYTES = int(float(os.getenv("TEMP_STORAGE_QUOTA_MB", "2048")) * MB)
+MIN_FREE_BYTES = int(float(os.getenv("TEMP_STORAGE_MIN_FREE_MB", "512")) * MB)
+DEFAULT_RESERVE_BYTES = int(float(os.getenv("TEMP_STORAGE_DEFAULT_RESERVE_MB", "100")) * MB)
+RESERVE_TIMEOUT = float(os.getenv("TEMP_STORAGE_RESERVE_TIMEOUT_SECONDS", "60"))
+MAX_AGE_SECONDS = float(os.getenv("TEMP_STORAGE_MAX_AGE_HOURS", "6")) * 3600
+JANITOR_INTERVAL_SECONDS = float(os.getenv("TEMP_JANITOR_INTERVAL_MINUTES", "15")) * 60
+RESERVE_POLL_SECONDS = 1.0
+
+RESERVATION_FILE = ".reserved"
+LOCK_FILE = ".lock"
+
+# Sobras do formato antigo (arquivos soltos no /tmp), apagadas pelo janitor se velhas.
+# Só os nomes que o código antigo gerava - o tmpdir é do sistema inteiro.
+_UUID = "????????-????-????-????-????????????"
+LEGACY_PATTERNS = [
+    "tmp????????.mp4", "tmp????????.m4a", "tmp????????.mp3", "tmp????????.txt",  # NamedTemporaryFile
+    "tmp????????_audio.mp3",                                                      # áudio extraído
+    f"{_UUID}.mp4", f"{_UUID}_audio.mp3",                                         # /tmp/<bookmark_id>.mp4
+    f"video_{_UUID}*", f"thumb_{_UUID}*",
+    "temp_frames",
+]
+
+
+class DiskFullError(Exception):
+    """Sem espaço (cota ou disco) para reservar o job dentro do timeout"""
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path: str) -> int:
+    """Remove arquivo ou diretório; retorna bytes liberados"""
+    try:
+        if os.path.isdir(path):
+            size = _tree_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            size = os.path.getsize(path)
+            os.unlink(path)
+        return size
+    except OSError:
+        return 0
+
+
+class TempJob:
+    """Diretório de trabalho de um job (apagado inteiro no cleanup)"""
+
+    def __init__(self, storage: "TempStorage", path: str, reserved: int):
+        self._storage = storage
+        self.path = path
+        self.reserved = reserved
+
+    def file(self, name: str) -> str:
+        """Caminho de arquivo dentro do job"""
+        return os.path.join(self.path, name)
+
+    def subdir(self, name: str) -> str:
+        """Subdiretório (criado) dentro do job"""
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def usage(self) -> int:
+        return _tree_size(self.path)
+
+    def cleanup(self):
+        self._storage.release(self)
+
+    def __enter__(self) -> "TempJob":
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+
+class TempStorage:
+    def __init__(self, root: str = TEMP_ROOT):
+        self.root = root
+        self._local_lock = threading.Lock()
+        self._cache_dirs: Dict[str, Tuple[int, float]] = {}
+        self._janitor_task: Optional[asyncio.Task] = None
+        self.counters = {
+            "jobs": 0,
+            "waits": 0,
+            "refused": 0,
+            "janitor_runs": 0,
+            "evicted_files": 0,
+            "evicted_bytes": 0,
+        }
+
+    def register_cache_dir(self, path: str, quota_bytes: int, max_age_seconds: float):
+        """Diretório persistente (ex: transcodificados) sujeito a cota + idade no janitor"""
+        self._cache_dirs[str(path)] = (quota_bytes, max_age_seconds)
+
+    # ------------------------------------------------------------------
+    # Reserva
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _lock(self):
+        """Lock entre processos (flock) + threads"""
+        os.makedirs(self.root, exist_ok=True)
+        with self._local_lock, open(os.path.join(self.root, LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _job_dirs(self) -> List[str]:
+        try:
+            return [
+                entry.path for entry in os.scandir(self.root)
+                if entry.is_dir(follow_symlinks=False)
+            ]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _reserved(job_dir: str) -> int:
+        try:
+            with open(os.path.join(job_dir, RESERVATION_FILE)) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _committed(self) -> int:
+        """Bytes comprometidos: por job, o maior entre reservado e já escrito"""
+        return sum(max(self._reserved(d), _tree_size(d)) for d in self._job_dirs())
+
+    def _try_reserve(self, prefix: str, reserve_bytes: int) -> Optional[TempJob]:
+        # Job maior que a cota inteira ainda roda quando o storage está vazio
+        reserve_bytes = min(reserve_bytes, QUOTA_BYTES)
+        with self._lock():
+            committed = self._committed()
+            free = shutil.disk_usage(self.root).free
+            if committed + reserve_bytes > QUOTA_BYTES or free - reserve_bytes < MIN_FREE_BYTES:
+                return None
+
+            path = os.path.join(self.root, f"{prefix}-{uuid.uuid4().hex[:12]}")
+            os.makedirs(path)
+            with open(os.path.join(path, RESERVATION_FILE), "w") as f:
+                f.write(str(reserve_bytes))
+
+        self.counters["jobs"] += 1
+        return TempJob(self, path, reserve_bytes)
+
+    def _refused(self, prefix: str, reserve_bytes: int):
+        self.counters["refused"] += 1
+        logger.error(f"💾 Sem espaço temporário para '{prefix}' ({reserve_bytes / MB:.0f}MB) após {RESERVE_TIMEOUT:.0f}s")
+        return DiskFullError(f"Sem espaço temporário para {reserve_bytes / MB:.0f}MB (cota {QUOTA_BYTES / MB:.0f}MB)")
+
+    def job(self, prefix: str = "job", reserve_bytes: Optional[int] = None) -> TempJob:
+        """Cria diretório de job reservando espaço (bloqueia até RESERVE_TIMEOUT)"""
+        reserve_bytes = DEFAULT_RESERVE_BYTES if reserve_bytes is None else reserve_bytes
+        deadline = time.monotonic() + RESERVE_TIMEOUT
+        waited = False
+        while True:
+            job = self._try_reserve(prefix, reserve_bytes)
+            if job is not None:
+                return job
+            if not waited:
+                waited = True
+                self.counters["waits"] += 1
+                logger.warning(f"⏳ Disco temporário cheio - '{prefix}' aguardando {reserve_bytes / MB:.0f}MB...")
+            if time.monotonic() >= deadline:
+                raise self._refused(prefix, reserve_bytes)
+            time.sleep(RESERVE_POLL_SECONDS)
+
+    async def ajob(self, prefix: str = "job", reserve_bytes: Optional[int] = None) -> TempJob:
+        """Versão async de job() (espera sem travar o event loop)"""
+        reserve_bytes = DEFAULT_RESERVE_BYTES if reserve_bytes is None else reserve_bytes
+        deadline = time.monotonic() + RESERVE_TIMEOUT
+        waited = False
+        while True:
+            # flock + varredura dos jobs: fora do event loop
+            job = await run_blocking("default", self._try_reserve, prefix, reserve_bytes)
+            if job is not None:
+                return job
+            if not waited:
+                waited = True
+                self.counters["waits"] += 1
+                logger.warning(f"⏳ Disco temporário cheio - '{prefix}' aguardando {reserve_bytes / MB:.0f}MB...")
+            if time.monotonic() >= deadline:
+                raise self._refused(prefix, reserve_bytes)
+            await asyncio.sleep(RESERVE_POLL_SECONDS)
+
+    def release(self, job: TempJob):
+        shutil.rmtree(job.path, ignore_errors=True)
+
+    def release_path(self, path: Optional[str]):
+        """Libera o job dono de `path` (ou apaga o arquivo, se fora do storage)"""
+        if not path:
+            return
+        root = os.path.abspath(self.root) + os.sep
+        absolute = os.path.abspath(path)
+        if absolute.startswith(root):
+            job_dir = os.path.join(self.root, absolute[len(root):].split(os.sep, 1)[0])
+            shutil.rmtree(job_dir, ignore_errors=True)
+        elif os.path.exists(absolute):
+            os.unlink(absolute)
+
+    # ------------------------------------------------------------------
+    # Janitor
+    # ------------------------------------------------------------------
+
+    def _evict(self, path: str):
+        freed = _remove(path)
+        if freed or not os.path.exists(path):
+            self.counters["evicted_files"] += 1
+            self.counters["evicted_bytes"] += freed
+
+    def sweep(self) -> Dict:
+        """Remove jobs abandonados, sobras legadas e aplica cota nos caches"""
+        now = time.time()
+        evicted_before = self.counters["evicted_files"]
+        freed_before = self.counters["evicted_bytes"]
+
+        # 1. Jobs abandonados (processo morreu antes do cleanup)
+        for job_dir in self._job_dirs():
+            try:
+                if now - os.path.getmtime(os.path.join(job_dir, RESERVATION_FILE)) > MAX_AGE_SECONDS:
+                    self._evict(job_dir)
+            except OSError:
+                if now - os.path.getmtime(job_dir) > MAX_AGE_SECONDS:
+                    self._evict(job_dir)
+
+        # 2. Arquivos soltos do formato antigo no /tmp
+        tmp = tempfile.gettempdir()
+        for pattern in LEGACY_PATTERNS:
+            for path in glob.glob(os.path.join(tmp, pattern)):
+                try:
+                    if now - os.path.getmtime(path) > MAX_AGE_SECONDS:
+                        self._evict(path)
+                except OSError:
+                    pass
+
+        # 3. Diretórios de cache: idade, depois cota (menos usados primeiro)
+        for cache_dir, (quota_bytes, max_age) in self._cache_dirs.items():
+            files = []
+            for entry in os.scandir(cache_dir) if os.path.isdir(cache_dir) else []:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat()
+                if entry.name.startswith("."):
+                    # Oculto = escrita em andamento (renomeado ao concluir); só sai se abandonado
+                    if now - stat.st_mtime > MAX_AGE_SECONDS:
+                        self._evict(entry.path)
+                    continue
+                files.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            for last_used, size, path in files:
+                if now - last_used > max_age or total > quota_bytes:
+                    self._evict(path)
+                    total -= size
+
+        self.counters["janitor_runs"] += 1
+        result = {
+            "files_deleted": self.counters["evicted_files"] - evicted_before,
+            "mb_freed": round((self.counters["evicted_bytes"] - freed_before) / MB, 1),
+        }
+        if result["files_deleted"]:
+            logger.info(f"🧹 Janitor: {result['files_deleted']} item(ns) removido(s), {result['mb_freed']}MB liberados")
+        return result
+
+    async def start_janitor(self):
+        """Janitor periódico no processo web (disco do web ≠ disco dos workers)"""
+        if self._janitor_task is None:
+            self._janitor_task = asyncio.ensure_future(self._janitor_loop())
+
+    async def stop_janitor(self):
+        if self._janitor_task:
+            self._janitor_task.cancel()
+            self._janitor_task = None
+
+    async def _janitor_loop(self):
+        while True:
+            try:
+                await run_blocking("default", self.sweep)
+            except Exception as e:
+                logger.warning(f"⚠️ Janitor de temporários falhou: {str(e)[:100]}")
+            await asyncio.sleep(JANITOR_INTERVAL_SECONDS)
+
+    def stats(self) -> Dict:
+        job_dirs = self._job_dirs()
+        used = sum(_tree_size(d) for d in job_dirs)
+        reserved = sum(self._reserved(d) for d in job_dirs)
+        try:
+            disk = shutil.disk_usage(self.root if os.path.isdir(self.root) else tempfile.gettempdir())
+            disk_free_mb = round(disk.free / MB, 1)
+        except OSError:
+            disk_free_mb = None
+        return {
+            **self.counters,
+            "root": self.root,
+            "active_jobs": len(job_dirs),
+            "used_mb": round(used / MB, 1),
+            "reserved_mb": round(reserved / MB, 1),
+            "quota_mb": round(QUOTA_BYTES / MB, 1),
+            "disk_free_mb": disk_free_mb,
+            "cache_dirs": {
+                path: {
+                    "used_mb": round(_tree_size(path) / MB, 1) if os.path.isdir(path) else 0.0,
+                    "quota_mb": round(quota / MB, 1),
+                }
+                for path, (quota, _) in self._cache_dirs.items()
+            },
+        }
+
+
+# Singleton instance
+temp_storage = TempStorage()
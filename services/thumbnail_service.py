@@ -13,15 +13,18 @@ Melhorias v2:
 - Logs detalhados para debug
 """
 
-import httpx
 import asyncio
 import logging
-import subprocess
-import tempfile
 from typing import Optional, Dict
 from supabase import Client
 import os
 
+from services.executor_service import run_blocking
+from services.http_client_pool import http_client_pool
+from services.temp_storage import temp_storage
+from services.media_toolkit import media_toolkit, MediaToolError
+from services.process_pool import PRIORITY_INTERACTIVE
+
 logger = logging.getLogger(__name__)
 
 # Configurações de retry
@@ -92,10 +95,9 @@ class ThumbnailService:
         # 1. Baixar imagem da URL original
         logger.debug(f"⬇️ [{bookmark_id[:8]}] Baixando imagem: {thumbnail_url[:60]}...")
 
-        async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT) as client:
-            response = await client.get(thumbnail_url, follow_redirects=True)
-            response.raise_for_status()
-            image_bytes = response.content
+        response = await http_client_pool.get("media").get(thumbnail_url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        image_bytes = response.content
 
         size_kb = len(image_bytes) / 1024
         logger.info(f"✅ [{bookmark_id[:8]}] Imagem baixada: {size_kb:.1f}KB")
@@ -113,8 +115,8 @@ class ThumbnailService:
         try:
             # Executa upload síncrono com timeout
             await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None,
+                run_blocking(
+                    "supabase",
                     lambda: self.supabase.storage.from_(self.bucket_name).upload(
                         path=cloud_path,
                         file=image_bytes,
@@ -131,7 +133,9 @@ class ThumbnailService:
         # 5. Gerar signed URL válida por 1 ano
         logger.debug(f"🔑 [{bookmark_id[:8]}] Gerando signed URL...")
 
-        signed_url = self.supabase.storage.from_(self.bucket_name).create_signed_url(
+        signed_url = await run_blocking(
+            "supabase",
+            self.supabase.storage.from_(self.bucket_name).create_signed_url,
             path=cloud_path,
             expires_in=31536000  # 1 ano
         )
@@ -194,7 +198,7 @@ class ThumbnailService:
         Usado quando a thumbnail original do Instagram/TikTok falha.
 
         Args:
-            video_path: Caminho local do vídeo já baixado
+            video_path: Caminho local do vídeo já baixado ou URL direta (http/https)
             user_id: ID do usuário
             bookmark_id: ID do bookmark
             timestamp_seconds: Segundo do vídeo para extrair (default: 2.0 para evitar fades)
@@ -202,49 +206,33 @@ class ThumbnailService:
         Returns:
             URL da thumbnail no Supabase Storage ou None se falhar
         """
-        temp_frame_path = None
+        job = None
 
         try:
             logger.info(f"🎬 [{bookmark_id[:8]}] Extraindo frame do segundo {timestamp_seconds} como thumbnail fallback...")
 
-            # Verificar se arquivo existe
-            if not os.path.exists(video_path):
+            # Verificar se arquivo existe (URL remota: ffmpeg baixa só o trecho do frame)
+            if not video_path.startswith(("http://", "https://")) and not os.path.exists(video_path):
                 logger.error(f"❌ [{bookmark_id[:8]}] Vídeo não encontrado: {video_path}")
                 return None
 
-            # Criar arquivo temporário para o frame
-            temp_frame_path = tempfile.mktemp(suffix=".jpg")
-
-            # Usar ffmpeg para extrair frame
-            # -ss: seek para o timestamp
-            # -vframes 1: extrair apenas 1 frame
-            # -q:v 2: qualidade alta (1-31, menor = melhor)
-            cmd = [
-                "ffmpeg",
-                "-ss", str(timestamp_seconds),
-                "-i", video_path,
-                "-vframes", "1",
-                "-q:v", "2",
-                "-y",  # Sobrescrever se existir
-                temp_frame_path
-            ]
-
-            # Executar ffmpeg
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            # Arquivo temporário para o frame (diretório de job no temp_storage)
+            job = await temp_storage.ajob("thumb", reserve_bytes=1024 * 1024)
 
-            if result.returncode != 0:
-                logger.error(f"❌ [{bookmark_id[:8]}] ffmpeg falhou: {result.stderr[:200]}")
-                return None
+            # Vídeo mais curto que o timestamp: frame do meio (probe cacheado)
+            duration = await media_toolkit.duration(video_path, priority=PRIORITY_INTERACTIVE)
+            if duration and timestamp_seconds >= duration:
+                timestamp_seconds = duration / 2
+
+            extracted = await media_toolkit.extract(
+                video_path, frame_times=[timestamp_seconds], frames_dir=job.path, priority=PRIORITY_INTERACTIVE
+            )
 
             # Verificar se frame foi criado
-            if not os.path.exists(temp_frame_path):
+            if not extracted["frames"]:
                 logger.error(f"❌ [{bookmark_id[:8]}] Frame não foi criado")
                 return None
+            temp_frame_path = extracted["frames"][0]
 
             frame_size = os.path.getsize(temp_frame_path)
             logger.info(f"✅ [{bookmark_id[:8]}] Frame extraído: {frame_size / 1024:.1f}KB")
@@ -260,8 +248,8 @@ class ThumbnailService:
             logger.info(f"☁️ [{bookmark_id[:8]}] Upload do frame para Supabase...")
 
             await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None,
+                run_blocking(
+                    "supabase",
                     lambda: self.supabase.storage.from_(self.bucket_name).upload(
                         path=cloud_path,
                         file=image_bytes,
@@ -274,7 +262,9 @@ class ThumbnailService:
             logger.info(f"✅ [{bookmark_id[:8]}] Frame uploaded: {cloud_path}")
 
             # Gerar signed URL
-            signed_url = self.supabase.storage.from_(self.bucket_name).create_signed_url(
+            signed_url = await run_blocking(
+                "supabase",
+                self.supabase.storage.from_(self.bucket_name).create_signed_url,
                 path=cloud_path,
                 expires_in=31536000  # 1 ano
             )
@@ -287,16 +277,13 @@ class ThumbnailService:
                 logger.error(f"❌ [{bookmark_id[:8]}] Falha ao gerar signed URL do frame")
                 return None
 
-        except subprocess.TimeoutExpired:
-            logger.error(f"❌ [{bookmark_id[:8]}] Timeout ao extrair frame com ffmpeg")
+        except MediaToolError as e:
+            logger.error(f"❌ [{bookmark_id[:8]}] ffmpeg falhou ao extrair frame: {str(e)[:200]}")
             return None
         except Exception as e:
             logger.error(f"❌ [{bookmark_id[:8]}] Erro ao extrair frame: {str(e)[:100]}")
             return None
         finally:
             # Limpar arquivo temporário
-            if temp_frame_path and os.path.exists(temp_frame_path):
-                try:
-                    os.remove(temp_frame_path)
-                except:
-                    pass
+            if job:
+                job.cleanup()
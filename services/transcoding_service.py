@@ -2,13 +2,57 @@
 Serviço de transcodificação de vídeo usando FFmpeg.
 
 Converte vídeos para H.264 Baseline Profile (compatível com todos os dispositivos Android).
+
+Fast path: o probe decide por stream. Vídeo já H.264 (perfil/nível/pix_fmt
+compatíveis) é copiado sem re-encode; áudio AAC idem. Só o que não é
+compatível passa pelo encoder - a maioria dos vídeos do TikTok/Instagram
+(avc1 + AAC em MP4) vira um remux de menos de 1s com +faststart.
+
+Cache de resultados: video_id = hash(conteúdo da origem + perfil de encode),
+então a mesma origem (mesma URL/url_key ou mesmos bytes) devolve o arquivo
+já existente em storage_dir sem transcodificar de novo. Evicção LRU pela
+cota de disco do temp_storage (TRANSCODE_STORAGE_QUOTA_MB).
 """
 import subprocess
-import tempfile
 import os
 import uuid
-import httpx
+import hashlib
+from collections import OrderedDict
 from pathlib import Path
+from typing import Optional
+
+from services.analysis_cache import file_content_hash
+from services.download_service import download_service
+from services.executor_service import run_blocking
+from services.temp_storage import temp_storage
+from services.media_toolkit import media_toolkit
+from services.process_pool import process_pool, PRIORITY_ANALYSIS, PRIORITY_BATCH
+
+# Cota e idade máxima dos transcodificados (aplicadas pelo janitor do temp_storage)
+STORAGE_QUOTA_BYTES = int(float(os.getenv("TRANSCODE_STORAGE_QUOTA_MB", "4096")) * 1024 * 1024)
+MAX_AGE_SECONDS = float(os.getenv("TRANSCODE_MAX_AGE_HOURS", "72")) * 3600
+INPUT_RESERVE_BYTES = int(float(os.getenv("TRANSCODE_INPUT_RESERVE_MB", "200")) * 1024 * 1024)
+# Slots de CPU por encode (= threads do x264) no process_pool
+CPU_WEIGHT = int(os.getenv("TRANSCODE_CPU_WEIGHT", "2"))
+
+# Critérios para copiar o stream de vídeo sem re-encode (decoders de hardware Android).
+# Default = o mesmo perfil que o re-encode gera (baseline); Main/High só por opt-in,
+# para frotas de aparelhos que sabidamente decodificam esses perfis
+COPY_PROFILES = {
+    p.strip().lower()
+    for p in os.getenv("TRANSCODE_COPY_PROFILES", "Constrained Baseline,Baseline").split(",")
+    if p.strip()
+}
+COPY_MAX_LEVEL = int(os.getenv("TRANSCODE_COPY_MAX_LEVEL", "41"))  # 4.1 (1080p30)
+COPY_PIX_FMTS = {"yuv420p"}
+COPY_AUDIO_CODECS = {"aac"}
+MAX_ENCODE_DURATION = 180  # 3 minutos (só para re-encode de vídeo; remux é barato)
+
+# Perfil de encode na chave do cache (mudou parâmetro do ffmpeg/critério de copy = chave nova)
+ENCODE_PROFILE = "v1|x264-baseline-3.0-crf23-fast|aac-128k|copy:{}<={}".format(
+    ",".join(sorted(COPY_PROFILES)), COPY_MAX_LEVEL
+)
+URL_INDEX_SIZE = 2048
 
 
 class TranscodingService:
@@ -19,13 +63,42 @@ class TranscodingService:
         """
         self.storage_dir = Path(storage_dir)
         self.storage_dir.mkdir(parents=True, exist_ok=True)
-
-    async def transcode_video(self, source_url: str) -> dict:
+        temp_storage.register_cache_dir(str(self.storage_dir), STORAGE_QUOTA_BYTES, MAX_AGE_SECONDS)
+        # URL/url_key → video_id (pula até o download em pedidos repetidos)
+        self._url_index: "OrderedDict[str, str]" = OrderedDict()
+        self.cache_stats = {"url_hits": 0, "content_hits": 0, "misses": 0}
+
+    def _cached_result(self, video_id: str) -> Optional[dict]:
+        """Resultado de um transcodificado já em disco (marca uso para o LRU)"""
+        if not self.mark_used(video_id):
+            return None
+        path = self.storage_dir / f"{video_id}.mp4"
+        return {
+            "success": True,
+            "file_path": str(path),
+            "file_size_mb": round(path.stat().st_size / (1024 * 1024), 2),
+            "video_id": video_id,
+            "mode": "cached",
+        }
+
+    def _remember(self, keys, video_id: str):
+        for key in filter(None, keys):
+            self._url_index[key] = video_id
+            self._url_index.move_to_end(key)
+        while len(self._url_index) > URL_INDEX_SIZE:
+            self._url_index.popitem(last=False)
+
+    async def transcode_video(self, source_url: str, url_key: Optional[str] = None) -> dict:
         """
         Baixa e transcodifica vídeo para H.264 Baseline Profile.
 
+        Resultado cacheado: mesma source_url/url_key ou mesmo conteúdo
+        retorna o video_id existente (mode "cached") sem transcodificar.
+
         Args:
             source_url: URL do vídeo original
+            url_key: Chave estável da origem (ex: canonical_key do post + qualidade),
+                     já que URLs de CDN mudam a cada extração
 
         Returns:
             dict com:
@@ -34,16 +107,26 @@ class TranscodingService:
                 - file_size_mb: tamanho do arquivo
                 - error: mensagem de erro (se houver)
         """
-        video_id = str(uuid.uuid4())
-        temp_input = None
-        output_path = self.storage_dir / f"{video_id}.mp4"
+        # 0. Mesma origem já transcodificada: resposta imediata
+        for key in filter(None, (url_key, source_url)):
+            video_id = self._url_index.get(key)
+            cached = self._cached_result(video_id) if video_id else None
+            if cached:
+                self.cache_stats["url_hits"] += 1
+                print(f"♻️ Transcodificado reaproveitado (origem já vista): {video_id}")
+                return cached
+
+        job = None
+        # Saída parcial oculta (.tmp) até o rename - leitores nunca veem arquivo pela metade
+        partial_path = self.storage_dir / f".tmp-{uuid.uuid4().hex}.mp4"
 
         try:
-            print(f"🎬 Iniciando transcodificação para: {video_id}")
+            print(f"🎬 Iniciando transcodificação de: {source_url[:50]}...")
 
-            # 1. Baixar vídeo original
+            # 1. Baixar vídeo original (espaço reservado antes - espera/recusa se o disco está cheio)
+            job = await temp_storage.ajob("transcode", reserve_bytes=INPUT_RESERVE_BYTES)
             print(f"📥 Baixando vídeo de: {source_url[:50]}...")
-            temp_input = await self._download_video(source_url)
+            temp_input = await self._download_video(source_url, job.file("input.mp4"))
 
             if not temp_input or not os.path.exists(temp_input):
                 raise ValueError("Falha ao baixar vídeo original")
@@ -51,13 +134,28 @@ class TranscodingService:
             input_size_mb = os.path.getsize(temp_input) / (1024 * 1024)
             print(f"✅ Vídeo baixado: {input_size_mb:.2f} MB")
 
-            # 2. Transcodificar para Baseline Profile
+            # 2. Mesmo conteúdo já transcodificado com o mesmo perfil?
+            content_hash = await run_blocking("default", file_content_hash, temp_input)
+            video_id = hashlib.sha256(f"{content_hash}|{ENCODE_PROFILE}".encode()).hexdigest()[:32]
+            self._remember((url_key, source_url), video_id)
+
+            cached = self._cached_result(video_id)
+            if cached:
+                self.cache_stats["content_hits"] += 1
+                print(f"♻️ Transcodificado reaproveitado (mesmo conteúdo): {video_id}")
+                return cached
+            self.cache_stats["misses"] += 1
+
+            # 3. Transcodificar para Baseline Profile (ou remux, se já compatível)
             print(f"🔄 Transcodificando para H.264 Baseline...")
-            await self._transcode_to_baseline(temp_input, str(output_path))
+            plan = await self._transcode_to_baseline(temp_input, str(partial_path))
 
-            if not output_path.exists():
+            if not partial_path.exists():
                 raise ValueError("Falha na transcodificação - arquivo não foi gerado")
 
+            output_path = self.storage_dir / f"{video_id}.mp4"
+            os.replace(partial_path, output_path)
+
             output_size_mb = output_path.stat().st_size / (1024 * 1024)
             print(f"✅ Transcodificação concluída: {output_size_mb:.2f} MB")
 
@@ -66,14 +164,15 @@ class TranscodingService:
                 "file_path": str(output_path),
                 "file_size_mb": round(output_size_mb, 2),
                 "video_id": video_id,
+                "mode": plan["mode"],
             }
 
         except Exception as e:
             print(f"❌ Erro na transcodificação: {str(e)}")
 
             # Limpar arquivo de saída em caso de erro
-            if output_path.exists():
-                output_path.unlink()
+            if partial_path.exists():
+                partial_path.unlink()
 
             return {
                 "success": False,
@@ -81,55 +180,65 @@ class TranscodingService:
             }
 
         finally:
-            # Limpar arquivo temporário de entrada
-            if temp_input and os.path.exists(temp_input):
-                os.unlink(temp_input)
+            # Limpar diretório temporário do job (entrada baixada)
+            if job:
+                job.cleanup()
 
-    async def _download_video(self, url: str, max_retries: int = 3) -> str:
+    async def _download_video(self, url: str, path: str) -> str:
         """
-        Baixa vídeo para arquivo temporário com retry automático.
+        Baixa vídeo para `path` (downloader compartilhado: retomada via
+        Range e segmentos paralelos).
 
         Args:
             url: URL do vídeo
-            max_retries: Número máximo de tentativas (padrão: 3)
+            path: Arquivo de destino (dentro de um job do temp_storage)
         """
-        import asyncio
-
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-        last_error = None
-
-        for attempt in range(max_retries):
-            try:
-                if attempt > 0:
-                    wait_time = 2 ** attempt  # Exponential backoff: 2s, 4s, 8s
-                    print(f"⏳ Retry {attempt + 1}/{max_retries} após {wait_time}s...")
-                    await asyncio.sleep(wait_time)
-
-                async with httpx.AsyncClient(timeout=90.0) as client:  # Aumentado de 60s → 90s
-                    async with client.stream('GET', url) as response:
-                        response.raise_for_status()
-
-                        with open(temp_file.name, 'wb') as f:
-                            async for chunk in response.aiter_bytes(chunk_size=8192):
-                                f.write(chunk)
-
-                print(f"✅ Vídeo baixado com sucesso (tentativa {attempt + 1})")
-                return temp_file.name
-
-            except Exception as e:
-                last_error = e
-                print(f"⚠️ Tentativa {attempt + 1}/{max_retries} falhou: {str(e)}")
-
-                # Se não é a última tentativa, continua
-                if attempt < max_retries - 1:
-                    continue
+        try:
+            await run_blocking("download", download_service.download_to_file, url, path)
+            return path
+        except Exception as e:
+            if os.path.exists(path):
+                os.unlink(path)
+            raise ValueError(f"Erro ao baixar vídeo: {str(e)}")
 
-                # Última tentativa falhou - limpar e levantar erro
-                if os.path.exists(temp_file.name):
-                    os.unlink(temp_file.name)
-                raise ValueError(f"Erro ao baixar vídeo após {max_retries} tentativas: {str(last_error)}")
+    def _plan_streams(self, info: dict) -> dict:
+        """
+        Decide copy/encode por stream a partir do probe.
 
-    async def _transcode_to_baseline(self, input_path: str, output_path: str):
+        Returns:
+            dict com video ("copy" | "encode"), audio ("copy" | "encode" | None
+            se não há áudio), mode ("remux" | "audio" | "transcode") e reasons
+            (motivos do re-encode de vídeo)
+        """
+        video = info.get("video")
+        if not video:
+            raise ValueError("Arquivo sem stream de vídeo")
+
+        reasons = []
+        if video.get("codec_name") != "h264":
+            reasons.append(f"codec {video.get('codec_name')}")
+        if (video.get("profile") or "").lower() not in COPY_PROFILES:
+            reasons.append(f"perfil {video.get('profile')}")
+        if not 0 < int(video.get("level") or 0) <= COPY_MAX_LEVEL:
+            reasons.append(f"nível {video.get('level')}")
+        if video.get("pix_fmt") not in COPY_PIX_FMTS:
+            reasons.append(f"pix_fmt {video.get('pix_fmt')}")
+        if int(video.get("width") or 1) % 2 or int(video.get("height") or 1) % 2:
+            reasons.append(f"dimensões ímpares {video.get('width')}x{video.get('height')}")
+
+        audio = info.get("audio")
+        audio_plan = None
+        if audio:
+            audio_plan = "copy" if audio.get("codec_name") in COPY_AUDIO_CODECS else "encode"
+
+        video_plan = "encode" if reasons else "copy"
+        if video_plan == "encode":
+            mode = "transcode"
+        else:
+            mode = "audio" if audio_plan == "encode" else "remux"
+        return {"video": video_plan, "audio": audio_plan, "mode": mode, "reasons": reasons}
+
+    async def _transcode_to_baseline(self, input_path: str, output_path: str) -> dict:
         """
         Transcodifica vídeo para H.264 Baseline Profile usando FFmpeg.
 
@@ -138,18 +247,33 @@ class TranscodingService:
         - Velocidade de transcodificação (preset: fast)
         - Tamanho de arquivo reduzido
         - Qualidade aceitável para vídeos de referência
-        """
-        try:
-            # Verifica duração do vídeo antes de transcodificar
-            duration = self._get_video_duration(input_path)
-            if duration and duration > 180:  # 3 minutos
-                raise ValueError(f"Vídeo muito longo ({duration}s). Máximo: 180s. Use vídeos mais curtos.")
 
-            result = subprocess.run(
-                [
-                    'ffmpeg',
-                    '-i', input_path,
+        Streams já compatíveis são copiados (-c copy) em vez de re-encodados.
 
+        Returns:
+            Plano executado (ver _plan_streams)
+        """
+        try:
+            plan = self._plan_streams(await media_toolkit.probe(input_path))
+
+            cmd = [
+                'ffmpeg',
+                '-i', input_path,
+                '-map', '0:v:0',
+                '-map', '0:a:0?',  # Áudio opcional; descarta streams de dados/legenda
+            ]
+
+            if plan["video"] == "copy":
+                cmd += ['-c:v', 'copy']
+            else:
+                print(f"🔁 Re-encode de vídeo necessário: {', '.join(plan['reasons'])}")
+
+                # Verifica duração do vídeo antes de transcodificar
+                duration = await self._get_video_duration(input_path)
+                if duration and duration > MAX_ENCODE_DURATION:
+                    raise ValueError(f"Vídeo muito longo ({duration}s). Máximo: {MAX_ENCODE_DURATION}s. Use vídeos mais curtos.")
+
+                cmd += [
                     # Codec de vídeo: H.264 Baseline Profile
                     '-c:v', 'libx264',
                     '-profile:v', 'baseline',  # Compatibilidade universal
@@ -161,24 +285,35 @@ class TranscodingService:
                     # Preset: fast (30-40% mais rápido que medium)
                     # Render Starter tem 0.5 CPU, então velocidade > compressão
                     '-preset', 'fast',
+                    '-threads', str(CPU_WEIGHT),  # Não passa dos slots reservados
 
                     # Limita resolução máxima (reduz carga)
                     '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',  # Garante dimensões pares
-
-                    # Codec de áudio: AAC
-                    '-c:a', 'aac',
-                    '-b:a', '128k',
-
-                    # Otimizações
-                    '-movflags', '+faststart',  # Streaming otimizado
                     '-pix_fmt', 'yuv420p',      # Compatibilidade de cor
-
-                    # Sobrescrever sem perguntar
-                    '-y',
-
-                    output_path
-                ],
-                capture_output=True,
+                ]
+
+            if plan["audio"] == "copy":
+                cmd += ['-c:a', 'copy']
+            elif plan["audio"] == "encode":
+                # Codec de áudio: AAC
+                cmd += ['-c:a', 'aac', '-b:a', '128k']
+
+            cmd += [
+                # Otimizações
+                '-movflags', '+faststart',  # Streaming otimizado (moov no início)
+
+                # Sobrescrever sem perguntar
+                '-y',
+
+                output_path
+            ]
+
+            # Fila do process_pool (re-encode = prioridade batch: thumbnails passam na frente)
+            encoding_video = plan["video"] == "encode"
+            result = await process_pool.run(
+                cmd,
+                priority=PRIORITY_BATCH if encoding_video else PRIORITY_ANALYSIS,
+                weight=CPU_WEIGHT if encoding_video else 1,
                 text=True,
                 timeout=600  # 10 minutos timeout (Render Starter é lento)
             )
@@ -186,35 +321,21 @@ class TranscodingService:
             if result.returncode != 0:
                 raise ValueError(f"FFmpeg falhou: {result.stderr}")
 
-            print(f"✅ FFmpeg concluído com sucesso")
+            print(f"✅ FFmpeg concluído com sucesso (modo: {plan['mode']})")
+            return plan
 
         except subprocess.TimeoutExpired:
             raise ValueError("Transcodificação excedeu tempo limite de 10 minutos")
         except Exception as e:
             raise ValueError(f"Erro ao executar FFmpeg: {str(e)}")
 
-    def _get_video_duration(self, video_path: str) -> float:
-        """Obtém duração do vídeo em segundos usando ffprobe."""
+    async def _get_video_duration(self, video_path: str) -> float:
+        """Obtém duração do vídeo em segundos (probe cacheado do media_toolkit)."""
         try:
-            result = subprocess.run(
-                [
-                    'ffprobe',
-                    '-v', 'error',
-                    '-show_entries', 'format=duration',
-                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                    video_path
-                ],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-
-            if result.returncode == 0 and result.stdout.strip():
-                duration = float(result.stdout.strip())
+            duration = await media_toolkit.duration(video_path)
+            if duration:
                 print(f"⏱️ Duração do vídeo: {duration:.1f}s")
-                return duration
-
-            return None
+            return duration
         except Exception as e:
             print(f"⚠️ Não foi possível obter duração: {str(e)}")
             return None
@@ -228,6 +349,14 @@ class TranscodingService:
         path = self.storage_dir / f"{video_id}.mp4"
         return path.exists()
 
+    def mark_used(self, video_id: str) -> bool:
+        """Atualiza mtime (ordem do LRU do janitor); False se o vídeo não existe"""
+        try:
+            os.utime(self.storage_dir / f"{video_id}.mp4")
+            return True
+        except OSError:
+            return False
+
     def delete_video(self, video_id: str) -> bool:
         """Deleta vídeo transcodificado."""
         try:
@@ -256,7 +385,9 @@ class TranscodingService:
             return {
                 "video_count": video_count,
                 "total_size_mb": round(total_mb, 2),
+                "quota_mb": round(STORAGE_QUOTA_BYTES / (1024 * 1024), 2),
                 "storage_dir": str(self.storage_dir),
+                "cache": dict(self.cache_stats),
             }
         except Exception as e:
             print(f"❌ Erro ao calcular armazenamento: {str(e)}")
@@ -8,6 +8,8 @@ Mantém versão original + tradução para busca multilíngue.
 from openai import OpenAI
 import os
 
+from services.rate_limiter import rate_limiter
+
 # Cliente OpenAI
 openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
@@ -45,21 +47,22 @@ TEXTO ORIGINAL ({source_language}):
 TRADUÇÃO PT-BR:"""
 
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",  # Modelo mais barato e rápido
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Você é um tradutor profissional especializado em tradução técnica e natural para português brasileiro."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.3,  # Baixa variação (tradução consistente)
-            max_tokens=2000   # Suficiente para textos longos
-        )
+        with rate_limiter.limit_sync("openai"):
+            response = openai_client.chat.completions.create(
+                model="gpt-4o-mini",  # Modelo mais barato e rápido
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Você é um tradutor profissional especializado em tradução técnica e natural para português brasileiro."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                temperature=0.3,  # Baixa variação (tradução consistente)
+                max_tokens=2000   # Suficiente para textos longos
+            )
 
         translation = response.choices[0].message.content.strip()
 
@@ -0,0 +1,121 @@
+"""
+Normalização canônica de URLs de vídeo.
+
+Mapeia todas as formas de URL suportadas para plataforma + id do conteúdo:
+- Instagram: /p/, /reel/, /reels/, /tv/, com ou sem usuário no path,
+  ?igsh=/utm_* etc  →  instagram:<shortcode>
+- TikTok: www/m.tiktok.com/@user/video/<id>, ?is_from_webapp=...  →  tiktok:<id>
+  (links curtos vm.tiktok.com / tiktok.com/t/ viram tiktok:short:<código>)
+- YouTube: youtu.be/<id>, watch?v=<id>, /shorts/, /embed/, /live/, m.youtube.com
+  →  youtube:<id>
+
+A chave (`CanonicalURL.key`) é usada em todo cache, dedup (single-flight)
+e busca de bookmarks, então o mesmo reel salvo por 50 usuários com URLs
+ligeiramente diferentes é extraído uma vez só.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+
+from models import Platform
+
+INSTAGRAM_RE = re.compile(r"^/(?:[\w.]+/)?(?:p|reel|reels|tv)/([A-Za-z0-9_-]+)")
+TIKTOK_VIDEO_RE = re.compile(r"/video/(\d+)")
+TIKTOK_SHORT_RE = re.compile(r"^/(?:t/)?([A-Za-z0-9]+)")
+YOUTUBE_PATH_RE = re.compile(r"^/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})")
+YOUTUBE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+# Parâmetros de rastreamento removidos de URLs genéricas
+TRACKING_PARAMS = {"igsh", "igshid", "fbclid", "gclid", "si", "feature", "is_from_webapp", "sender_device", "_r", "_t"}
+
+
+@dataclass(frozen=True)
+class CanonicalURL:
+    platform: Optional[Platform]
+    content_id: str
+    url: str  # URL canônica (para chamar APIs/scrapers)
+
+    @property
+    def key(self) -> str:
+        prefix = self.platform.value if self.platform else "url"
+        return f"{prefix}:{self.content_id}"
+
+
+def _host(parsed) -> str:
+    host = (parsed.hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _on_domain(host: str, domain: str) -> bool:
+    """Host é o domínio ou subdomínio dele (notinstagram.com não é instagram.com)"""
+    return host == domain or host.endswith("." + domain)
+
+
+def _generic(url: str) -> CanonicalURL:
+    parsed = urlparse(url.strip())
+    query = [
+        (k, v) for k, values in sorted(parse_qs(parsed.query).items())
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith("utm_")
+        for v in values
+    ]
+    clean = urlunparse((
+        (parsed.scheme or "https").lower(),
+        _host(parsed),
+        parsed.path.rstrip("/"),
+        "",
+        urlencode(query),
+        "",
+    ))
+    return CanonicalURL(platform=None, content_id=clean, url=clean)
+
+
+@lru_cache(maxsize=4096)
+def canonicalize(url: str) -> CanonicalURL:
+    """Normaliza URL para plataforma + id do conteúdo (URLs desconhecidas: limpeza genérica)"""
+    raw = url.strip()
+    if "://" not in raw:
+        raw = f"https://{raw}"
+    parsed = urlparse(raw)
+    host = _host(parsed)
+    path = parsed.path or "/"
+
+    if _on_domain(host, "instagram.com"):
+        match = INSTAGRAM_RE.match(path)
+        if match:
+            shortcode = match.group(1)
+            return CanonicalURL(Platform.INSTAGRAM, shortcode, f"https://www.instagram.com/p/{shortcode}/")
+
+    elif _on_domain(host, "tiktok.com"):
+        match = TIKTOK_VIDEO_RE.search(path)
+        if match:
+            video_id = match.group(1)
+            user = re.match(r"^/(@[\w.-]+)/", path)
+            user_part = user.group(1) if user else "@"
+            return CanonicalURL(Platform.TIKTOK, video_id, f"https://www.tiktok.com/{user_part}/video/{video_id}")
+        if host in ("vm.tiktok.com", "vt.tiktok.com") or path.startswith("/t/"):
+            match = TIKTOK_SHORT_RE.match(path)
+            if match:
+                code = match.group(1)
+                short_host = "www.tiktok.com" if host == "tiktok.com" else host
+                return CanonicalURL(Platform.TIKTOK, f"short:{code}", f"https://{short_host}/{'t/' if path.startswith('/t/') else ''}{code}/")
+
+    elif host == "youtu.be" or _on_domain(host, "youtube.com"):
+        video_id = None
+        if host == "youtu.be":
+            video_id = path.strip("/").split("/")[0]
+        else:
+            video_id = (parse_qs(parsed.query).get("v") or [None])[0]
+            if not video_id:
+                match = YOUTUBE_PATH_RE.match(path)
+                video_id = match.group(1) if match else None
+        if video_id and YOUTUBE_ID_RE.match(video_id):
+            return CanonicalURL(Platform.YOUTUBE, video_id, f"https://www.youtube.com/watch?v={video_id}")
+
+    return _generic(raw)
+
+
+def canonical_key(url: str) -> str:
+    """Atalho: chave canônica (ex: 'instagram:C1a2b3c4')"""
+    return canonicalize(url).key
@@ -0,0 +1,581 @@
+"""
+Índice vetorial local (in-process) para busca semântica por usuário.
+
+Substitui o round-trip ao Postgres (RPC search_bookmarks_semantic) em cada
+mensagem do chat por um lookup em memória:
+- Um índice por usuário (matriz NumPy float32 normalizada)
+- IVF (inverted file) para usuários com muitos bookmarks, busca exata para o resto
+- Aquecido a partir da coluna bookmarks.embedding
+- Atualizado incrementalmente quando generate_embedding_task grava um vetor novo
+  (via Redis pub/sub, já que os workers Celery rodam em outro processo)
+- Bookmarks apagados saem do índice (publish_removal) quando a busca devolve
+  um ID que não existe mais no Supabase
+- Persistência opcional em disco (np.load com mmap) via VECTOR_INDEX_DIR
+- Limite de memória: no máximo VECTOR_INDEX_MAX_USERS índices por processo
+  (LRU), e índices sem uso há VECTOR_INDEX_IDLE_SECONDS são descartados
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+from services.executor_service import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR")  # Opcional: persistência mmap
+IVF_MIN_SIZE = int(os.getenv("VECTOR_INDEX_IVF_MIN_SIZE", "2048"))  # Abaixo disso, busca exata
+IVF_NPROBE = int(os.getenv("VECTOR_INDEX_IVF_NPROBE", "8"))  # Listas visitadas por query
+INDEX_MAX_AGE_SECONDS = int(os.getenv("VECTOR_INDEX_MAX_AGE_SECONDS", "3600"))  # Re-aquece em background
+MAX_USERS = int(os.getenv("VECTOR_INDEX_MAX_USERS", "100"))  # Índices residentes por processo (LRU)
+IDLE_SECONDS = int(os.getenv("VECTOR_INDEX_IDLE_SECONDS", "1800"))  # Descarta índice sem buscas
+LISTENER_POLL_SECONDS = 60  # Listener acorda para despejar índices ociosos mesmo sem mensagens
+UPDATES_CHANNEL = "vector_index:updates"
+PAGE_SIZE = 1000  # Limite padrão de linhas do PostgREST
+
+
+def parse_embedding(raw: Any) -> Optional[List[float]]:
+    """
+    Converte embedding vindo do Supabase em lista de floats.
+
+    PostgREST retorna colunas pgvector como string "[0.1,0.2,...]".
+    """
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return None
+    if not raw:
+        return None
+    return [float(x) for x in raw]
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+def _train_ivf(vectors: np.ndarray, iterations: int = 8) -> Optional[Tuple[np.ndarray, List[List[int]]]]:
+    """Treina centróides com k-means simples (nlist ≈ sqrt(n)); None abaixo de IVF_MIN_SIZE"""
+    n = vectors.shape[0]
+    if n < IVF_MIN_SIZE:
+        return None
+
+    nlist = max(1, int(np.sqrt(n)))
+    rng = np.random.default_rng(0)
+    centroids = np.array(vectors[rng.choice(n, nlist, replace=False)], dtype=np.float32)
+
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assignments == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = _normalize_rows(centroids)
+
+    assignments = np.argmax(vectors @ centroids.T, axis=1)
+    return centroids, [np.flatnonzero(assignments == c).tolist() for c in range(nlist)]
+
+
+def _atomic_write(path: str, write: Callable):
+    """Escreve em arquivo temporário e troca com os.replace (crash não deixa arquivo pela metade)"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class UserVectorIndex:
+    """Índice de um único usuário (vetores normalizados → similaridade de cosseno = produto interno)"""
+
+    def __init__(self, user_id: str, ids: List[str], vectors: np.ndarray):
+        self.user_id = user_id
+        self.ids: List[str] = list(ids)
+        self._positions: Dict[str, int] = {bid: i for i, bid in enumerate(self.ids)}
+        self.dim = vectors.shape[1] if vectors.ndim == 2 and vectors.shape[0] else 0
+        self.vectors = vectors
+        self.loaded_at = time.time()
+        self.last_used = time.time()
+        self._lock = threading.Lock()
+
+        # IVF (construído só para índices grandes)
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: Optional[List[List[int]]] = None
+        self._ivf_built_size = 0
+        self.needs_ivf_rebuild = False  # Upserts pedem re-treino; rebuild_ivf() roda fora do event loop
+        self._rebuilding = False
+        self._generation = 0  # Incrementa a cada remoção (posições das linhas mudam)
+
+        trained = _train_ivf(self.vectors)
+        if trained is not None:
+            self._centroids, self._lists = trained
+            self._ivf_built_size = len(self.ids)
+            logger.info(f"🧭 IVF construído - user {self.user_id[:8]}: {len(self.ids)} vetores, {len(self._lists)} listas")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def rebuild_ivf(self):
+        """
+        Re-treina o IVF (k-means, CPU pesado) sem segurar o lock.
+
+        Chamado via run_blocking pelo listener; upserts que chegam durante
+        o treino são atribuídos às listas novas no fim. Se houve remoção no
+        meio, o resultado é descartado e o re-treino fica para o próximo upsert.
+        """
+        with self._lock:
+            if self._rebuilding or not self.needs_ivf_rebuild:
+                return
+            self._rebuilding = True
+            generation = self._generation
+            n = len(self.ids)
+            vectors = self.vectors[:n]
+
+        try:
+            trained = _train_ivf(vectors)
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+        with self._lock:
+            if self._generation != generation:
+                return
+            self.needs_ivf_rebuild = False
+            if trained is None:
+                self._centroids, self._lists, self._ivf_built_size = None, None, 0
+                return
+            centroids, lists = trained
+            for row in range(n, len(self.ids)):
+                lists[int(np.argmax(centroids @ self.vectors[row]))].append(row)
+            self._centroids, self._lists, self._ivf_built_size = centroids, lists, n
+        logger.info(f"🧭 IVF re-treinado - user {self.user_id[:8]}: {n} vetores, {len(lists)} listas")
+
+    def search(self, query: np.ndarray, k: int, threshold: float) -> List[Tuple[str, float]]:
+        """Top-k por similaridade de cosseno acima do threshold"""
+        with self._lock:
+            if not self.ids:
+                return []
+
+            if self._centroids is not None:
+                nprobe = min(IVF_NPROBE, len(self._centroids))
+                probe = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+                candidates = np.fromiter(
+                    (i for c in probe for i in self._lists[c]),
+                    dtype=np.int64
+                )
+                if candidates.size == 0:
+                    return []
+                scores = self.vectors[candidates] @ query
+            else:
+                candidates = None
+                scores = self.vectors @ query
+
+            k = min(k, scores.shape[0])
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            results = []
+            for pos in top:
+                score = float(scores[pos])
+                if score <= threshold:
+                    break
+                row = int(candidates[pos]) if candidates is not None else int(pos)
+                results.append((self.ids[row], score))
+            return results
+
+    def upsert(self, bookmark_id: str, embedding: List[float]):
+        """Insere ou substitui o vetor de um bookmark"""
+        vector = _normalize_rows(np.asarray([embedding], dtype=np.float32))
+
+        with self._lock:
+            if self.dim and vector.shape[1] != self.dim:
+                logger.warning(f"⚠️ Dimensão incompatível ({vector.shape[1]} != {self.dim}) - ignorando {bookmark_id}")
+                return
+
+            # Índices carregados via mmap são read-only - materializa antes de escrever
+            if not self.vectors.flags.writeable:
+                self.vectors = np.array(self.vectors)
+
+            if bookmark_id in self._positions:
+                row = self._positions[bookmark_id]
+                self.vectors[row] = vector[0]
+                if self._centroids is not None:
+                    # Embedding mudou: move a linha para a lista do centróide novo
+                    for members in self._lists:
+                        if row in members:
+                            members.remove(row)
+                            break
+                    self._lists[int(np.argmax(self._centroids @ vector[0]))].append(row)
+                return
+
+            if not self.dim:
+                self.dim = vector.shape[1]
+                self.vectors = vector
+            else:
+                self.vectors = np.vstack([self.vectors, vector])
+
+            row = len(self.ids)
+            self.ids.append(bookmark_id)
+            self._positions[bookmark_id] = row
+
+            if self._centroids is not None:
+                # Atribui à lista do centróide mais próximo; re-treina se o índice dobrou
+                self._lists[int(np.argmax(self._centroids @ vector[0]))].append(row)
+                if len(self.ids) >= 2 * self._ivf_built_size:
+                    self.needs_ivf_rebuild = True
+            elif len(self.ids) >= IVF_MIN_SIZE:
+                self.needs_ivf_rebuild = True
+
+    def remove(self, bookmark_id: str) -> bool:
+        """Remove o vetor de um bookmark apagado; retorna False se não estava no índice"""
+        with self._lock:
+            row = self._positions.get(bookmark_id)
+            if row is None:
+                return False
+
+            self.vectors = np.delete(self.vectors, row, axis=0)  # Cópia (também serve p/ mmap)
+            del self.ids[row]
+            self._positions = {bid: i for i, bid in enumerate(self.ids)}
+            if self._lists is not None:
+                self._lists = [[i - (i > row) for i in members if i != row] for members in self._lists]
+            self._generation += 1
+            return True
+
+    def save(self, directory: str):
+        """Persiste vetores (.npy) e IDs (.json) para recarregar via mmap (escrita atômica)"""
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            vectors = self.vectors
+            meta = json.dumps({"ids": self.ids, "saved_at": time.time()}).encode()
+
+        # IDs por último: load() confere que os dois arquivos têm o mesmo número de linhas
+        _atomic_write(os.path.join(directory, f"{self.user_id}.npy"), lambda f: np.save(f, vectors))
+        _atomic_write(os.path.join(directory, f"{self.user_id}.ids.json"), lambda f: f.write(meta))
+
+    @classmethod
+    def load(cls, user_id: str, directory: str) -> Optional["UserVectorIndex"]:
+        """Carrega índice persistido (mmap read-only) se existir"""
+        vectors_path = os.path.join(directory, f"{user_id}.npy")
+        ids_path = os.path.join(directory, f"{user_id}.ids.json")
+        if not (os.path.exists(vectors_path) and os.path.exists(ids_path)):
+            return None
+
+        with open(ids_path) as f:
+            meta = json.load(f)
+
+        vectors = np.load(vectors_path, mmap_mode="r")
+        if vectors.shape[0] != len(meta["ids"]):
+            logger.warning(f"⚠️ Índice em disco inconsistente - user {user_id[:8]} ({vectors.shape[0]} vetores, {len(meta['ids'])} IDs)")
+            return None
+
+        index = cls(user_id, meta["ids"], vectors)
+        index.loaded_at = meta.get("saved_at", index.loaded_at)
+        return index
+
+
+class VectorIndexService:
+    def __init__(self):
+        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self._indexes: "OrderedDict[str, UserVectorIndex]" = OrderedDict()  # Ordem = último uso
+        self._indexes_lock = threading.Lock()
+        self._warming: Dict[str, asyncio.Future] = {}
+        self._supabase = None
+        self._publisher = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self.evictions = 0
+
+    def _get_supabase(self):
+        if self._supabase is None:
+            from supabase import create_client
+
+            supabase_url = os.getenv("SUPABASE_URL")
+            supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY")
+            self._supabase = create_client(supabase_url, supabase_key)
+        return self._supabase
+
+    # ------------------------------------------------------------------
+    # Índices residentes (LRU + TTL de ociosidade)
+    # ------------------------------------------------------------------
+
+    def _touch(self, user_id: str) -> Optional[UserVectorIndex]:
+        """Índice carregado (marca uso) ou None"""
+        with self._indexes_lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                index.last_used = time.time()
+                self._indexes.move_to_end(user_id)
+        self._evict()
+        return index
+
+    def _store(self, user_id: str, index: UserVectorIndex):
+        with self._indexes_lock:
+            index.last_used = time.time()
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+        self._evict()
+
+    def _evict(self):
+        """Descarta os menos usados acima de MAX_USERS e os ociosos há IDLE_SECONDS"""
+        now = time.time()
+        with self._indexes_lock:
+            while self._indexes:
+                user_id, oldest = next(iter(self._indexes.items()))
+                if len(self._indexes) <= MAX_USERS and now - oldest.last_used < IDLE_SECONDS:
+                    break
+                self._indexes.popitem(last=False)
+                self.evictions += 1
+                logger.debug(f"🧹 Índice vetorial descartado - user {user_id[:8]} ({len(oldest)} vetores)")
+
+    def _fetch_user_embeddings(self, user_id: str) -> UserVectorIndex:
+        """Lê todos os embeddings do usuário (paginado) e monta o índice"""
+        supabase = self._get_supabase()
+        ids: List[str] = []
+        rows: List[List[float]] = []
+        dim = None
+        start = 0
+
+        while True:
+            response = supabase.table('bookmarks').select('id, embedding') \
+                .eq('user_id', user_id) \
+                .not_.is_('embedding', 'null') \
+                .range(start, start + PAGE_SIZE - 1) \
+                .execute()
+
+            data = response.data or []
+            for row in data:
+                embedding = parse_embedding(row.get('embedding'))
+                if not embedding:
+                    continue
+                if dim is None:
+                    dim = len(embedding)
+                elif len(embedding) != dim:
+                    continue  # Embeddings de modelos antigos (dimensão diferente)
+                ids.append(row['id'])
+                rows.append(embedding)
+
+            if len(data) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+
+        vectors = _normalize_rows(np.asarray(rows, dtype=np.float32)) if rows else np.zeros((0, 0), dtype=np.float32)
+        index = UserVectorIndex(user_id, ids, vectors)
+
+        if VECTOR_INDEX_DIR:
+            try:
+                index.save(VECTOR_INDEX_DIR)
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao persistir índice vetorial: {str(e)}")
+
+        logger.info(f"🔥 Índice vetorial aquecido - user {user_id[:8]}: {len(ids)} vetores ({dim or 0} dims)")
+        return index
+
+    def _load_or_fetch(self, user_id: str) -> UserVectorIndex:
+        if VECTOR_INDEX_DIR:
+            try:
+                index = UserVectorIndex.load(user_id, VECTOR_INDEX_DIR)
+                if index and time.time() - index.loaded_at < INDEX_MAX_AGE_SECONDS:
+                    logger.info(f"💾 Índice vetorial carregado do disco (mmap) - user {user_id[:8]}")
+                    return index
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao carregar índice do disco: {str(e)}")
+        return self._fetch_user_embeddings(user_id)
+
+    async def _warm(self, user_id: str) -> UserVectorIndex:
+        """Aquece índice do usuário (deduplica aquecimentos concorrentes)"""
+        if user_id in self._warming:
+            return await self._warming[user_id]
+
+        future = asyncio.ensure_future(run_blocking("supabase", self._load_or_fetch, user_id))
+        self._warming[user_id] = future
+        try:
+            index = await future
+            self._store(user_id, index)
+            return index
+        finally:
+            self._warming.pop(user_id, None)
+
+    async def get_index(self, user_id: str) -> UserVectorIndex:
+        index = self._touch(user_id)
+        if index is None:
+            return await self._warm(user_id)
+
+        # Índice velho: serve o atual e re-aquece em background
+        if time.time() - index.loaded_at > INDEX_MAX_AGE_SECONDS and user_id not in self._warming:
+            asyncio.ensure_future(self._warm(user_id))
+        return index
+
+    def get_index_sync(self, user_id: str) -> UserVectorIndex:
+        """Versão síncrona (workers Celery): carrega/re-carrega no próprio processo"""
+        index = self._touch(user_id)
+        if index is None or time.time() - index.loaded_at > INDEX_MAX_AGE_SECONDS:
+            index = self._load_or_fetch(user_id)
+            self._store(user_id, index)
+        return index
+
+    async def search(
+        self,
+        user_id: str,
+        query_embedding: List[float],
+        limit: int = 10,
+        threshold: float = 0.3
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Busca top-k no índice local do usuário.
+
+        Returns:
+            Lista de {"id", "similarity"} ordenada por relevância,
+            ou None se o índice não puder responder (ex: dimensão incompatível)
+        """
+        try:
+            index = await self.get_index(user_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Índice vetorial indisponível ({str(e)}) - usando RPC")
+            return None
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if index.dim and query.shape[0] != index.dim:
+            logger.warning(f"⚠️ Query com {query.shape[0]} dims, índice com {index.dim} - usando RPC")
+            return None
+
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        results = index.search(query, limit, threshold)
+        return [{"id": bid, "similarity": score} for bid, score in results]
+
+    def upsert(self, user_id: str, bookmark_id: str, embedding: List[float]):
+        """
+        Atualiza índice local (só se o usuário já estiver carregado neste processo).
+        Re-treino do IVF roda inline - use apply_update dentro do event loop.
+        """
+        index = self._indexes.get(user_id)
+        if index is not None:
+            index.upsert(bookmark_id, embedding)
+            if index.needs_ivf_rebuild:
+                index.rebuild_ivf()
+
+    def remove(self, user_id: str, bookmark_id: str) -> bool:
+        index = self._indexes.get(user_id)
+        return index is not None and index.remove(bookmark_id)
+
+    async def apply_update(self, payload: Dict[str, Any]):
+        """Aplica mensagem do canal de atualizações sem travar o event loop"""
+        index = self._indexes.get(payload["user_id"])
+        if index is None:
+            return
+
+        if payload.get("removed"):
+            for bookmark_id in payload["bookmark_ids"]:
+                index.remove(bookmark_id)
+            return
+
+        index.upsert(payload["bookmark_id"], payload["embedding"])
+        if index.needs_ivf_rebuild:
+            await run_blocking("default", index.rebuild_ivf)
+
+    def _publish(self, payload: Dict[str, Any]):
+        try:
+            if self._publisher is None:
+                import redis as redis_sync
+
+                self._publisher = redis_sync.from_url(self.redis_url)
+            self._publisher.publish(UPDATES_CHANNEL, json.dumps(payload))
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao publicar atualização do índice vetorial: {str(e)}")
+
+    def publish_update(self, user_id: str, bookmark_id: str, embedding: List[float]):
+        """
+        Publica vetor novo para os processos web (chamado pelos workers Celery).
+        Também aplica localmente caso o índice esteja carregado aqui.
+        """
+        self.upsert(user_id, bookmark_id, embedding)
+        self._publish({
+            "user_id": user_id,
+            "bookmark_id": bookmark_id,
+            "embedding": embedding,
+        })
+
+    def publish_removal(self, user_id: str, bookmark_ids: List[str]):
+        """Remove bookmarks apagados do índice local e dos outros processos"""
+        for bookmark_id in bookmark_ids:
+            self.remove(user_id, bookmark_id)
+        self._publish({
+            "user_id": user_id,
+            "bookmark_ids": list(bookmark_ids),
+            "removed": True,
+        })
+
+    async def start_listener(self):
+        """Assina o canal de atualizações (executado no startup do FastAPI)"""
+        if self._listener_task is None:
+            self._listener_task = asyncio.ensure_future(self._listen())
+
+    async def stop_listener(self):
+        if self._listener_task:
+            self._listener_task.cancel()
+            self._listener_task = None
+
+    async def _listen(self):
+        import redis.asyncio as redis
+
+        while True:
+            try:
+                client = redis.from_url(self.redis_url)
+                pubsub = client.pubsub()
+                await pubsub.subscribe(UPDATES_CHANNEL)
+                logger.info(f"📡 Índice vetorial escutando {UPDATES_CHANNEL}")
+
+                while True:
+                    # Timeout: acorda periodicamente para despejar índices ociosos
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=LISTENER_POLL_SECONDS)
+                    self._evict()
+                    if not message or message.get("type") != "message":
+                        continue
+                    try:
+                        await self.apply_update(json.loads(message["data"]))
+                    except Exception as e:
+                        logger.warning(f"⚠️ Atualização inválida do índice vetorial: {str(e)}")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Redis fora do ar: o re-aquecimento por idade cobre as mensagens perdidas
+                logger.warning(f"⚠️ Listener do índice vetorial caiu ({str(e)}) - reconectando em 30s")
+                await asyncio.sleep(30)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._indexes_lock:
+            indexes = list(self._indexes.values())
+        return {
+            "users_loaded": len(indexes),
+            "max_users": MAX_USERS,
+            "evictions": self.evictions,
+            "total_vectors": sum(len(i) for i in indexes),
+            "ivf_users": sum(1 for i in indexes if i._centroids is not None),
+        }
+
+
+# Singleton instance
+vector_index_service = VectorIndexService()
@@ -4,16 +4,22 @@ Usa Whisper API para transcrição e GPT-4 Vision para análise visual
 Inclui tradução automática para português
 """
 import os
-import subprocess
 import base64
 import logging
 from typing import Optional, Dict, List
 from openai import OpenAI
 from pathlib import Path
 from services.translation_service import translate_multimodal_analysis
+from services.analysis_cache import analysis_cache
+from services.temp_storage import temp_storage, TempJob
+from services.media_toolkit import media_toolkit
 
 logger = logging.getLogger(__name__)
 
+# Modelos + versão dos prompts (subir ao mudar o prompt de frames) - namespace do cache
+CACHE_NAMESPACE = "whisper-1+gpt-4o-mini@frames-v1"
+WORK_RESERVE_BYTES = 30 * 1024 * 1024  # Áudio 16kHz mono + 4 frames JPEG
+
 class VideoAnalysisService:
     def __init__(self):
         api_key = os.getenv("OPENAI_API_KEY")
@@ -23,12 +29,14 @@ class VideoAnalysisService:
         else:
             self.client = OpenAI(api_key=api_key)
 
-    async def analyze_video(self, video_path: str) -> Optional[Dict]:
+    async def analyze_video(self, video_path: str, url_key: Optional[str] = None) -> Optional[Dict]:
         """
         Analisa vídeo completo: áudio (transcrição) + visual (frames)
+        Cacheado pelo hash do arquivo (e url_key, se informada)
 
         Args:
             video_path: Caminho absoluto do vídeo local
+            url_key: Chave canônica da URL original (opcional)
 
         Returns:
             Dict com {
@@ -45,16 +53,29 @@ class VideoAnalysisService:
             logger.error(f"Vídeo não encontrado: {video_path}")
             return None
 
+        cache_keys = await analysis_cache.content_keys(video_path, url_key)
+        cached = await analysis_cache.get(CACHE_NAMESPACE, cache_keys)
+        if cached:
+            logger.info(f"♻️ Análise de vídeo reaproveitada do cache ({cache_keys[0]})")
+            return cached
+
+        job = None
         try:
             logger.info(f"🎬 Iniciando análise de vídeo: {video_path}")
 
-            # 1. Transcrever áudio
-            transcript_data = await self._transcribe_audio(video_path)
+            # Diretório próprio para áudio/frames (análises concorrentes não colidem)
+            job = await temp_storage.ajob("analysis", reserve_bytes=WORK_RESERVE_BYTES)
+
+            # 1. Extrair áudio + frames (uma invocação do ffmpeg)
+            media = await self._extract_media(video_path, job)
 
-            # 2. Analisar frames visualmente
-            visual_analysis = await self._analyze_frames(video_path)
+            # 2. Transcrever áudio
+            transcript_data = await self._transcribe_audio(media["audio"]) if media["audio"] else None
 
-            # 3. Traduzir automaticamente para português (se necessário)
+            # 3. Analisar frames visualmente
+            visual_analysis = await self._analyze_frames(media["frames"]) if media["frames"] else None
+
+            # 4. Traduzir automaticamente para português (se necessário)
             transcript = transcript_data.get("text", "") if transcript_data else ""
             language = transcript_data.get("language", "") if transcript_data else ""
 
@@ -78,47 +99,59 @@ class VideoAnalysisService:
                 logger.info(f"🌐 Tradução PT - Transcript: {len(result['transcript_pt'])} chars")
             if result['visual_analysis_pt']:
                 logger.info(f"🌐 Tradução PT - Visual: {len(result['visual_analysis_pt'])} chars")
+
+            if result['transcript'] or result['visual_analysis']:
+                await analysis_cache.set(CACHE_NAMESPACE, cache_keys, result)
             return result
 
         except Exception as e:
             logger.error(f"❌ Erro ao analisar vídeo: {str(e)}")
             return None
 
-    async def _transcribe_audio(self, video_path: str) -> Optional[Dict]:
-        """Extrai áudio e transcreve com Whisper API"""
-        try:
-            logger.info("🎤 Extraindo e transcrevendo áudio...")
-
-            # Caminho temporário para áudio
-            audio_path = video_path.replace(".mp4", "_audio.mp3")
-
-            # Extrair áudio com FFmpeg (convert to mono, 16kHz para Whisper)
-            ffmpeg_cmd = [
-                "ffmpeg", "-i", video_path,
-                "-vn",  # Sem vídeo
-                "-ar", "16000",  # Sample rate 16kHz
-                "-ac", "1",  # Mono
-                "-b:a", "64k",  # Bitrate
-                "-y",  # Overwrite
-                audio_path
-            ]
+        finally:
+            if job:
+                job.cleanup()
 
-            result = subprocess.run(
-                ffmpeg_cmd,
-                capture_output=True,
-                text=True,
-                timeout=60
+    async def _extract_media(self, video_path: str, job: TempJob) -> Dict:
+        """Extrai áudio (16kHz mono) e 4 frames-chave numa única passada do ffmpeg"""
+        logger.info("🎞️ Extraindo áudio e frames...")
+        try:
+            duration = await media_toolkit.duration(video_path)
+
+            if duration:
+                # 4 frames igualmente espaçados (início, 1/3, 2/3, fim); vídeo
+                # curtíssimo pode repetir instantes - cada um entra uma vez só
+                frame_times = sorted({
+                    0,  # Início
+                    round(duration * 0.33, 2),  # 1/3
+                    round(duration * 0.66, 2),  # 2/3
+                    round(max(0, duration - 1), 2)  # Final (1s antes do fim)
+                })
+            else:
+                # Duração desconhecida: 1 frame real em vez de 4 cópias do primeiro
+                logger.warning("⚠️ Duração do vídeo desconhecida - analisando só o primeiro frame")
+                frame_times = [0]
+
+            # Arquivos temporários no diretório do job (apagados com ele)
+            return await media_toolkit.extract(
+                video_path,
+                frame_times=frame_times,
+                frames_dir=job.subdir("frames"),
+                audio_path=job.file("audio.mp3"),
             )
+        except Exception as e:
+            logger.error(f"❌ Erro ao extrair mídia: {str(e)}")
+            return {"frames": [], "audio": None}
 
-            if result.returncode != 0:
-                logger.error(f"FFmpeg falhou: {result.stderr}")
-                return None
+    async def _transcribe_audio(self, audio_path: str) -> Optional[Dict]:
+        """Transcreve áudio extraído com Whisper API"""
+        try:
+            logger.info("🎤 Transcrevendo áudio...")
 
             # Verificar tamanho do áudio
             audio_size = os.path.getsize(audio_path)
             if audio_size > 25 * 1024 * 1024:  # Whisper limit: 25MB
                 logger.warning(f"Áudio muito grande ({audio_size/1024/1024:.1f}MB), pulando transcrição")
-                os.remove(audio_path)
                 return None
 
             # Transcrever com Whisper
@@ -129,9 +162,6 @@ class VideoAnalysisService:
                     response_format="verbose_json"
                 )
 
-            # Limpar arquivo temporário
-            os.remove(audio_path)
-
             transcript_data = {
                 "text": transcript_response.text,
                 "language": transcript_response.language
@@ -140,66 +170,14 @@ class VideoAnalysisService:
             logger.info(f"✅ Transcrição concluída: {len(transcript_data['text'])} chars, idioma: {transcript_data['language']}")
             return transcript_data
 
-        except subprocess.TimeoutExpired:
-            logger.error("FFmpeg timeout ao extrair áudio")
-            return None
         except Exception as e:
             logger.error(f"❌ Erro ao transcrever áudio: {str(e)}")
-            # Limpar arquivo se existir
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
             return None
 
-    async def _analyze_frames(self, video_path: str) -> Optional[str]:
-        """Extrai frames-chave e analisa com GPT-4 Vision"""
+    async def _analyze_frames(self, frame_paths: List[str]) -> Optional[str]:
+        """Analisa frames-chave extraídos com GPT-4 Vision"""
         try:
-            logger.info("🖼️ Extraindo e analisando frames...")
-
-            # Diretório temporário para frames
-            frames_dir = os.path.join(os.path.dirname(video_path), "temp_frames")
-            os.makedirs(frames_dir, exist_ok=True)
-
-            # Extrair 4 frames igualmente espaçados (início, 1/3, 2/3, fim)
-            # fps=1/X significa: capturar 1 frame a cada X segundos
-            # select='eq(n,0)+eq(n,floor(N/3))+eq(n,floor(2*N/3))+eq(n,N-1)' = 4 frames
-
-            # Primeiro, pegamos duração do vídeo
-            duration_cmd = [
-                "ffprobe", "-v", "error",
-                "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1",
-                video_path
-            ]
-            duration_result = subprocess.run(duration_cmd, capture_output=True, text=True, timeout=10)
-            duration = float(duration_result.stdout.strip())
-
-            # Extrair 4 frames em tempos específicos
-            frame_times = [
-                0,  # Início
-                duration * 0.33,  # 1/3
-                duration * 0.66,  # 2/3
-                max(0, duration - 1)  # Final (1s antes do fim)
-            ]
-
-            frame_paths = []
-            for i, time_sec in enumerate(frame_times):
-                frame_path = os.path.join(frames_dir, f"frame_{i}.jpg")
-                ffmpeg_cmd = [
-                    "ffmpeg", "-ss", str(time_sec),
-                    "-i", video_path,
-                    "-vframes", "1",
-                    "-q:v", "2",  # Alta qualidade
-                    "-y",
-                    frame_path
-                ]
-                subprocess.run(ffmpeg_cmd, capture_output=True, timeout=30)
-
-                if os.path.exists(frame_path):
-                    frame_paths.append(frame_path)
-
-            if not frame_paths:
-                logger.warning("Nenhum frame extraído")
-                return None
+            logger.info(f"🖼️ Analisando {len(frame_paths)} frames...")
 
             # Converter frames para base64
             frame_images = []
@@ -253,21 +231,11 @@ If you detect CGI/FOOH, EXPLICITLY mention it."""
 
             visual_analysis = response.choices[0].message.content
 
-            # Limpar frames temporários
-            for frame_path in frame_paths:
-                os.remove(frame_path)
-            os.rmdir(frames_dir)
-
             logger.info(f"✅ Análise visual concluída: {len(visual_analysis)} chars")
             return visual_analysis
 
         except Exception as e:
             logger.error(f"❌ Erro ao analisar frames: {str(e)}")
-            # Limpar frames se existirem
-            if os.path.exists(frames_dir):
-                for f in os.listdir(frames_dir):
-                    os.remove(os.path.join(frames_dir, f))
-                os.rmdir(frames_dir)
             return None
 
     def is_available(self) -> bool:
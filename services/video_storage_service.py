@@ -3,18 +3,24 @@ Serviço para download e upload de vídeos para Supabase Storage
 
 Fluxo:
 1. Baixa vídeo do Instagram/TikTok/YouTube usando URL do Apify
-2. Upload para Supabase Storage (bucket: user-videos)
+2. Upload para Supabase Storage (bucket: user-videos, blobs/{sha256}.mp4
+   deduplicado entre usuários - ver blob_storage_service)
+   Sem etapa local depois (ffmpeg/análise)? stream_upload_video faz 1+2
+   em streaming, sem arquivo temporário
 3. Gera URL pública/signed (1 ano de validade)
-4. Deleta arquivo temporário local
+4. Deleta arquivo temporário local (diretório do job no temp_storage)
 """
 import os
 import logging
-import tempfile
-import httpx
 from pathlib import Path
 from typing import Optional, Tuple
 from supabase import create_client, Client
 
+from services.blob_storage_service import blob_storage_service
+from services.download_service import download_service
+from services.executor_service import run_blocking
+from services.temp_storage import temp_storage
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,130 +40,158 @@ class VideoStorageService:
         self,
         video_url: str,
         user_id: str,
-        bookmark_id: str
-    ) -> Optional[Tuple[str, str]]:
+        bookmark_id: str,
+        url_key: Optional[str] = None,
+        keep_local: bool = True
+    ) -> Optional[Tuple[str, Optional[str]]]:
         """
         Baixa vídeo e faz upload para Supabase Storage
 
         Args:
             video_url: URL direta do vídeo (do Apify)
-            user_id: ID do usuário (para path no storage)
-            bookmark_id: ID do bookmark (para nome do arquivo)
+            user_id: ID do usuário (remove cópia legada por usuário)
+            bookmark_id: ID do bookmark (recebe a referência do blob)
+            url_key: Chave canônica da URL (registrada no blob)
+            keep_local: False = streaming direto para o storage, sem arquivo
+                        temporário (quando nada depois precisa do arquivo)
 
         Returns:
             Tuple[cloud_url, local_path] ou None se falhar
             - cloud_url: URL assinada do vídeo no Supabase (1 ano validade)
-            - local_path: Path temporário local (para Gemini usar)
+            - local_path: Path temporário local (para Gemini usar) ou None
+              se keep_local=False
+        """
+        if not keep_local:
+            cloud_url = await self.stream_upload_video(video_url, user_id, bookmark_id, url_key=url_key)
+            return (cloud_url, None) if cloud_url else None
+
+        temp_path = await self.download_video(video_url)
+        if not temp_path:
+            return None
+
+        cloud_url = await self.upload_video_file(temp_path, user_id, bookmark_id, url_key=url_key)
+        if not cloud_url:
+            self.cleanup_temp_file(temp_path)
+            return None
+
+        # Retornar URL da cloud + path temporário local
+        return (cloud_url, temp_path)
+
+    async def download_video(self, video_url: str) -> Optional[str]:
         """
-        temp_file = None
+        Baixa vídeo para arquivo temporário local
+
+        Separado do upload para o pipeline poder rodar upload e análise
+        do arquivo local em paralelo. O arquivo fica num job do temp_storage
+        (espaço reservado antes do download) - liberar com cleanup_temp_file.
+
+        Returns:
+            Path do arquivo temporário ou None se falhar
+        """
+        job = None
 
         try:
-            # 1. Criar arquivo temporário
+            # 1. Reservar espaço e criar diretório do job
+            job = await temp_storage.ajob("video")
+            temp_path = job.file("video.mp4")
             logger.info(f"📥 Baixando vídeo de: {video_url[:50]}...")
 
-            temp_file = tempfile.NamedTemporaryFile(
-                delete=False,
-                suffix='.mp4',
-                dir='/tmp'
-            )
-            temp_path = temp_file.name
-            temp_file.close()
-
-            # 2. Baixar vídeo (com retry para conexões instáveis)
-            max_retries = 3
-            retry_count = 0
-            total_size = 0
-
-            while retry_count < max_retries:
-                try:
-                    async with httpx.AsyncClient(
-                        timeout=httpx.Timeout(300.0, connect=60.0),  # 5min total, 60s connect
-                        limits=httpx.Limits(max_keepalive_connections=5, max_connections=10),
-                        follow_redirects=True
-                    ) as client:
-                        async with client.stream('GET', video_url) as response:
-                            response.raise_for_status()
-
-                            total_size = 0
-                            with open(temp_path, 'wb') as f:
-                                async for chunk in response.aiter_bytes(chunk_size=65536):  # 64KB chunks (maior = mais rápido)
-                                    f.write(chunk)
-                                    total_size += len(chunk)
-
-                    # Se chegou aqui, download completo
-                    break
-
-                except (httpx.RemoteProtocolError, httpx.ReadTimeout, httpx.ConnectTimeout) as e:
-                    retry_count += 1
-                    if retry_count >= max_retries:
-                        logger.error(f"❌ Falha após {max_retries} tentativas: {str(e)}")
-                        raise
-
-                    import asyncio
-                    wait_time = 2 ** retry_count  # Backoff exponencial: 2s, 4s, 8s
-                    logger.warning(f"⚠️ Erro no download (tentativa {retry_count}/{max_retries}), aguardando {wait_time}s...")
-                    await asyncio.sleep(wait_time)
+            # 2. Baixar vídeo (downloader compartilhado: retomada via Range)
+            total_size = await run_blocking("download", download_service.download_to_file, video_url, temp_path)
 
             file_size_mb = total_size / (1024 * 1024)
             logger.info(f"✅ Vídeo baixado: {file_size_mb:.2f} MB")
 
-            # 3. Upload para Supabase Storage
-            logger.info(f"☁️ Fazendo upload para Supabase Storage...")
+            return temp_path
 
-            # Path no storage: {user_id}/{bookmark_id}.mp4
-            storage_path = f"{user_id}/{bookmark_id}.mp4"
+        except Exception as e:
+            logger.error(f"❌ Erro ao baixar vídeo: {str(e)}", exc_info=True)
 
-            with open(temp_path, 'rb') as f:
-                video_data = f.read()
+            # Limpar diretório do job se erro
+            if job:
+                job.cleanup()
 
-            # Upload
-            upload_response = self.supabase.storage.from_(self.bucket_name).upload(
-                path=storage_path,
-                file=video_data,
-                file_options={"content-type": "video/mp4"}
-            )
+            return None
+
+    async def upload_video_file(
+        self,
+        local_path: str,
+        user_id: str,
+        bookmark_id: str,
+        url_key: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Guarda arquivo local no storage deduplicado (blobs/{sha256}.mp4)
+
+        Se outro bookmark já tem o mesmo conteúdo, só cria a referência.
 
-            logger.info(f"✅ Upload concluído: {storage_path}")
+        Returns:
+            URL assinada (1 ano de validade) ou None se falhar
+        """
+        try:
+            logger.info(f"☁️ Fazendo upload para Supabase Storage...")
 
-            # 4. Gerar URL assinada (1 ano de validade)
-            signed_url_response = self.supabase.storage.from_(self.bucket_name).create_signed_url(
-                path=storage_path,
-                expires_in=31536000  # 1 ano em segundos
+            blob = await run_blocking(
+                "storage",
+                blob_storage_service.store_file,
+                local_path,
+                bookmark_id,
+                url_key=url_key,
+                user_id=user_id
             )
 
-            cloud_url = signed_url_response.get('signedURL')
+            logger.info(f"✅ URL assinada gerada: {blob['cloud_url'][:50]}...")
+            return blob["cloud_url"]
 
-            if not cloud_url:
-                logger.error("❌ Erro ao gerar URL assinada")
-                return None
+        except Exception as e:
+            logger.error(f"❌ Erro no upload do vídeo: {str(e)}", exc_info=True)
+            return None
 
-            logger.info(f"✅ URL assinada gerada: {cloud_url[:50]}...")
+    async def stream_upload_video(
+        self,
+        video_url: str,
+        user_id: str,
+        bookmark_id: str,
+        url_key: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Download → upload em streaming (TUS), sem arquivo local
 
-            # Retornar URL da cloud + path temporário local
-            return (cloud_url, temp_path)
+        Memória por transferência limitada a ~1 chunk (6MB), em vez do
+        vídeo inteiro em /tmp.
 
-        except Exception as e:
-            logger.error(f"❌ Erro ao baixar/upload vídeo: {str(e)}", exc_info=True)
+        Returns:
+            URL assinada (1 ano de validade) ou None se falhar
+        """
+        try:
+            logger.info(f"📡 Streaming do vídeo para Supabase Storage: {video_url[:50]}...")
+
+            blob = await run_blocking(
+                "storage",
+                blob_storage_service.store_from_url,
+                video_url,
+                bookmark_id,
+                url_key=url_key,
+                user_id=user_id
+            )
 
-            # Limpar arquivo temporário se erro
-            if temp_file and os.path.exists(temp_file.name):
-                try:
-                    os.unlink(temp_file.name)
-                except:
-                    pass
+            logger.info(f"✅ URL assinada gerada: {blob['cloud_url'][:50]}...")
+            return blob["cloud_url"]
 
+        except Exception as e:
+            logger.error(f"❌ Erro no streaming do vídeo: {str(e)}", exc_info=True)
             return None
 
     def cleanup_temp_file(self, temp_path: str):
         """
-        Deleta arquivo temporário
+        Deleta arquivo temporário (e o diretório do job que o contém)
 
         Args:
             temp_path: Path do arquivo temporário
         """
         try:
             if temp_path and os.path.exists(temp_path):
-                os.unlink(temp_path)
+                temp_storage.release_path(temp_path)
                 logger.info(f"🗑️ Arquivo temporário deletado: {temp_path}")
         except Exception as e:
             logger.warning(f"⚠️ Erro ao deletar arquivo temporário: {str(e)}")
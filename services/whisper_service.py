@@ -6,6 +6,8 @@ import replicate
 from typing import Optional
 import logging
 
+from services.executor_service import run_blocking
+
 logger = logging.getLogger(__name__)
 
 class WhisperService:
@@ -17,6 +19,30 @@ class WhisperService:
         else:
             self.client = replicate.Client(api_token=api_token)
 
+    def _run_whisper(self, audio_file_path: str, language: str):
+        """Chamada bloqueante ao Replicate (roda no pool 'replicate')"""
+        # Abrir arquivo de áudio
+        with open(audio_file_path, "rb") as audio_file:
+            # Usar modelo Whisper no Replicate
+            # https://replicate.com/openai/whisper
+            return self.client.run(
+                "openai/whisper:4d50797290df275329f202e48c76360b3f22b08d28c196cbc54600319435f8d2",
+                input={
+                    "audio": audio_file,
+                    "model": "large-v3",
+                    "language": language,
+                    "translate": False,
+                    "temperature": 0,
+                    "transcription": "plain text",
+                    "suppress_tokens": "-1",
+                    "logprob_threshold": -1.0,
+                    "no_speech_threshold": 0.6,
+                    "condition_on_previous_text": True,
+                    "compression_ratio_threshold": 2.4,
+                    "temperature_increment_on_fallback": 0.2
+                }
+            )
+
     async def transcribe_audio(self, audio_file_path: str, language: str = "pt") -> Optional[str]:
         """
         Transcreve áudio para texto usando Whisper via Replicate
@@ -35,27 +61,7 @@ class WhisperService:
         try:
             logger.info(f"🎤 Transcrevendo áudio via Replicate: {audio_file_path}")
 
-            # Abrir arquivo de áudio
-            with open(audio_file_path, "rb") as audio_file:
-                # Usar modelo Whisper no Replicate
-                # https://replicate.com/openai/whisper
-                output = self.client.run(
-                    "openai/whisper:4d50797290df275329f202e48c76360b3f22b08d28c196cbc54600319435f8d2",
-                    input={
-                        "audio": audio_file,
-                        "model": "large-v3",
-                        "language": language,
-                        "translate": False,
-                        "temperature": 0,
-                        "transcription": "plain text",
-                        "suppress_tokens": "-1",
-                        "logprob_threshold": -1.0,
-                        "no_speech_threshold": 0.6,
-                        "condition_on_previous_text": True,
-                        "compression_ratio_threshold": 2.4,
-                        "temperature_increment_on_fallback": 0.2
-                    }
-                )
+            output = await run_blocking("replicate", self._run_whisper, audio_file_path, language)
 
             # Output pode ser dict com 'transcription' ou string direta
             if isinstance(output, dict):
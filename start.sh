@@ -5,12 +5,12 @@
 
 echo "🚀 Iniciando todos os serviços..."
 
-# FORÇAR concurrency=2 (alguma env var oculta do Render seta 4)
-export CELERYD_CONCURRENCY=2
+# FORÇAR concurrency (padrão 2; alguma env var oculta do Render seta 4)
+export CELERYD_CONCURRENCY=${CELERY_WORKER_CONCURRENCY:-2}
 
 # Iniciar Celery Worker em background
-# Concurrency controlado via CELERYD_CONCURRENCY=2
-echo "⚙️ Iniciando Celery Worker (CELERYD_CONCURRENCY=2)..."
+# Concurrency controlado via CELERYD_CONCURRENCY
+echo "⚙️ Iniciando Celery Worker (CELERYD_CONCURRENCY=$CELERYD_CONCURRENCY)..."
 celery -A celery_app worker --loglevel=info &
 
 # Iniciar Celery Beat em background (cron jobs)
@@ -4,6 +4,7 @@ Tasks assíncronas processadas pelos workers
 """
 from celery_app import celery_app
 from celery import chain, group
+from celery.signals import worker_process_init, worker_process_shutdown
 from typing import Optional, List, Dict
 import logging
 import os
@@ -22,6 +23,14 @@ from services.gemini_service import gemini_service
 from services.claude_service import claude_service
 from services.thumbnail_service import ThumbnailService
 from services.embedding_service import embedding_service
+from services.embedding_batcher import EmbeddingBatcher
+from services.vector_index_service import vector_index_service
+from services.neighbor_graph_service import neighbor_graph_service
+from services.rate_limiter import rate_limiter
+from services.url_canonicalizer import canonical_key
+from services.blob_storage_service import blob_storage_service, blob_url_key, GC_BATCH_SIZE as BLOB_GC_BATCH_SIZE
+from services.http_client_pool import http_client_pool
+from services.temp_storage import temp_storage
 from supabase import create_client, Client
 
 logger = logging.getLogger(__name__)
@@ -70,6 +79,17 @@ supabase_client: Client = create_client(supabase_url, supabase_key) if supabase_
 thumbnail_service = ThumbnailService(supabase_client) if supabase_client else None
 
 
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Cada processo do pool abre seus próprios clientes HTTP (conexões não sobrevivem ao fork)"""
+    http_client_pool.reset()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    http_client_pool.close()
+
+
 # ============================================================================
 # TASK PRINCIPAL: Processar bookmark completo
 # ============================================================================
@@ -83,7 +103,8 @@ def process_bookmark_complete_task(
     extract_metadata: bool = True,
     analyze_video: bool = True,
     process_ai: bool = True,
-    upload_to_cloud: bool = False
+    upload_to_cloud: bool = False,
+    user_context: Optional[str] = None
 ):
     """
     Task principal que orquestra TODO o processamento de um bookmark.
@@ -103,6 +124,7 @@ def process_bookmark_complete_task(
         analyze_video: Analisar vídeo com Gemini 2.5 Flash (áudio + visual)
         process_ai: Processar com Gemini 3.0 Pro (tags/categorias)
         upload_to_cloud: Fazer upload do vídeo pra Supabase Storage
+        user_context: Contexto do usuário (peso 40% na IA) - propagado pela chain
 
     Returns:
         dict: Resultado final do processamento
@@ -123,7 +145,7 @@ def process_bookmark_complete_task(
         # 1. Extração de metadados (sempre roda primeiro)
         if extract_metadata:
             # Primeira task: passa parâmetros explícitos
-            workflow = extract_metadata_task.s(bookmark_id, url, user_id)
+            workflow = extract_metadata_task.s(bookmark_id, url, user_id, user_context)
 
             # 2. Upload pra cloud (ANTES da análise - URLs do Instagram expiram rápido!)
             if upload_to_cloud:
@@ -192,11 +214,11 @@ def process_bookmark_complete_task(
 # ============================================================================
 
 @celery_app.task(bind=True, name="tasks.extract_metadata_task", max_retries=3)
-def extract_metadata_task(self, bookmark_id: str, url: str, user_id: str):
+def extract_metadata_task(self, bookmark_id: str, url: str, user_id: str, user_context: Optional[str] = None):
     """
     FASE 3.1: Extrair metadados com Apify
     - Scraping YouTube/Instagram/TikTok
-    - Upload de thumbnail pra Supabase Storage
+    - Upload de thumbnail pra Supabase Storage (task paralela, não bloqueia a chain)
     - Salvar metadados no database
     """
     timer = TaskTimer("METADATA", bookmark_id)
@@ -212,28 +234,10 @@ def extract_metadata_task(self, bookmark_id: str, url: str, user_id: str):
             raise Exception("Apify retornou None - falha na extração de metadados")
 
         # 2. Upload de thumbnail pra Supabase Storage
-        cloud_thumbnail_url = None
+        # Branch independente do resto da chain: roda em paralelo (outra task)
+        # em vez de atrasar download/análise
         if metadata.thumbnail_url and thumbnail_service:
-            try:
-                logger.info(f"📸 [TASKS.PY] Chamando ThumbnailService.upload_thumbnail()")
-                logger.info(f"   - thumbnail_url (Instagram CDN): {metadata.thumbnail_url[:80]}...")
-                logger.info(f"   - user_id: {user_id}")
-                logger.info(f"   - bookmark_id: {bookmark_id}")
-
-                cloud_thumbnail_url = loop.run_until_complete(
-                    thumbnail_service.upload_thumbnail(
-                        metadata.thumbnail_url,
-                        user_id,
-                        bookmark_id
-                    )
-                )
-
-                if cloud_thumbnail_url:
-                    logger.info(f"✅ [TASKS.PY] Upload OK → cloud_thumbnail_url: {cloud_thumbnail_url[:80]}...")
-                else:
-                    logger.warning(f"⚠️ [TASKS.PY] Upload retornou None")
-            except Exception as e:
-                logger.warning(f"⚠️ Thumbnail upload falhou (não crítico): {str(e)[:50]}")
+            upload_thumbnail_task.delay(metadata.thumbnail_url, bookmark_id, user_id)
 
         # 3. Salvar metadados no Supabase
         metadata_dict = metadata.dict()
@@ -242,7 +246,6 @@ def extract_metadata_task(self, bookmark_id: str, url: str, user_id: str):
         logger.info(f"🔍 [TASKS.PY] ANTES DE SALVAR:")
         logger.info(f"   metadata.thumbnail_url (objeto): {metadata.thumbnail_url[:80] if metadata.thumbnail_url else 'NULL'}...")
         logger.info(f"   metadata.dict()['thumbnail_url']: {metadata_dict.get('thumbnail_url', 'NULL')[:80] if metadata_dict.get('thumbnail_url') else 'NULL'}...")
-        logger.info(f"   cloud_thumbnail_url: {cloud_thumbnail_url[:80] if cloud_thumbnail_url else 'NULL'}...")
 
         update_data = {
             'title': metadata.title,
@@ -250,12 +253,9 @@ def extract_metadata_task(self, bookmark_id: str, url: str, user_id: str):
             'platform': metadata.platform.value if hasattr(metadata.platform, 'value') else str(metadata.platform),
             'thumbnail_url': metadata.thumbnail_url,
             'metadata': metadata_dict,  # JSON completo (Pydantic v1)
+            'url_key': canonical_key(url),  # Reuso de metadados entre usuários
         }
 
-        # Adicionar cloud_thumbnail_url se disponível
-        if cloud_thumbnail_url:
-            update_data['cloud_thumbnail_url'] = cloud_thumbnail_url
-
         # Adicionar published_at se disponível
         if metadata.published_at:
             update_data['published_at'] = metadata.published_at
@@ -270,7 +270,7 @@ def extract_metadata_task(self, bookmark_id: str, url: str, user_id: str):
         # Log consolidado de sucesso
         timer.success(
             Título=metadata.title[:30] if metadata.title else "N/A",
-            Thumb="✓" if cloud_thumbnail_url else "✗",
+            Thumb="async" if metadata.thumbnail_url else "✗",
             Platform=update_data['platform']
         )
 
@@ -290,8 +290,8 @@ def extract_metadata_task(self, bookmark_id: str, url: str, user_id: str):
                     "author": c.author
                 } for c in (metadata.comments or [])[:200]  # Top 200 comments
             ],
-            "cloud_thumbnail_url": cloud_thumbnail_url,
-            "platform": update_data['platform']
+            "platform": update_data['platform'],
+            "user_context": user_context or ""
         }
 
     except Exception as e:
@@ -308,6 +308,42 @@ def extract_metadata_task(self, bookmark_id: str, url: str, user_id: str):
         raise
 
 
+@celery_app.task(bind=True, name="tasks.upload_thumbnail_task", max_retries=2, time_limit=120)
+def upload_thumbnail_task(self, thumbnail_url: str, bookmark_id: str, user_id: str):
+    """
+    Upload de thumbnail pra Supabase Storage (branch paralela do pipeline)
+    - Disparada pela extract_metadata_task, não bloqueia a chain
+    - Salva cloud_thumbnail_url direto no bookmark
+    """
+    timer = TaskTimer("THUMBNAIL", bookmark_id)
+    timer.start()
+
+    try:
+        loop = asyncio.get_event_loop()
+        cloud_thumbnail_url = loop.run_until_complete(
+            thumbnail_service.upload_thumbnail(thumbnail_url, user_id, bookmark_id)
+        )
+
+        if not cloud_thumbnail_url:
+            raise Exception("ThumbnailService retornou None")
+
+        supabase_client.table('bookmarks').update({
+            'cloud_thumbnail_url': cloud_thumbnail_url
+        }).eq('id', bookmark_id).execute()
+
+        timer.success(URL=cloud_thumbnail_url[:40])
+        return {"bookmark_id": bookmark_id, "cloud_thumbnail_url": cloud_thumbnail_url}
+
+    except Exception as e:
+        timer.error(f"Thumbnail: {str(e)[:60]}")
+
+        if "timeout" in str(e).lower() or "connection" in str(e).lower():
+            raise self.retry(exc=e, countdown=15)
+
+        # Não crítico - auto-sync / extract_missing_thumbnails cobrem depois
+        return {"bookmark_id": bookmark_id, "cloud_thumbnail_url": None, "error": str(e)[:100]}
+
+
 @celery_app.task(bind=True, name="tasks.analyze_video_gemini_task", max_retries=2, time_limit=600)
 def analyze_video_gemini_task(self, previous_result: dict, bookmark_id: str, url: str):
     """
@@ -363,7 +399,7 @@ def analyze_video_gemini_task(self, previous_result: dict, bookmark_id: str, url
         # 2. Analisar vídeo com Gemini Flash 2.5
         loop = asyncio.get_event_loop()
         gemini_analysis = loop.run_until_complete(
-            gemini_service.analyze_video(video_url_for_analysis, user_context)
+            gemini_service.analyze_video(video_url_for_analysis, user_context, url_key=canonical_key(url))
         )
 
         if not gemini_analysis:
@@ -566,90 +602,71 @@ def process_claude_task(self, previous_result: dict, bookmark_id: str, user_id:
 def upload_to_cloud_task(self, previous_result: dict, bookmark_id: str, user_id: str):
     """
     FASE 3.4: Upload de vídeo pra Supabase Storage
-    - Baixa vídeo via Apify
-    - Upload do vídeo pra Supabase Storage
+    - Reaproveita blob já enviado para o mesmo conteúdo (sem download)
+    - Senão extrai URL via Apify e faz download → upload em streaming para
+      blobs/{sha256}.mp4 (sem arquivo temporário)
     - Gerar Signed URL
     - Atualizar database
     """
     logger.info(f"☁️ Upload pra cloud - Bookmark: {bookmark_id}")
 
-    temp_video_path = None
-
     try:
         url = previous_result.get('url')
         if not url:
             raise Exception("URL não disponível para upload de vídeo")
 
-        # 1. Baixar vídeo via Apify
-        logger.info("⬇️ Baixando vídeo via Apify...")
-
-        loop = asyncio.get_event_loop()
-        from models import Platform
-        platform = apify_service.detect_platform(url)
-
-        # Extrair URL direta
-        if platform == Platform.YOUTUBE:
-            video_data = loop.run_until_complete(
-                apify_service.extract_video_download_url_youtube(url, quality="720p")
-            )
-        elif platform == Platform.INSTAGRAM:
-            video_data = loop.run_until_complete(
-                apify_service.extract_video_download_url_instagram(url, quality="720p")
-            )
-        elif platform == Platform.TIKTOK:
-            video_data = loop.run_until_complete(
-                apify_service.extract_video_download_url_tiktok(url, quality="720p")
-            )
-        else:
-            raise Exception(f"Plataforma não suportada: {platform}")
+        url_key = canonical_key(url)
+        quality = "720p"
 
-        if not video_data or not video_data.get('download_url'):
-            raise Exception("Falha ao extrair URL do vídeo")
+        # 0. Mesmo vídeo já está no storage (outro usuário/bookmark)?
+        blob = blob_storage_service.attach_by_url_key(bookmark_id, url_key, quality, user_id=user_id)
 
-        download_url = video_data['download_url']
-        logger.info(f"✅ URL obtida: {download_url[:80]}...")
+        if blob is None:
+            # 1. Extrair URL direta via Apify
+            logger.info("⬇️ Extraindo URL do vídeo via Apify...")
 
-        # 2. Baixar vídeo para arquivo temporário
-        import httpx
-        logger.info("⬇️ Baixando vídeo...")
-
-        temp_video_path = f"/tmp/{bookmark_id}.mp4"
-        with httpx.stream("GET", download_url, timeout=180.0, follow_redirects=True) as response:
-            response.raise_for_status()
-            with open(temp_video_path, "wb") as f:
-                for chunk in response.iter_bytes(chunk_size=8192):
-                    f.write(chunk)
-
-        file_size_bytes = os.path.getsize(temp_video_path)
-        file_size_mb = file_size_bytes / (1024 * 1024)
-        logger.info(f"✅ Vídeo baixado: {file_size_mb:.2f}MB")
+            loop = asyncio.get_event_loop()
+            from models import Platform
+            platform = apify_service.detect_platform(url)
 
-        # 3. Upload para Supabase Storage
-        logger.info("☁️ Fazendo upload para Supabase Storage...")
+            # Extrair URL direta
+            if platform == Platform.YOUTUBE:
+                video_data = loop.run_until_complete(
+                    apify_service.extract_video_download_url_youtube(url, quality=quality)
+                )
+            elif platform == Platform.INSTAGRAM:
+                video_data = loop.run_until_complete(
+                    apify_service.extract_video_download_url_instagram(url, quality=quality)
+                )
+            elif platform == Platform.TIKTOK:
+                video_data = loop.run_until_complete(
+                    apify_service.extract_video_download_url_tiktok(url, quality=quality)
+                )
+            else:
+                raise Exception(f"Plataforma não suportada: {platform}")
 
-        cloud_path = f"{user_id}/{bookmark_id}.mp4"
-        with open(temp_video_path, "rb") as video_file:
-            supabase_client.storage.from_("user-videos").upload(
-                path=cloud_path,
-                file=video_file,
-                file_options={"content-type": "video/mp4", "upsert": "true"}
-            )
+            if not video_data or not video_data.get('download_url'):
+                raise Exception("Falha ao extrair URL do vídeo")
 
-        logger.info(f"✅ Upload concluído: {cloud_path}")
+            download_url = video_data['download_url']
+            logger.info(f"✅ URL obtida: {download_url[:80]}...")
 
-        # 4. Gerar Signed URL (válida por 1 ano)
-        signed_url_data = supabase_client.storage.from_("user-videos").create_signed_url(
-            path=cloud_path,
-            expires_in=31536000  # 1 ano
-        )
+            # 2. Download → upload em streaming (blobs/{sha256}.mp4), sem arquivo
+            #    temporário: memória limitada a ~1 chunk TUS por transferência
+            logger.info("📡 Streaming do vídeo para Supabase Storage...")
 
-        cloud_url = signed_url_data.get("signedURL") if signed_url_data else None
-        if not cloud_url:
-            raise Exception("Falha ao gerar Signed URL")
+            # Transferência no limite "storage"; RPCs curtas pegam "supabase" lá dentro
+            with rate_limiter.limit_sync("storage"):
+                blob = blob_storage_service.store_from_url(
+                    download_url, bookmark_id, url_key=blob_url_key(url_key, quality), user_id=user_id
+                )
 
+        file_size_bytes = blob["size_bytes"] or 0
+        file_size_mb = file_size_bytes / (1024 * 1024)
+        cloud_url = blob["cloud_url"]
         logger.info(f"✅ Signed URL gerada: {cloud_url[:80]}...")
 
-        # 5. Atualizar database
+        # 3. Atualizar database
         logger.info("💾 Atualizando Supabase com cloud URL...")
 
         supabase_client.table('bookmarks').update({
@@ -684,15 +701,6 @@ def upload_to_cloud_task(self, previous_result: dict, bookmark_id: str, user_id:
 
         raise
 
-    finally:
-        # Cleanup: deletar vídeo temporário
-        if temp_video_path and os.path.exists(temp_video_path):
-            try:
-                os.unlink(temp_video_path)
-                logger.info(f"🗑️ Vídeo temporário deletado: {temp_video_path}")
-            except:
-                pass
-
 
 @celery_app.task(bind=True, name="tasks.generate_embedding_task", max_retries=2, time_limit=60)
 def generate_embedding_task(self, previous_result: dict, bookmark_id: str, user_id: str):
@@ -731,6 +739,12 @@ def generate_embedding_task(self, previous_result: dict, bookmark_id: str, user_
             'embedding': embedding
         }).eq('id', bookmark_id).execute()
 
+        # Atualiza índices vetoriais em memória dos processos web (incremental)
+        vector_index_service.publish_update(user_id, bookmark_id, embedding)
+
+        # Recalcula vizinhos pré-computados (/api/find-similar) fora do pipeline
+        update_bookmark_neighbors_task.delay(bookmark_id, user_id)
+
         # Log consolidado de sucesso
         timer.success(
             Dimensões=len(embedding),
@@ -761,6 +775,91 @@ def generate_embedding_task(self, previous_result: dict, bookmark_id: str, user_
         }
 
 
+@celery_app.task(bind=True, name="tasks.backfill_embeddings_task", time_limit=3600)
+def backfill_embeddings_task(self, limit: Optional[int] = None, user_id: Optional[str] = None):
+    """
+    Backfill de embeddings em lote
+    - Busca bookmarks com embedding NULL (opcionalmente de um usuário)
+    - Gera via API em lote do Gemini e grava com uma RPC por lote
+    - Propaga vetores novos para índices vetoriais e grafo de vizinhos
+    """
+    logger.info("🧮 Backfill de embeddings em lote")
+
+    def on_written(bookmark_id: str, owner_id: str, embedding: List[float]):
+        vector_index_service.publish_update(owner_id, bookmark_id, embedding)
+
+    batcher = EmbeddingBatcher(supabase_client, on_written=on_written)
+    stats = batcher.backfill(limit=limit, user_id=user_id)
+
+    # Grafo de vizinhos: rebuild por usuário sai mais barato que N updates incrementais
+    if stats["written"]:
+        rebuild_neighbor_graph_task.delay(user_id)
+
+    logger.info(
+        f"🎉 Backfill concluído: {stats['written']} gravados, "
+        f"{stats['failed']} falhas, {stats['batches']} lotes"
+    )
+
+    return {
+        "success": stats["failed"] == 0,
+        **stats
+    }
+
+
+@celery_app.task(bind=True, name="tasks.update_bookmark_neighbors_task", max_retries=2, time_limit=120)
+def update_bookmark_neighbors_task(self, bookmark_id: str, user_id: str):
+    """
+    Atualiza grafo de vizinhos após embedding novo
+    - Recalcula top-K do bookmark
+    - Insere o bookmark nas listas dos vizinhos onde ele entra no top-K
+    """
+    timer = TaskTimer("NEIGHBORS", bookmark_id)
+    timer.start()
+
+    try:
+        rows_written = neighbor_graph_service.update_for_bookmark(bookmark_id, user_id)
+        timer.success(Listas=rows_written)
+        return {"bookmark_id": bookmark_id, "rows_written": rows_written}
+
+    except Exception as e:
+        timer.error(f"Neighbors: {str(e)[:60]}")
+
+        if "timeout" in str(e).lower() or "connection" in str(e).lower():
+            raise self.retry(exc=e, countdown=30)
+
+        # Não crítico - rebuild diário corrige
+        return {"bookmark_id": bookmark_id, "rows_written": 0, "error": str(e)[:100]}
+
+
+@celery_app.task(bind=True, name="tasks.rebuild_neighbor_graph_task", time_limit=3600)
+def rebuild_neighbor_graph_task(self, user_id: Optional[str] = None):
+    """
+    Rebuild completo do grafo de vizinhos (cron diário ou sob demanda)
+    - user_id=None: reconstrói para todos os usuários com embeddings
+    """
+    logger.info("🕸️ Rebuild do grafo de vizinhos")
+
+    user_ids = [user_id] if user_id else neighbor_graph_service.list_users_with_embeddings()
+    rebuilt = 0
+    failed = 0
+
+    for uid in user_ids:
+        try:
+            rebuilt += neighbor_graph_service.rebuild_user(uid)
+        except Exception as e:
+            failed += 1
+            logger.error(f"❌ Erro no rebuild de vizinhos - user {uid[:8]}: {str(e)}")
+
+    logger.info(f"🎉 Rebuild concluído: {rebuilt} bookmarks, {len(user_ids)} usuários, {failed} falhas")
+
+    return {
+        "success": failed == 0,
+        "users": len(user_ids),
+        "bookmarks": rebuilt,
+        "failed_users": failed
+    }
+
+
 @celery_app.task(bind=True, name="tasks.cleanup_and_notify_task")
 def cleanup_and_notify_task(self, previous_result: dict, bookmark_id: str, user_id: str):
     """
@@ -881,7 +980,19 @@ def auto_sync_incomplete_bookmarks_task(self):
                 "message": "Nenhum bookmark incompleto encontrado"
             }
 
-        # 2. Processar em batches de 10 (evitar sobrecarga)
+        # 2. Pré-extrair metadados em lote (1 actor Apify por chunk de URLs)
+        # Preenche o cache Redis - extract_metadata_task de cada job vira cache hit
+        urls_without_metadata = [b['url'] for b in bookmarks if b.get('metadata') is None]
+        if urls_without_metadata:
+            try:
+                loop = asyncio.get_event_loop()
+                prefetched = loop.run_until_complete(apify_service.extract_metadata_batch(urls_without_metadata))
+                logger.info(f"📦 Metadados pré-extraídos em lote: {len(prefetched)}/{len(urls_without_metadata)}")
+            except Exception as e:
+                # Não crítico - cada job extrai individualmente
+                logger.warning(f"⚠️ Pré-extração em lote falhou: {str(e)}")
+
+        # 3. Processar em batches de 10 (evitar sobrecarga)
         batch_size = 10
         batches = [bookmarks[i:i + batch_size] for i in range(0, total, batch_size)]
         total_batches = len(batches)
@@ -960,16 +1071,46 @@ def auto_sync_incomplete_bookmarks_task(self):
 @celery_app.task(bind=True, name="tasks.cleanup_temp_files_task")
 def cleanup_temp_files_task(self):
     """
-    Cleanup de arquivos temporários (roda a cada 6 horas)
-    - Deleta vídeos temporários mais antigos que 24h
-    - Deleta thumbnails temporários
+    Cleanup de arquivos temporários (janitor do temp_storage)
+    - Apaga diretórios de jobs abandonados (> TEMP_STORAGE_MAX_AGE_HOURS)
+    - Apaga sobras antigas do formato legado em /tmp
+    - Aplica cota + idade nos vídeos transcodificados
     """
     logger.info("🧹 Cleanup de arquivos temporários")
 
-    # TODO: Implementar
+    result = temp_storage.sweep()
+    stats = temp_storage.stats()
+    logger.info(f"💾 Temporários: {stats['active_jobs']} job(s), {stats['used_mb']}MB usados / {stats['quota_mb']}MB, disco livre {stats['disk_free_mb']}MB")
+    return {
+        "success": True,
+        **result
+    }
+
+
+@celery_app.task(bind=True, name="tasks.gc_video_blobs_task", max_retries=0, time_limit=300)
+def gc_video_blobs_task(self):
+    """
+    GC do storage deduplicado (roda 1x por dia)
+    - Apaga blobs/{sha256}.mp4 sem nenhum bookmark referenciando há mais de
+      BLOB_GC_GRACE_HOURS (ref_count mantido por trigger no banco)
+    """
+    logger.info("🧹 GC de blobs de vídeo")
+
+    deleted = 0
+    try:
+        while True:
+            with rate_limiter.limit_sync("supabase"):
+                result = blob_storage_service.collect_garbage()
+            deleted += result["deleted"]
+            if result["deleted"] < BLOB_GC_BATCH_SIZE:
+                break
+    except Exception as e:
+        logger.error(f"❌ GC de blobs falhou: {str(e)}")
+        return {"success": False, "blobs_deleted": deleted, "error": str(e)}
+
     return {
         "success": True,
-        "files_deleted": 0
+        "blobs_deleted": deleted
     }
 
 